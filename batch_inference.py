@@ -0,0 +1,228 @@
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, Optional, Tuple
+
+from lazy_imports import lark
+
+if TYPE_CHECKING:
+    from openai import OpenAI
+    from openai.types.chat import ChatCompletion
+
+
+# 批量推理请求文件的默认路径（注意不是仓库根目录下的requests.jsonl）
+DEFAULT_BATCH_REQUEST_PATH = os.path.join(".cache", "batch_requests.jsonl")
+DEFAULT_BATCH_POLL_INTERVAL = 60.0
+# 兼容OpenAI Batch API的批量推理服务地址，与交互式的bots接口不同
+ARK_BATCH_BASE_URL = os.environ.get("ARK_BATCH_BASE_URL", "https://ark.cn-beijing.volces.com/api/v3")
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_COMPLETION_WINDOW = "24h"
+
+# 批量任务的终止状态
+BATCH_DONE_STATUSES = ("completed",)
+BATCH_FAILED_STATUSES = ("failed", "expired", "cancelled")
+
+
+def write_batch_requests(path: str, requests: Iterable[Tuple[str, Dict[str, Any]]]) -> int:
+    """把请求写成Batch API的JSONL输入文件
+
+    Args:
+        path (str): 输出文件路径
+        requests (Iterable[Tuple[str, Dict[str, Any]]]): [(custom_id, chat.completions请求体)]
+
+    Returns:
+        int: 写入的请求数
+    """
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for custom_id, body in requests:
+            line = {"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": body}
+            f.write(json.dumps(line, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+
+def read_batch_results(path: str) -> Dict[str, Optional[Dict[str, Any]]]:
+    """读取Batch API的JSONL输出文件
+
+    Returns:
+        Dict[str, Dict[str, Any]]: custom_id -> chat.completions响应体，失败的请求为None
+    """
+    results = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                lark.logger.warning(f"跳过损坏的批量结果行: {line[:100]}")
+                continue
+            response = entry.get("response") or {}
+            if entry.get("error") or response.get("status_code") != 200:
+                lark.logger.warning(f"批量请求{entry.get('custom_id')}失败: {entry.get('error') or response}")
+                results[entry.get("custom_id")] = None
+            else:
+                results[entry.get("custom_id")] = response.get("body")
+    return results
+
+
+def completion_from_body(body: Dict[str, Any]) -> "ChatCompletion":
+    """把批量结果中的响应体还原成与交互式调用相同的ChatCompletion对象"""
+    from openai.types.chat import ChatCompletion
+
+    return ChatCompletion.model_validate(body)
+
+
+class OpenAIBatchBackend:
+    """通过OpenAI兼容的Files + Batches接口提交批量推理任务
+
+    Args:
+        client (OpenAI): 指向批量推理服务的client
+        completion_window (str): 任务完成时限
+    """
+
+    def __init__(self, client: "OpenAI", completion_window: str = BATCH_COMPLETION_WINDOW):
+        self.client = client
+        self.completion_window = completion_window
+
+    def submit(self, request_path: str) -> str:
+        with open(request_path, "rb") as f:
+            input_file = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window=self.completion_window,
+        )
+        return batch.id
+
+    def poll(self, batch_id: str) -> str:
+        return self.client.batches.retrieve(batch_id).status
+
+    def download(self, batch_id: str, output_path: str) -> None:
+        batch = self.client.batches.retrieve(batch_id)
+        with open(output_path, "wb") as f:
+            if batch.output_file_id:
+                f.write(self.client.files.content(batch.output_file_id).content)
+            # 失败的请求单独放在error文件里，合并后统一按失败处理
+            if batch.error_file_id:
+                f.write(self.client.files.content(batch.error_file_id).content)
+
+
+class LocalBatchBackend:
+    """基于本地文件的批量推理替身，用于离线测试
+
+    每个任务一个目录：submit时复制输入文件并在后台线程中逐行调用responder，
+    结果按Batch API的输出格式写入output.jsonl，完成后把状态文件改为completed。
+
+    Args:
+        workdir (str): 任务目录的根目录
+        responder (Callable): responder(请求体) -> 响应体，通常是对交互式接口的调用
+        max_workers (int): 后台并发处理的请求数
+    """
+
+    def __init__(self, workdir: str, responder: Callable[[Dict[str, Any]], Dict[str, Any]], max_workers: int = 8):
+        self.workdir = workdir
+        self.responder = responder
+        self.max_workers = max_workers
+
+    def _path(self, batch_id: str, name: str) -> str:
+        return os.path.join(self.workdir, batch_id, name)
+
+    def _set_status(self, batch_id: str, status: str) -> None:
+        tmp_path = self._path(batch_id, "status.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(status)
+        os.replace(tmp_path, self._path(batch_id, "status"))
+
+    def _respond(self, line: str) -> Dict[str, Any]:
+        request = json.loads(line)
+        try:
+            body = self.responder(request["body"])
+            response, error = {"status_code": 200, "body": body}, None
+        except Exception as e:
+            response, error = None, {"code": type(e).__name__, "message": str(e)}
+        return {"id": uuid.uuid4().hex, "custom_id": request["custom_id"], "response": response, "error": error}
+
+    def _process(self, batch_id: str) -> None:
+        try:
+            with open(self._path(batch_id, "input.jsonl"), encoding="utf-8") as f:
+                lines = [line for line in f if line.strip()]
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                outputs = list(executor.map(self._respond, lines))
+            with open(self._path(batch_id, "output.jsonl"), "w", encoding="utf-8") as f:
+                for output in outputs:
+                    f.write(json.dumps(output, ensure_ascii=False) + "\n")
+            self._set_status(batch_id, "completed")
+        except Exception as e:
+            lark.logger.error(f"本地批量任务{batch_id}处理失败: {e}")
+            self._set_status(batch_id, "failed")
+
+    def submit(self, request_path: str) -> str:
+        batch_id = f"local-{uuid.uuid4().hex[:12]}"
+        os.makedirs(os.path.join(self.workdir, batch_id))
+        shutil.copyfile(request_path, self._path(batch_id, "input.jsonl"))
+        self._set_status(batch_id, "in_progress")
+        threading.Thread(target=self._process, args=(batch_id,), name=f"batch-{batch_id}", daemon=True).start()
+        return batch_id
+
+    def poll(self, batch_id: str) -> str:
+        with open(self._path(batch_id, "status"), encoding="utf-8") as f:
+            return f.read().strip()
+
+    def download(self, batch_id: str, output_path: str) -> None:
+        shutil.copyfile(self._path(batch_id, "output.jsonl"), output_path)
+
+
+def run_batch(
+    backend,
+    request_path: str,
+    poll_interval: float = DEFAULT_BATCH_POLL_INTERVAL,
+    timeout: Optional[float] = None,
+) -> Dict[str, Optional[Dict[str, Any]]]:
+    """提交请求文件、轮询直到任务结束，并读回结果
+
+    Args:
+        backend: OpenAIBatchBackend或LocalBatchBackend
+        request_path (str): write_batch_requests写出的请求文件
+        poll_interval (float): 轮询间隔（秒）
+        timeout (float): 最长等待时间（秒），None时等待到任务结束
+
+    Returns:
+        Dict[str, Dict[str, Any]]: custom_id -> 响应体；提交、任务本身或取回结果失败以及超时时返回空字典，
+        调用方据此回退为实时评分
+    """
+    try:
+        batch_id = backend.submit(request_path)
+    except Exception as e:
+        lark.logger.error(f"提交批量推理任务失败（{request_path}）: {type(e).__name__} - {e}")
+        return {}
+    lark.logger.info(f"批量推理任务已提交: {batch_id}（{request_path}）")
+    start = time.monotonic()
+    while True:
+        try:
+            status = backend.poll(batch_id)
+        except Exception as e:
+            lark.logger.warning(f"查询批量任务{batch_id}状态失败: {e}")
+            status = None
+        if status in BATCH_DONE_STATUSES:
+            output_path = os.path.splitext(request_path)[0] + ".output.jsonl"
+            try:
+                backend.download(batch_id, output_path)
+                results = read_batch_results(output_path)
+            except Exception as e:
+                lark.logger.error(f"取回批量推理任务{batch_id}的结果失败: {type(e).__name__} - {e}")
+                return {}
+            lark.logger.info(f"批量推理任务{batch_id}已完成，取回{len(results)}条结果")
+            return results
+        if status in BATCH_FAILED_STATUSES:
+            lark.logger.error(f"批量推理任务{batch_id}结束，状态为{status}")
+            return {}
+        if timeout is not None and time.monotonic() - start > timeout:
+            lark.logger.error(f"批量推理任务{batch_id}等待超过{timeout}秒，放弃等待")
+            return {}
+        time.sleep(poll_interval)
@@ -1,22 +1,70 @@
+import argparse
+import asyncio
+import functools
+import os
+import time
+from dataclasses import dataclass
 import threading
-import queue
-import json
-from importlib import reload
-from typing import Any, Dict, List
-
-import constants
-import utils
-
-reload(constants)
-reload(utils)
 import json
 import re
+import socket
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
 
-import lark_oapi as lark
-from lark_oapi.api.docs.v1 import *
-from openai import OpenAI
+from lazy_imports import lark
 
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI, OpenAI
 
+from batch_inference import (
+    ARK_BATCH_BASE_URL,
+    DEFAULT_BATCH_POLL_INTERVAL,
+    DEFAULT_BATCH_REQUEST_PATH,
+    LocalBatchBackend,
+    OpenAIBatchBackend,
+    completion_from_body,
+    run_batch,
+    write_batch_requests,
+)
+from concurrency import (
+    AdaptiveLimiter,
+    AsyncAdaptiveLimiter,
+    CircuitBreaker,
+    Hedger,
+    async_call_with_retry,
+    call_with_retry,
+)
+from doc_cache import DEFAULT_DOC_CACHE_PATH, FeishuDocCache, fetch_documents
+from journal import DEFAULT_JOURNAL_PATH, RunJournal
+from ledger import DEFAULT_LEDGER_PATH, PAPER_KEY, RECORD_ID_KEY, SeenLedger
+from metrics import (
+    LLM_TOKENS,
+    PAPERS_PRODUCED,
+    PAPERS_SKIPPED,
+    QUEUE_DEPTH,
+    RATINGS_BY_TIER,
+    RATING_PARSE_FAILURES,
+    REGISTRY,
+    start_metrics_server,
+)
+from pipeline import (
+    DEFAULT_QUEUE_CAPACITY,
+    DEFAULT_WRITE_CHUNK_SIZE,
+    DEFAULT_WRITE_FLUSH_INTERVAL,
+    AsyncPaperTaskQueue,
+    BitableStreamWriter,
+    PaperIndex,
+    PaperTaskQueue,
+    atake_tasks,
+    consumer_count_for_batches,
+    take_tasks,
+)
+from prefilter import PREFILTER_MODES, RelevancePrefilter
+from rating_cache import DEFAULT_RATING_CACHE_PATH, RatingCache, hash_documents
+from rescore import DEFAULT_SCORE_BAND, DEFAULT_SCORE_THRESHOLDS, select_for_rescore
+from work_queue import DEFAULT_LEASE_SECONDS, DEFAULT_WORK_QUEUE_PATH, SQLiteWorkQueue
 from constants import (
     APP_ID,
     APP_SECRET,
@@ -32,25 +80,368 @@ from constants import (
     SHEET_ID,
 )
 from utils import (
+    AccessTokenProvider,
+    PaperRecord,
     add_records_to_dowei,
     add_records_to_feishu_sheet,
-    get_access_token,
-    get_feishu_doc_content,
+    update_records_in_dowei,
     get_feishu_sheet_content,
+    get_batch_rating_prompt,
     get_rating_prompt,
+    get_triage_prompt,
+    get_arxiv_id,
     get_huggingface_daily_papers_arxiv_links,
+    get_huggingface_daily_papers_in_range,
     get_arxiv_paper_links,
-    get_feishu_sheet_content,
+    iterate_in_thread,
 )
 
-# 初始化一个全局client
-client = OpenAI(
-    base_url="https://ark.cn-beijing.volces.com/api/v3/bots",
-    api_key=ARK_API_KEY,
-)
+ARK_BOTS_BASE_URL = os.environ.get("ARK_BOTS_BASE_URL", "https://ark.cn-beijing.volces.com/api/v3/bots")
+# 两级评分中快速模型的bot/模型ID，为空时不启用两级评分
+DEFAULT_CASCADE_MODEL = os.environ.get("CASCADE_MODEL") or None
+
+# 线程模式下的消费者数量
+DEFAULT_CONSUMER_COUNT = 20
+# 分布式模式下coordinator取回结果、worker在队列暂时为空时的轮询间隔（秒）
+WORK_QUEUE_POLL_INTERVAL = 1.0
+# 异步模式下同时在途的评分请求数量
+DEFAULT_ASYNC_CONCURRENCY = 200
+# 自适应限流器的起始并发，之后根据429/延迟在[1, 并发上限]之间自动调整
+INITIAL_LLM_CONCURRENCY = 8
+# 单篇论文评分的最大尝试次数（限流/超时/5xx时重试）
+RATING_MAX_ATTEMPTS = 8
+# 单次评分请求的超时（秒），超时按可重试错误处理，避免一个卡住的请求占住消费者
+DEFAULT_RATING_TIMEOUT = 300.0
+# 熔断器：最近DEFAULT_BREAKER_WINDOW次评分请求中失败比例达到该值时暂停发送，<=0时不熔断
+DEFAULT_BREAKER_FAILURE_RATIO = 0.5
+DEFAULT_BREAKER_WINDOW = 20
+DEFAULT_BREAKER_COOLDOWN = 30.0
+
+# 评分调用参数，调整的目的是使得打分的波动性低一点
+RATING_PARAMS = {
+    "temperature": 0,
+    "top_p": 0.9,  # 在temperature = 0的情况下该参数无效
+    "seed": 42,  # 固定随机种子
+    # "max_tokens": 150,
+}
+
+# 论文元数据写入多维表格的列，键为PaperRecord的字段名，值为列名；为空时不写入任何元数据列
+# 例如 {"title": "标题", "authors": "作者", "published": "提交日期"}，对应的列需要先在表格中建好
+PAPER_BITABLE_FIELDS: Dict[str, str] = {}
+
+# 评分结果中记录由哪一级模型给出最终评分（fast/full）的内部字段
+TIER_KEY = "_tier"
+# 若表格中建了对应的列，把TIER_KEY写入该列；为None时不写入
+TIER_BITABLE_FIELD: Optional[str] = None
+
+# 两级评分：快速模型打分达到该值、或把握低于该值时交给思考模型复评
+DEFAULT_CASCADE_ESCALATE_SCORE = 6.0
+DEFAULT_CASCADE_MIN_CONFIDENCE = 0.7
+# 快速模型只输出很短的JSON
+CASCADE_MAX_TOKENS = 256
+
+# 全局飞书access_token，缓存到过期前5分钟，所有写入批次共享
+token_provider = AccessTokenProvider(APP_ID, APP_SECRET)
+
+# 全局client在第一次评分时才创建，导入本模块不加载openai
+_client_lock = threading.Lock()
+_client = None
+_async_client = None
+
+
+def get_client() -> "OpenAI":
+    """返回进程内共享的OpenAI client
+
+    重试交给call_with_retry处理，这样限流器才能感知到每一次429。
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from openai import OpenAI
+
+                _client = OpenAI(
+                    base_url=ARK_BOTS_BASE_URL,
+                    api_key=ARK_API_KEY,
+                    max_retries=0,
+                    timeout=DEFAULT_RATING_TIMEOUT,
+                )
+    return _client
+
+
+def get_async_client() -> "AsyncOpenAI":
+    """返回异步引擎共享的AsyncOpenAI client"""
+    global _async_client
+    if _async_client is None:
+        with _client_lock:
+            if _async_client is None:
+                from openai import AsyncOpenAI
+
+                _async_client = AsyncOpenAI(
+                    base_url=ARK_BOTS_BASE_URL,
+                    api_key=ARK_API_KEY,
+                    max_retries=0,
+                    timeout=DEFAULT_RATING_TIMEOUT,
+                )
+    return _async_client
+
+
+def get_completion_text(completion, link: str, tier: str = "full") -> Optional[str]:
+    """记录token消耗，并取出去掉代码块标记后的模型输出，为空时返回None"""
+    # 记录token消耗
+    usage = getattr(completion, "usage", None)
+    if usage is not None:
+        LLM_TOKENS.inc(usage.prompt_tokens or 0, type="prompt", tier=tier)
+        LLM_TOKENS.inc(usage.completion_tokens or 0, type="completion", tier=tier)
+
+    #检查api响应是否为空
+    if not completion.choices or not completion.choices[0].message.content:
+        lark.logger.error(f"API响应内容为空，跳过论文: {link}")
+        return None
+
+    # 解析评分结果
+    ai_ret = completion.choices[0].message.content.strip()
+    lark.logger.info(f"ai_ret: {ai_ret}")
+    ai_ret = re.sub(r'^(<\|FunctionCallEnd\|>|```json\n?|```\n?)', '', ai_ret, flags=re.IGNORECASE)
+    ai_ret = re.sub(r'```\s*$', '', ai_ret)  # 移除结尾的代码块标记
+    #ai_ret = re.sub(r"'",'"',ai_ret)
+
+    #检查是否为空内容
+    if not ai_ret:
+        lark.logger.error(f"清理后内容为空，跳过论文: {link}")
+        return None
+    return ai_ret
+
+
+def parse_rating_completion(completion, date_str: str, link: str, tier: str = "full") -> Optional[dict[str, any]]:
+    """解析大模型返回的评分结果
+
+    Args:
+        completion: chat.completions.create的返回值
+        date_str (str): 论文对应的日期
+        link (str): 论文链接
+        tier (str): 模型层级，用于按层级统计token消耗
+
+    Returns:
+        dict[str, any]: 对应链接的评分结果，响应为空时返回None，解析失败时返回空字典
+    """
+    ai_ret = get_completion_text(completion, link, tier)
+    if ai_ret is None:
+        return None
+
+    try:
+        #添加所需字段
+        result = json.loads(ai_ret)
+        result["link"] = {"link": link, "text": link}
+        result["date"] = date_str
+    except json.JSONDecodeError as e:
+        RATING_PARSE_FAILURES.inc()
+        lark.logger.error(f"解析JSON出错：{e}，内容：{ai_ret}，跳过论文: {link}")
+        return {}
+
+    return result
+
+
+def get_cached_rating(
+    cache: Optional[RatingCache],
+    docs_hash: str,
+    date_str: str,
+    link: str,
+    model: Optional[str] = None,
+) -> Optional[dict[str, any]]:
+    """从评分缓存中读取结果（默认读BOT_ID的结果），并换上本次运行的链接和日期
+
+    缓存只是优化：读取出错（如多个worker共用缓存文件时database is locked）时视为未命中。
+    """
+    if cache is None:
+        return None
+    try:
+        result = cache.get(get_arxiv_id(link), model or BOT_ID, docs_hash)
+    except Exception as e:
+        lark.logger.warning(f"读取评分缓存失败，按未命中处理: {type(e).__name__} - {e}（{link}）")
+        return None
+    if result is None:
+        return None
+    lark.logger.info(f"命中评分缓存，跳过大模型调用: {link}")
+    result["link"] = {"link": link, "text": link}
+    result["date"] = date_str
+    return result
+
+
+def attach_paper_fields(result: Optional[dict[str, any]], paper: Optional[PaperRecord]) -> Optional[dict[str, any]]:
+    """按PAPER_BITABLE_FIELDS把论文元数据填入评分结果，多值字段以逗号拼接
+
+    完整的元数据另存为内部字段，登记到台账，重评时不必重新爬取。
+    """
+    if not result or paper is None:
+        return result
+    for attr, column in PAPER_BITABLE_FIELDS.items():
+        value = getattr(paper, attr)
+        result[column] = ", ".join(value) if isinstance(value, tuple) else value
+    result[PAPER_KEY] = paper.to_dict()
+    return result
+
+
+def put_cached_rating(
+    cache: Optional[RatingCache],
+    docs_hash: str,
+    link: str,
+    result: Optional[dict[str, any]],
+    model: Optional[str] = None,
+) -> None:
+    """只缓存成功解析的评分结果；写入出错时只记录日志，不影响已经拿到的评分结果"""
+    if cache is None or not result:
+        return
+    try:
+        cache.put(get_arxiv_id(link), model or BOT_ID, docs_hash, result)
+    except Exception as e:
+        lark.logger.warning(f"写入评分缓存失败: {type(e).__name__} - {e}（{link}）")
+
+
+@dataclass
+class Cascade:
+    """两级评分配置：快速模型先根据标题和摘要打分，只有候选论文才交给BOT_ID思考模型复评"""
+
+    model: str
+    escalate_score: float = DEFAULT_CASCADE_ESCALATE_SCORE
+    min_confidence: float = DEFAULT_CASCADE_MIN_CONFIDENCE
+    # 快速模型的延迟和限流与思考模型不同，单独使用一个限流器
+    limiter: Any = None
+
+    def needs_escalation(self, result: Optional[dict[str, any]]) -> bool:
+        """快速模型调用或解析失败、分数达到候选线、或把握不足时需要复评"""
+        if not result:
+            return True
+        try:
+            score = float(result.get("score"))
+            confidence = float(result.get("_confidence"))
+        except (TypeError, ValueError):
+            return True
+        return score >= self.escalate_score or confidence < self.min_confidence
+
+
+@dataclass
+class TailControl:
+    """思考模型评分请求的长尾控制：单次调用超时、对冲请求和熔断器
+
+    同步和异步引擎都可以使用；Hedger和CircuitBreaker内部用线程锁保护，可以在多个消费者间共享。
+    """
+
+    timeout: float = DEFAULT_RATING_TIMEOUT
+    hedger: Optional[Hedger] = None
+    breaker: Optional[CircuitBreaker] = None
+
+
+def mark_triage_result(result: Optional[dict[str, any]]) -> Optional[dict[str, any]]:
+    """快速模型的confidence改为内部字段，并记录由fast层给出评分"""
+    if result:
+        result["_confidence"] = result.pop("confidence", None)
+        result[TIER_KEY] = "fast"
+    return result
+
+
+def mark_full_result(result: Optional[dict[str, any]]) -> Optional[dict[str, any]]:
+    if result:
+        result[TIER_KEY] = "full"
+        RATINGS_BY_TIER.inc(tier="full")
+    return result
+
+
+def triage_paper(
+    relevance_content: str,
+    docs_hash: str,
+    date_str: str,
+    link: str,
+    paper: PaperRecord,
+    cascade: Cascade,
+    cache: Optional[RatingCache] = None,
+) -> Optional[dict[str, any]]:
+    """两级评分的第一级：快速模型根据摘要打分
+
+    Returns:
+        dict[str, any]: 快速模型的评分结果，调用失败时返回None
+    """
+    cached = get_cached_rating(cache, docs_hash, date_str, link, model=cascade.model)
+    if cached is not None:
+        return cached
+
+    messages = get_triage_prompt(relevance_content or "", link, paper)
+    try:
+        completion = call_with_retry(
+            lambda: get_client().chat.completions.create(
+                model=cascade.model,
+                messages=messages,
+                max_tokens=CASCADE_MAX_TOKENS,
+                **RATING_PARAMS,
+            ),
+            limiter=cascade.limiter,
+            max_attempts=RATING_MAX_ATTEMPTS,
+        )
+    except Exception as e:
+        lark.logger.warning(f"快速模型评分失败：{type(e).__name__} - {str(e)}，交给思考模型: {link}")
+        return None
+
+    result = mark_triage_result(parse_rating_completion(completion, date_str, link, tier="fast"))
+    put_cached_rating(cache, docs_hash, link, result, model=cascade.model)
+    return result
 
 
-def rate_papers(sop_content: str, tag_content: str, date_str: str, link: str, relevance_content: str = None) -> Optional[dict[str, any]]:
+async def async_triage_paper(
+    relevance_content: str,
+    docs_hash: str,
+    date_str: str,
+    link: str,
+    paper: PaperRecord,
+    cascade: Cascade,
+    cache: Optional[RatingCache] = None,
+) -> Optional[dict[str, any]]:
+    """triage_paper的异步版本"""
+    cached = get_cached_rating(cache, docs_hash, date_str, link, model=cascade.model)
+    if cached is not None:
+        return cached
+
+    messages = get_triage_prompt(relevance_content or "", link, paper)
+    try:
+        completion = await async_call_with_retry(
+            lambda: get_async_client().chat.completions.create(
+                model=cascade.model,
+                messages=messages,
+                max_tokens=CASCADE_MAX_TOKENS,
+                **RATING_PARAMS,
+            ),
+            limiter=cascade.limiter,
+            max_attempts=RATING_MAX_ATTEMPTS,
+        )
+    except Exception as e:
+        lark.logger.warning(f"快速模型评分失败：{type(e).__name__} - {str(e)}，交给思考模型: {link}")
+        return None
+
+    result = mark_triage_result(parse_rating_completion(completion, date_str, link, tier="fast"))
+    put_cached_rating(cache, docs_hash, link, result, model=cascade.model)
+    return result
+
+
+def accept_triage(result: Optional[dict[str, any]], cascade: Cascade, link: str) -> bool:
+    """快速模型的结果是否可以作为最终评分"""
+    if cascade.needs_escalation(result):
+        return False
+    lark.logger.info(f"快速模型评分{result.get('score')}，无需思考模型复评: {link}")
+    RATINGS_BY_TIER.inc(tier="fast")
+    return True
+
+
+def rate_papers(
+    sop_content: str,
+    tag_content: str,
+    date_str: str,
+    link: str,
+    relevance_content: str = None,
+    limiter: Optional[AdaptiveLimiter] = None,
+    cache: Optional[RatingCache] = None,
+    paper: Optional[PaperRecord] = None,
+    cascade: Optional[Cascade] = None,
+    tail: Optional[TailControl] = None,
+) -> Optional[dict[str, any]]:
     """对单篇论文进行评分
 
     Args:
@@ -58,75 +449,390 @@ def rate_papers(sop_content: str, tag_content: str, date_str: str, link: str, re
         tag_content (str): 岗位tag内容
         link (str): 论文链接
         relevance_content (str): 研究相关性内容
+        limiter (AdaptiveLimiter): 控制在途评分请求数量的自适应限流器
+        cache (RatingCache): 评分结果缓存，命中时不发起网络请求
+        paper (PaperRecord): 生产者产出的论文元数据，有则放进提示词并按PAPER_BITABLE_FIELDS填入结果
+        cascade (Cascade): 两级评分配置，有论文元数据时先由快速模型打分，候选论文再交给思考模型
+        tail (TailControl): 长尾控制，为None时只使用默认超时
 
     Returns:
         dict[str, any]: 对应链接的评分结果
     """
 
-    result = {}
-
     #处理pdf url链接输入
-    if link != '':    
-        # 构造评分提示
-        messages = get_rating_prompt(sop_content, tag_content, link, False)
-        lark.logger.info("prompt constructed")
-        # 调用 AI 进行评分
-        try: 
-            completion = client.chat.completions.create(
+    if link == '':
+        lark.logger.error("链接为空，跳过")
+        return None
+
+    tail = tail or TailControl()
+    docs_hash = hash_documents(sop_content, tag_content, relevance_content)
+    cached = get_cached_rating(cache, docs_hash, date_str, link)
+    if cached is not None:
+        return attach_paper_fields(cached, paper)
+
+    if cascade is not None and paper is not None:
+        triaged = triage_paper(relevance_content, docs_hash, date_str, link, paper, cascade, cache)
+        if accept_triage(triaged, cascade, link):
+            return attach_paper_fields(triaged, paper)
+
+    # 构造评分提示
+    messages = get_rating_prompt(sop_content, tag_content, link, False, paper=paper)
+    lark.logger.info("prompt constructed")
+    # 调用 AI 进行评分
+    try:
+        completion = call_with_retry(
+            lambda: get_client().chat.completions.create(
                 model=BOT_ID,
                 messages=messages,
-                # 以下参数调整的目的是使得打分的波动性低一点
-                temperature=0, 
-                top_p=0.9, # 在temperature = 0的情况下该参数无效
-                seed=42, # 固定随机种子
-                #max_tokens=150,
-            )
+                timeout=tail.timeout,
+                **RATING_PARAMS,
+            ),
+            limiter=limiter,
+            max_attempts=RATING_MAX_ATTEMPTS,
+            breaker=tail.breaker,
+            hedger=tail.hedger,
+        )
+    except Exception as e:
+        lark.logger.error(f"处理论文时发生意外错误：{type(e).__name__} - {str(e)}，跳过论文: {link}")
+        return {}
 
-            #检查api响应是否为空
-            if not completion.choices or not completion.choices[0].message.content:
-                lark.logger.error(f"API响应内容为空，跳过论文: {link}")
-                return None
-
-            # 解析评分结果
-            ai_ret = completion.choices[0].message.content.strip()
-            lark.logger.info(f"ai_ret: {ai_ret}")
-            ai_ret = re.sub(r'^(<\|FunctionCallEnd\|>|```json\n?|```\n?)', '', ai_ret, flags=re.IGNORECASE)
-            ai_ret = re.sub(r'```\s*$', '', ai_ret)  # 移除结尾的代码块标记
-            #ai_ret = re.sub(r"'",'"',ai_ret)
-
-            #检查是否为空内容
-            if not ai_ret:
-                lark.logger.error(f"清理后内容为空，跳过论文: {link}")
-                return None
-            
-            #添加所需字段
-            result = json.loads(ai_ret)
-            result["link"] = {"link": link, "text": link}
-            result["date"] = date_str
-
-        except json.JSONDecodeError as e:
-            lark.logger.error(f"解析JSON出错：{e}，内容：{ai_ret}，跳过论文: {link}")
-        except Exception as e:
-            lark.logger.error(f"处理论文时发生意外错误：{type(e).__name__} - {str(e)}，跳过论文: {link}")
+    result = mark_full_result(parse_rating_completion(completion, date_str, link))
+    put_cached_rating(cache, docs_hash, link, result)
+    return attach_paper_fields(result, paper)
 
-        return result
-    else:
+
+async def async_rate_papers(
+    sop_content: str,
+    tag_content: str,
+    date_str: str,
+    link: str,
+    relevance_content: str = None,
+    limiter: Optional[AsyncAdaptiveLimiter] = None,
+    cache: Optional[RatingCache] = None,
+    paper: Optional[PaperRecord] = None,
+    cascade: Optional[Cascade] = None,
+    tail: Optional[TailControl] = None,
+) -> Optional[dict[str, any]]:
+    """rate_papers的异步版本，使用AsyncOpenAI发起评分请求
+
+    Args:
+        sop_content (str): 评分标准内容
+        tag_content (str): 岗位tag内容
+        link (str): 论文链接
+        relevance_content (str): 研究相关性内容
+        limiter (AsyncAdaptiveLimiter): 控制在途评分请求数量的自适应限流器
+        cache (RatingCache): 评分结果缓存，命中时不发起网络请求
+        paper (PaperRecord): 生产者产出的论文元数据，有则放进提示词并按PAPER_BITABLE_FIELDS填入结果
+        cascade (Cascade): 两级评分配置，有论文元数据时先由快速模型打分，候选论文再交给思考模型
+        tail (TailControl): 长尾控制，为None时只使用默认超时
+
+    Returns:
+        dict[str, any]: 对应链接的评分结果
+    """
+    if link == '':
         lark.logger.error("链接为空，跳过")
         return None
 
+    tail = tail or TailControl()
+    docs_hash = hash_documents(sop_content, tag_content, relevance_content)
+    cached = get_cached_rating(cache, docs_hash, date_str, link)
+    if cached is not None:
+        return attach_paper_fields(cached, paper)
+
+    if cascade is not None and paper is not None:
+        triaged = await async_triage_paper(relevance_content, docs_hash, date_str, link, paper, cascade, cache)
+        if accept_triage(triaged, cascade, link):
+            return attach_paper_fields(triaged, paper)
+
+    messages = get_rating_prompt(sop_content, tag_content, link, False, paper=paper)
+    try:
+        completion = await async_call_with_retry(
+            lambda: get_async_client().chat.completions.create(
+                model=BOT_ID,
+                messages=messages,
+                timeout=tail.timeout,
+                **RATING_PARAMS,
+            ),
+            limiter=limiter,
+            max_attempts=RATING_MAX_ATTEMPTS,
+            breaker=tail.breaker,
+            hedger=tail.hedger,
+        )
+    except Exception as e:
+        lark.logger.error(f"处理论文时发生意外错误：{type(e).__name__} - {str(e)}，跳过论文: {link}")
+        return {}
+
+    result = mark_full_result(parse_rating_completion(completion, date_str, link))
+    put_cached_rating(cache, docs_hash, link, result)
+    return attach_paper_fields(result, paper)
+
+
+def parse_batch_completion(
+    completion,
+    papers: List[Tuple[str, str, PaperRecord]],
+    docs_hash: str,
+    cache: Optional[RatingCache] = None,
+) -> Dict[str, dict[str, any]]:
+    """解析批量评分返回的JSON数组，按id字段把结果对应回各篇论文
+
+    Args:
+        completion: chat.completions.create的返回值
+        papers (List[Tuple[str, str, PaperRecord]]): 本批的[(link, date, paper)]
+        docs_hash (str): 评分文档哈希，用于写入缓存
+
+    Returns:
+        Dict[str, dict[str, any]]: link -> 评分结果；格式错误、id对不上或重复的论文不在其中
+    """
+    expected = {paper.arxiv_id: (link, date_str, paper) for link, date_str, paper in papers}
+    ai_ret = get_completion_text(completion, f"{len(papers)}篇论文的批量评分")
+    if ai_ret is None:
+        return {}
+    try:
+        entries = json.loads(ai_ret)
+    except json.JSONDecodeError as e:
+        RATING_PARSE_FAILURES.inc()
+        lark.logger.error(f"解析批量评分JSON出错：{e}，内容：{ai_ret}")
+        return {}
+    if not isinstance(entries, list):
+        RATING_PARSE_FAILURES.inc()
+        lark.logger.error(f"批量评分返回的不是JSON数组：{ai_ret}")
+        return {}
 
-def save_to_feishu_duowei(results: List[Dict[str, Any]], table_id: str) -> None:
+    results = {}
+    for entry in entries:
+        paper_id = get_arxiv_id(str(entry.pop("id", ""))) if isinstance(entry, dict) else None
+        if paper_id not in expected:
+            lark.logger.warning(f"批量评分结果的id不属于本批论文，已忽略：{paper_id}")
+            continue
+        link, date_str, paper = expected[paper_id]
+        if link in results:
+            lark.logger.warning(f"批量评分结果中论文{paper_id}重复出现，只保留第一条")
+            continue
+        entry["link"] = {"link": link, "text": link}
+        entry["date"] = date_str
+        results[link] = mark_full_result(entry)
+        put_cached_rating(cache, docs_hash, link, entry)
+        attach_paper_fields(entry, paper)
+
+    if len(results) < len(papers):
+        RATING_PARSE_FAILURES.inc()
+        lark.logger.warning(f"批量评分只对应上{len(results)}/{len(papers)}篇论文，其余逐篇重新评分")
+    return results
+
+
+def split_rating_batch(
+    items: List[Tuple[str, str, Optional[PaperRecord]]],
+    docs_hash: str,
+    cache: Optional[RatingCache] = None,
+) -> tuple:
+    """把一批任务分成：命中缓存的结果、可以合并评分的论文、只能逐篇评分的论文（没有元数据）"""
+    results, batchable, singles = {}, [], []
+    for link, date_str, paper in items:
+        cached = get_cached_rating(cache, docs_hash, date_str, link)
+        if cached is not None:
+            results[link] = attach_paper_fields(cached, paper)
+        elif paper is None:
+            singles.append((link, date_str, paper))
+        else:
+            batchable.append((link, date_str, paper))
+    return results, batchable, singles
+
+
+def rate_paper_batch(
+    sop_content: str,
+    tag_content: str,
+    items: List[Tuple[str, str, Optional[PaperRecord]]],
+    relevance_content: str = None,
+    limiter: Optional[AdaptiveLimiter] = None,
+    cache: Optional[RatingCache] = None,
+    cascade: Optional[Cascade] = None,
+    tail: Optional[TailControl] = None,
+) -> Dict[str, Optional[dict[str, any]]]:
+    """把多篇论文放进一次请求评分，SOP和岗位tag的系统提示只发送一次
+
+    只有带元数据（标题、摘要）的论文会合并评分；批量结果格式错误或对不上id的论文
+    回退为逐篇调用rate_papers。启用两级评分时，先逐篇由快速模型初评，只有候选论文进入批量评分。
+
+    Args:
+        sop_content (str): 评分标准内容
+        tag_content (str): 岗位tag内容
+        items (List[Tuple[str, str, PaperRecord]]): [(link, date, paper)]
+        relevance_content (str): 研究相关性内容
+        limiter (AdaptiveLimiter): 控制在途评分请求数量的自适应限流器
+        cache (RatingCache): 评分结果缓存
+        cascade (Cascade): 两级评分配置
+        tail (TailControl): 长尾控制
+
+    Returns:
+        Dict[str, dict[str, any]]: link -> 评分结果
+    """
+    tail = tail or TailControl()
+    docs_hash = hash_documents(sop_content, tag_content, relevance_content)
+    results, batchable, singles = split_rating_batch(items, docs_hash, cache)
+
+    if cascade is not None:
+        escalated = []
+        for link, date_str, paper in batchable:
+            triaged = triage_paper(relevance_content, docs_hash, date_str, link, paper, cascade, cache)
+            if accept_triage(triaged, cascade, link):
+                results[link] = attach_paper_fields(triaged, paper)
+            else:
+                escalated.append((link, date_str, paper))
+        batchable = escalated
+
+    if len(batchable) > 1:
+        messages = get_batch_rating_prompt(sop_content, tag_content, [(link, paper) for link, _, paper in batchable], False)
+        try:
+            completion = call_with_retry(
+                lambda: get_client().chat.completions.create(
+                    model=BOT_ID,
+                    messages=messages,
+                    timeout=tail.timeout,
+                    **RATING_PARAMS,
+                ),
+                limiter=limiter,
+                max_attempts=RATING_MAX_ATTEMPTS,
+                breaker=tail.breaker,
+                hedger=tail.hedger,
+            )
+        except Exception as e:
+            lark.logger.error(f"批量评分请求失败：{type(e).__name__} - {str(e)}，逐篇重新评分")
+        else:
+            results.update(parse_batch_completion(completion, batchable, docs_hash, cache))
+
+    # 没有元数据的论文，以及批量评分没有拿到结果的论文逐篇评分（已经过快速模型初评，不再重复）
+    fallback = [(entry, cascade) for entry in singles]
+    fallback += [(entry, None) for entry in batchable if entry[0] not in results]
+    for (link, date_str, paper), entry_cascade in fallback:
+        results[link] = rate_papers(
+            sop_content=sop_content,
+            tag_content=tag_content,
+            date_str=date_str,
+            link=link,
+            relevance_content=relevance_content,
+            limiter=limiter,
+            cache=cache,
+            paper=paper,
+            cascade=entry_cascade,
+            tail=tail,
+        )
+    return results
+
+
+async def async_rate_paper_batch(
+    sop_content: str,
+    tag_content: str,
+    items: List[Tuple[str, str, Optional[PaperRecord]]],
+    relevance_content: str = None,
+    limiter: Optional[AsyncAdaptiveLimiter] = None,
+    cache: Optional[RatingCache] = None,
+    cascade: Optional[Cascade] = None,
+    tail: Optional[TailControl] = None,
+) -> Dict[str, Optional[dict[str, any]]]:
+    """rate_paper_batch的异步版本，快速模型初评和逐篇回退都并发进行"""
+    tail = tail or TailControl()
+    docs_hash = hash_documents(sop_content, tag_content, relevance_content)
+    results, batchable, singles = split_rating_batch(items, docs_hash, cache)
+
+    if cascade is not None and batchable:
+        triaged = await asyncio.gather(
+            *(
+                async_triage_paper(relevance_content, docs_hash, date_str, link, paper, cascade, cache)
+                for link, date_str, paper in batchable
+            )
+        )
+        escalated = []
+        for (link, date_str, paper), triaged_result in zip(batchable, triaged):
+            if accept_triage(triaged_result, cascade, link):
+                results[link] = attach_paper_fields(triaged_result, paper)
+            else:
+                escalated.append((link, date_str, paper))
+        batchable = escalated
+
+    if len(batchable) > 1:
+        messages = get_batch_rating_prompt(sop_content, tag_content, [(link, paper) for link, _, paper in batchable], False)
+        try:
+            completion = await async_call_with_retry(
+                lambda: get_async_client().chat.completions.create(
+                    model=BOT_ID,
+                    messages=messages,
+                    timeout=tail.timeout,
+                    **RATING_PARAMS,
+                ),
+                limiter=limiter,
+                max_attempts=RATING_MAX_ATTEMPTS,
+                breaker=tail.breaker,
+                hedger=tail.hedger,
+            )
+        except Exception as e:
+            lark.logger.error(f"批量评分请求失败：{type(e).__name__} - {str(e)}，逐篇重新评分")
+        else:
+            results.update(parse_batch_completion(completion, batchable, docs_hash, cache))
+
+    fallback = [(entry, cascade) for entry in singles]
+    fallback += [(entry, None) for entry in batchable if entry[0] not in results]
+    rated = await asyncio.gather(
+        *(
+            async_rate_papers(
+                sop_content=sop_content,
+                tag_content=tag_content,
+                date_str=date_str,
+                link=link,
+                relevance_content=relevance_content,
+                limiter=limiter,
+                cache=cache,
+                paper=paper,
+                cascade=entry_cascade,
+                tail=tail,
+            )
+            for (link, date_str, paper), entry_cascade in fallback
+        )
+    )
+    results.update((entry[0], result) for (entry, _), result in zip(fallback, rated))
+    return results
+
+
+def to_bitable_fields(result: Dict[str, Any]) -> Dict[str, Any]:
+    """去掉以下划线开头的流水线内部字段（表格中没有对应的列），按需写入评分层级"""
+    fields = {key: value for key, value in result.items() if not key.startswith("_")}
+    if TIER_BITABLE_FIELD and result.get(TIER_KEY):
+        fields[TIER_BITABLE_FIELD] = result[TIER_KEY]
+    return fields
+
+
+def save_to_feishu_duowei(results: List[Dict[str, Any]], table_id: str) -> bool:
     """将评分结果保存到飞书多维表格
 
     Args:
         results (List[Dict[str, Any]]): 评分结果列表
         table_id (str): 用来存储对应数据的table_id，不同数据存储地址不一样
+
+    Returns:
+        bool: 是否写入成功
     """
     # 获取访问令牌
-    user_access_token = get_access_token(APP_ID, APP_SECRET)["access_token"]
+    user_access_token = token_provider.get()
 
     # 将结果保存到飞书多维表格
-    add_records_to_dowei(TABLE_APP_TOKEN, table_id, user_access_token, results)
+    records = [to_bitable_fields(result) for result in results]
+    created = add_records_to_dowei(TABLE_APP_TOKEN, table_id, user_access_token, records)
+    if created is None:
+        return False
+    # 新增的记录与请求顺序一致，记下各条结果的record_id，登记台账后重评时可以原地更新
+    for result, record in zip(results, created):
+        if result:
+            result[RECORD_ID_KEY] = record.record_id
+    return True
+
+
+def update_feishu_duowei(results: List[Dict[str, Any]], table_id: str) -> bool:
+    """用重评的结果原地更新多维表格中已有的记录，记录ID取自结果中的RECORD_ID_KEY字段
+
+    Returns:
+        bool: 是否更新成功
+    """
+    records = {result[RECORD_ID_KEY]: to_bitable_fields(result) for result in results}
+    return update_records_in_dowei(TABLE_APP_TOKEN, table_id, token_provider.get(), records)
 
 def save_to_feishu_sheet(spreadsheet_token, sheet_id, range, results: list[list[any]]) -> None:
     """将所需要的结果保存到飞书电子表格
@@ -138,7 +844,7 @@ def save_to_feishu_sheet(spreadsheet_token, sheet_id, range, results: list[list[
         results (List[List[Any]]): 评分结果列表
     """
     # 获取访问令牌
-    user_access_token = get_access_token(APP_ID,APP_SECRET)["access_token"]
+    user_access_token = token_provider.get()
 
     # 处理results格式问题
     cleaned_results = [
@@ -161,96 +867,505 @@ def save_to_feishu_sheet(spreadsheet_token, sheet_id, range, results: list[list[
 
 
 
-def main():
+def load_rating_docs(cache_path: Optional[str] = DEFAULT_DOC_CACHE_PATH) -> tuple[str, str, str]:
+    """从飞书文档获取评分标准、岗位tag和研究相关性内容，三篇文档并发拉取
+
+    Args:
+        cache_path (str): 本地文档缓存路径，文档revision未变时不拉取全文；None时每次都拉取
+
+    Returns:
+        tuple[str, str, str]: (sop_content, tag_content, relevance_content)
+    """
+    doc_tokens = (RATING_SOP_DOC_TOKEN, JOB_TAG_DOC_TOKEN, RELEVANCE_DOC_TOKEN)
+    access_token = token_provider.get()
+    if cache_path:
+        sop_content, tag_content, relevance_content = FeishuDocCache(cache_path).load(doc_tokens, access_token)
+    else:
+        sop_content, tag_content, relevance_content = fetch_documents(doc_tokens, access_token)
+    lark.logger.info(f"评分文档哈希: {hash_documents(sop_content, tag_content, relevance_content)[:12]}")
+    return sop_content, tag_content, relevance_content
+
+
+def open_result_writers(
+    options: "RunOptions",
+    ledger: Optional[SeenLedger] = None,
+    journal: Optional[RunJournal] = None,
+    docs: Optional[Tuple[str, str, str]] = None,
+    update: bool = False,
+) -> Dict[int, BitableStreamWriter]:
+    """为arxiv(tag=0)和hf(tag=1)结果各创建一个边评分边写入的多维表格写入器
+
+    每批写入成功后登记台账和续跑日志，写入失败的论文下次运行仍会重新处理。
+
+    Args:
+        docs (Tuple[str, str, str]): 本次评分使用的(sop_content, tag_content, relevance_content)，
+            保存到台账并随每条记录登记其版本，评分文档修改后用于挑选需要重评的论文
+        update (bool): True时按结果中的record_id原地更新已有记录（重评），否则新增记录
+    """
+    docs_hash = None
+    if ledger is not None and docs is not None:
+        docs_hash = hash_documents(*docs)
+        ledger.save_docs(docs_hash, *docs)
+
+    def make_writer(name, table_id, tag):
+        def on_written(records):
+            for record in records:
+                link = record["link"]["link"]
+                if ledger is not None:
+                    ledger.record(link, tag, record, docs_hash)
+                if journal is not None:
+                    journal.written(link, tag)
+
+        write = update_feishu_duowei if update else save_to_feishu_duowei
+        return BitableStreamWriter(
+            name,
+            lambda records: write(records, table_id),
+            chunk_size=options.write_chunk_size,
+            flush_interval=options.write_flush_interval,
+            on_written=on_written,
+            # 原地更新时没有不同天结果之间的分隔行
+            trailing_blank=not update,
+        )
+
+    return {
+        0: make_writer("arxiv", ARXIV_TABLE_ID, 0),
+        1: make_writer("hf", HUGGING_FACE_TABLE_ID, 1),
+    }
+
+
+def close_result_writers(writers: Dict[int, BitableStreamWriter]) -> bool:
+    """等待所有结果写入完成
+
+    Returns:
+        bool: 是否全部写入成功
+    """
+    for writer in writers.values():
+        writer.close()
+        if not writer.written_count and not writer.failed_records:
+            lark.logger.warning(f"未获取到有效{writer.name}结果")
+    return not any(writer.failed_records for writer in writers.values())
+
+
+def open_rating_cache(cache_path: Optional[str], sop_content: str, tag_content: str, relevance_content: str) -> Optional[RatingCache]:
+    """打开评分缓存，并清除旧版本评分文档下的结果；cache_path为None时不使用缓存"""
+    if not cache_path:
+        return None
+    return RatingCache(cache_path, docs_hash=hash_documents(sop_content, tag_content, relevance_content))
+
+
+@dataclass
+class RunOptions:
+    """一次评分运行的配置，由命令行参数构造"""
+
+    # 评分并发上限，None时使用对应引擎的默认值
+    concurrency: Optional[int] = None
+    # 评分缓存路径，None时不使用缓存
+    cache_path: Optional[str] = DEFAULT_RATING_CACHE_PATH
+    # 评分文档缓存路径，None时每次运行都拉取文档全文
+    doc_cache_path: Optional[str] = DEFAULT_DOC_CACHE_PATH
+    # 已评分论文台账路径，None时不查重也不记录
+    ledger_path: Optional[str] = DEFAULT_LEDGER_PATH
+    # 为True时忽略台账，已评分过的论文也重新评分
+    force: bool = False
+    # 断点续跑日志路径，None时不记录
+    journal_path: Optional[str] = DEFAULT_JOURNAL_PATH
+    # 为True时从日志恢复上次中断的运行
+    resume: bool = False
+    # 多维表格每批写入的记录数
+    write_chunk_size: int = DEFAULT_WRITE_CHUNK_SIZE
+    # 不满一批时最长等待多少秒写入
+    write_flush_interval: float = DEFAULT_WRITE_FLUSH_INTERVAL
+    # 任务队列容量，队列满时生产者阻塞等待
+    queue_capacity: int = DEFAULT_QUEUE_CAPACITY
+    # 本地相关性初筛阈值，None时不初筛
+    prefilter_threshold: Optional[float] = None
+    # 未达阈值的论文：drop丢弃，deprioritize最后评分
+    prefilter_mode: str = "drop"
+    # 两级评分中快速模型的ID，None时所有论文直接交给BOT_ID
+    cascade_model: Optional[str] = DEFAULT_CASCADE_MODEL
+    cascade_escalate_score: float = DEFAULT_CASCADE_ESCALATE_SCORE
+    cascade_min_confidence: float = DEFAULT_CASCADE_MIN_CONFIDENCE
+    # 每次请求最多合并评分的论文数，1为逐篇评分
+    batch_size: int = 1
+    # arXiv论文的评分方式：online实时评分，batch写入请求文件走批量推理
+    arxiv_mode: str = "online"
+    # 批量推理服务：ark为OpenAI兼容的Batch API，local为本地文件替身（测试用）
+    batch_backend: str = "ark"
+    batch_request_path: str = DEFAULT_BATCH_REQUEST_PATH
+    batch_poll_interval: float = DEFAULT_BATCH_POLL_INTERVAL
+    # 批量推理使用的模型ID，None时使用BOT_ID
+    batch_model: Optional[str] = None
+    # 单次评分请求的超时（秒）
+    rating_timeout: float = DEFAULT_RATING_TIMEOUT
+    # 请求耗时超过近期延迟的该分位数时发出对冲请求，None时不对冲
+    hedge_percentile: Optional[float] = None
+    # 熔断器的失败比例阈值和打开后的暂停时间，阈值<=0时不熔断
+    breaker_failure_ratio: float = DEFAULT_BREAKER_FAILURE_RATIO
+    breaker_cooldown: float = DEFAULT_BREAKER_COOLDOWN
+    # 分布式模式下的角色：single单进程运行，coordinator只爬取和写入，worker只评分
+    role: str = "single"
+    work_queue_path: str = DEFAULT_WORK_QUEUE_PATH
+    lease_seconds: float = DEFAULT_LEASE_SECONDS
+    # worker标识，None时使用主机名-进程号
+    worker_id: Optional[str] = None
+    # 补跑的日期范围(YYYY-MM-DD)，start_date为None时只爬上一个工作日
+    start_date: Optional[str] = None
+    end_date: Optional[str] = None
+    # 重评：SOP/相关性文档修改后，分数落在阈值±带宽内的历史论文需要重评
+    rescore_thresholds: Tuple[float, ...] = DEFAULT_SCORE_THRESHOLDS
+    rescore_band: float = DEFAULT_SCORE_BAND
+    # 为True时只列出需要重评的论文，不调用大模型也不更新表格
+    rescore_dry_run: bool = False
+
+
+def admit_paper(
+    name: str,
+    item: tuple,
+    options: RunOptions,
+    paper_index: PaperIndex,
+    ledger: Optional[SeenLedger] = None,
+    journal: Optional[RunJournal] = None,
+    prefilter: Optional[RelevancePrefilter] = None,
+) -> bool:
+    """生产者入队前的检查：查询台账、本地相关性初筛、登记论文索引并写入续跑日志
+
+    Args:
+        name (str): 生产者名称，用于日志
+        item (tuple): (link, tag, date, paper)
+        options (RunOptions): 运行配置
+        prefilter (RelevancePrefilter): 相关性初筛，None时不初筛
+
+    Returns:
+        bool: True表示需要入队评分
+    """
+    link = item[0]
+    PAPERS_PRODUCED.inc(source=name)
+    # 已评分过的论文（非force模式下）直接跳过
+    if ledger is not None and not options.force and link in ledger:
+        PAPERS_SKIPPED.inc(reason="ledger")
+        lark.logger.info(f"{name}链接已在历史台账中，跳过: {link}")
+        return False
+    # 与研究方向明显无关的论文不交给大模型（deprioritize模式下只降低优先级）
+    paper = item[3]
+    if prefilter is not None and not prefilter.check(paper):
+        if not paper.low_priority:
+            PAPERS_SKIPPED.inc(reason="prefilter")
+            lark.logger.info(f"{name}论文相关性{paper.relevance}低于阈值，跳过: {link}（{paper.title}）")
+            return False
+        lark.logger.info(f"{name}论文相关性{paper.relevance}低于阈值，排到最后评分: {link}（{paper.title}）")
+    claimed = paper_index.claim(*item[:3])
+    if journal is not None:
+        journal.pending(*item)
+    if not claimed:
+        PAPERS_SKIPPED.inc(reason="duplicate")
+        lark.logger.info(f"{name}链接已由其他来源入队，跳过重复评分: {link}")
+    return claimed
+
+
+def open_paper_sources(options: RunOptions) -> Tuple[Callable, Callable]:
+    """返回arXiv和Hugging Face两个生产者的生成器函数
+
+    指定了日期范围时按范围补跑：两个来源都并行爬取范围内的每个工作日，每篇论文带着自己所在那天的日期，
+    跨天、跨来源的重复论文仍由论文索引去重，只评分一次。
+    """
+    if not options.start_date:
+        return get_arxiv_paper_links, get_huggingface_daily_papers_arxiv_links
+    end_date = options.end_date or options.start_date
+    lark.logger.info(f"补跑模式：爬取{options.start_date}到{end_date}的论文")
+    return (
+        functools.partial(get_arxiv_paper_links, start_date=options.start_date, end_date=end_date),
+        functools.partial(get_huggingface_daily_papers_in_range, options.start_date, end_date),
+    )
+
+
+def open_prefilter(options: RunOptions, relevance_content: str) -> Optional[RelevancePrefilter]:
+    if options.prefilter_threshold is None:
+        return None
+    if not relevance_content:
+        lark.logger.warning("研究相关性文档为空，不进行本地初筛")
+        return None
+    return RelevancePrefilter(relevance_content, options.prefilter_threshold, options.prefilter_mode)
+
+
+def open_cascade(options: RunOptions, limiter) -> Optional[Cascade]:
+    if not options.cascade_model:
+        return None
+    lark.logger.info(
+        f"两级评分已启用：快速模型{options.cascade_model}，分数≥{options.cascade_escalate_score}"
+        f"或把握<{options.cascade_min_confidence}时交给{BOT_ID}复评"
+    )
+    return Cascade(
+        model=options.cascade_model,
+        escalate_score=options.cascade_escalate_score,
+        min_confidence=options.cascade_min_confidence,
+        limiter=limiter,
+    )
+
+
+def open_tail_control(options: RunOptions) -> TailControl:
+    """按运行配置构造思考模型评分请求的长尾控制"""
+    hedger = None
+    if options.hedge_percentile:
+        # 每个评分线程最多同时占用原请求和对冲请求两个线程
+        hedger = Hedger(
+            percentile=options.hedge_percentile, max_workers=2 * (options.concurrency or DEFAULT_CONSUMER_COUNT)
+        )
+    breaker = None
+    if options.breaker_failure_ratio > 0:
+        breaker = CircuitBreaker(
+            failure_ratio=options.breaker_failure_ratio,
+            window=DEFAULT_BREAKER_WINDOW,
+            cooldown=options.breaker_cooldown,
+        )
+    if hedger is not None:
+        lark.logger.info(f"对冲请求已启用：耗时超过近期p{options.hedge_percentile * 100:g}延迟时再发一次请求")
+    return TailControl(timeout=options.rating_timeout, hedger=hedger, breaker=breaker)
+
+
+def open_batch_backend(options: RunOptions):
+    if options.batch_backend == "local":
+        # 本地替身在后台逐行调用交互式接口，模拟批量推理服务
+        workdir = os.path.join(os.path.dirname(options.batch_request_path) or ".", "local_batches")
+        return LocalBatchBackend(
+            workdir,
+            lambda body: call_with_retry(
+                lambda: get_client().chat.completions.create(**body),
+                max_attempts=RATING_MAX_ATTEMPTS,
+            ).model_dump(),
+        )
+    from openai import OpenAI
+
+    return OpenAIBatchBackend(OpenAI(base_url=ARK_BATCH_BASE_URL, api_key=ARK_API_KEY))
+
+
+def split_offline_items(items: List[tuple], paper_index: PaperIndex) -> Tuple[List[tuple], List[tuple]]:
+    """批量推理模式下，Hugging Face也登记过的论文仍然实时评分，保证HF表格及时写入
+
+    Returns:
+        Tuple[List[tuple], List[tuple]]: (需要实时评分的任务, 交给批量推理的任务)
+    """
+    online, offline = [], []
+    for item in items:
+        (online if 1 in paper_index.sources(item[0]) else offline).append(item)
+    return online, offline
+
+
+def rate_offline_batch(
+    items: List[tuple],
+    sop_content: str,
+    tag_content: str,
+    relevance_content: str,
+    options: RunOptions,
+    paper_index: PaperIndex,
+    journal: Optional[RunJournal] = None,
+    cache: Optional[RatingCache] = None,
+    limiter: Optional[AdaptiveLimiter] = None,
+) -> None:
+    """把arXiv论文的评分请求写入JSONL文件，提交批量推理并等待结果，再分发给各来源
+
+    未命中缓存的论文每篇一行请求；批量任务失败、超时或单条请求失败的论文回退为实时评分。
+
+    Args:
+        items (List[tuple]): [(link, tag, date, paper)]
+        options (RunOptions): 运行配置，取批量推理相关的参数
+        paper_index (PaperIndex): 本次运行的论文索引，结果通过它分发
+        limiter (AdaptiveLimiter): 回退为实时评分时使用的限流器
+    """
+    def finish(link, result):
+        paper_index.complete(link, result)
+        if journal is not None:
+            journal.done(link, result)
+
+    docs_hash = hash_documents(sop_content, tag_content, relevance_content)
+    pending = {}
+    requests = []
+    for link, tag, date, paper in items:
+        cached = get_cached_rating(cache, docs_hash, date, link)
+        if cached is not None:
+            finish(link, attach_paper_fields(cached, paper))
+            continue
+        custom_id = get_arxiv_id(link)
+        pending[custom_id] = (link, date, paper)
+        messages = get_rating_prompt(sop_content, tag_content, link, False, paper=paper)
+        requests.append((custom_id, {"model": options.batch_model or BOT_ID, "messages": messages, **RATING_PARAMS}))
+    if not requests:
+        return
+
+    write_batch_requests(options.batch_request_path, requests)
+    lark.logger.info(f"已写入{len(requests)}条arXiv评分请求: {options.batch_request_path}")
+    responses = run_batch(open_batch_backend(options), options.batch_request_path, options.batch_poll_interval)
+
+    fallback = 0
+    for custom_id, (link, date, paper) in pending.items():
+        body = responses.get(custom_id)
+        if body is None:
+            fallback += 1
+            result = rate_papers(
+                sop_content=sop_content,
+                tag_content=tag_content,
+                date_str=date,
+                link=link,
+                relevance_content=relevance_content,
+                limiter=limiter,
+                cache=cache,
+                paper=paper,
+            )
+        else:
+            result = mark_full_result(parse_rating_completion(completion_from_body(body), date, link))
+            put_cached_rating(cache, docs_hash, link, result)
+            attach_paper_fields(result, paper)
+        finish(link, result)
+    lark.logger.info(f"批量推理结果已写回：{len(pending) - fallback}篇来自批量结果，{fallback}篇回退为实时评分")
+
+
+def rate_task_items(
+    items: List[tuple],
+    sop_content: str,
+    tag_content: str,
+    relevance_content: str,
+    limiter: Optional[AdaptiveLimiter] = None,
+    cache: Optional[RatingCache] = None,
+    cascade: Optional[Cascade] = None,
+    tail: Optional[TailControl] = None,
+) -> Dict[str, Optional[dict[str, any]]]:
+    """对一次取出的若干(link, tag, date, paper)任务评分：多篇时合并评分，单篇时直接调用rate_papers
+
+    Returns:
+        Dict[str, dict[str, any]]: link -> 评分结果
+    """
+    if len(items) > 1:
+        return rate_paper_batch(
+            sop_content=sop_content,
+            tag_content=tag_content,
+            items=[(link, date, paper) for link, _, date, paper in items],
+            relevance_content=relevance_content,
+            limiter=limiter,
+            cache=cache,
+            cascade=cascade,
+            tail=tail,
+        )
+    if not items:
+        return {}
+    link, tag, date, paper = items[0]
+    return {
+        link: rate_papers(
+            sop_content=sop_content,
+            tag_content=tag_content,
+            date_str=date,
+            link=link,
+            relevance_content=relevance_content,
+            limiter=limiter,
+            cache=cache,
+            paper=paper,
+            cascade=cascade,
+            tail=tail,
+        )
+    }
+
+
+def open_run_journal(options: RunOptions) -> Optional[RunJournal]:
+    if not options.journal_path:
+        return None
+    return RunJournal(options.journal_path, resume=options.resume)
+
+
+def run_threaded(options: Optional[RunOptions] = None) -> None:
+    """线程版评分流水线：2个生产者线程 + 若干消费者线程
+
+    Args:
+        options (RunOptions): 运行配置，consumer数量取options.concurrency
+    """
+    options = options or RunOptions()
+    consumer_count = options.concurrency or DEFAULT_CONSUMER_COUNT
 
     # 获取评分标准
-    access_token = get_access_token(APP_ID, APP_SECRET)["access_token"]
-    sop_content = get_feishu_doc_content(RATING_SOP_DOC_TOKEN, access_token)
-    tag_content = get_feishu_doc_content(JOB_TAG_DOC_TOKEN, access_token)
-    relevance_content = get_feishu_doc_content(RELEVANCE_DOC_TOKEN, access_token)
-
-    # 初始化任务队列
-    task_queue = queue.Queue()
-    arxiv_results = []
-    hf_results = []
-    producer_done_lock = threading.Lock()
-    producer_count = 2  # 总生产者数量
-    producer_done_count = 0  # 已完成的生产者数量
-    result_lock = threading.Lock() # 保证消费线程的安全性
-    
+    sop_content, tag_content, relevance_content = load_rating_docs(options.doc_cache_path)
+    cache = open_rating_cache(options.cache_path, sop_content, tag_content, relevance_content)
+    ledger = SeenLedger(options.ledger_path) if options.ledger_path else None
+    prefilter = open_prefilter(options, relevance_content)
+
+    # 初始化任务队列：有界优先队列，队列满时生产者阻塞，HF论文优先评分
+    task_queue = PaperTaskQueue(options.queue_capacity)
+    QUEUE_DEPTH.set_function(task_queue.qsize)
+    # 消费者线程数量是并发上限，实际在途请求数由限流器按429/延迟动态调整
+    limiter = AdaptiveLimiter(initial_limit=INITIAL_LLM_CONCURRENCY, max_limit=consumer_count)
+    cascade = open_cascade(options, AdaptiveLimiter(initial_limit=INITIAL_LLM_CONCURRENCY, max_limit=consumer_count))
+    tail = open_tail_control(options)
+
+    # 续跑时恢复上次已完成的结果，未完成的任务重新入队
+    journal = open_run_journal(options)
+    # 按tag把结果交给对应的写入器，边评分边分批写入飞书（写入器内部是线程安全的队列）
+    writers = open_result_writers(options, ledger, journal, (sop_content, tag_content, relevance_content))
+
+    # 两个来源共享的论文索引，同一篇论文只评分一次，结果分发给两个来源
+    paper_index = PaperIndex(lambda tag, rating_result: writers[tag].add(rating_result))
+    # 队列有界，恢复出的任务要等消费者启动后再入队
+    restored_items = journal.restore(paper_index) if journal is not None else []
+
     # 定义生产者
+    arxiv_source, hf_source = open_paper_sources(options)
+    # 批量推理模式下arXiv论文先攒起来，生产者结束后统一提交
+    offline_items = [] if options.arxiv_mode == "batch" else None
+
     def arxiv_producer():
-        nonlocal producer_done_count
         try:
-            # 遍历arxiv生成器 （yield (link, 0, date)）
-            for item in get_arxiv_paper_links():
+            # 遍历arxiv生成器 （yield (link, 0, date, paper)）
+            for item in arxiv_source():
+                if not admit_paper("Arxiv", item, options, paper_index, ledger, journal, prefilter):
+                    continue
+                if offline_items is not None:
+                    offline_items.append(item)
+                    continue
                 task_queue.put(item)  # 实时入队
                 lark.logger.info(f"Arxiv爬取到链接并入队: {item[0]}（date: {item[2]}）")
             lark.logger.info("Arxiv爬取完成，所有链接已入队")
         except Exception as e:
             lark.logger.error(f"Arxiv爬取线程出错: {e}")
-        finally:
-            # 最后一个生产者完成时，标记producer_done为True
-            with producer_done_lock:
-                producer_done_count += 1
 
     def hf_producer():
-        """hf爬取生产者：实时将(link, 1, date)放入队列"""
-        nonlocal producer_done_count
+        """hf爬取生产者：实时将(link, 1, date, None)放入队列"""
         try:
-            # 遍历hf生成器（假设已改为yield (link, 1, date)）
-            for item in get_huggingface_daily_papers_arxiv_links():
+            # 遍历hf生成器（yield (link, 1, date, None)）
+            for item in hf_source():
+                if not admit_paper("Hugging Face", item, options, paper_index, ledger, journal, prefilter):
+                    continue
                 task_queue.put(item)  # 实时入队
                 lark.logger.info(f"Hugging Face爬取到链接并入队: {item[0]}（date: {item[2]}）")
             lark.logger.info("Hugging Face爬取完成，所有链接已入队")
         except Exception as e:
             lark.logger.error(f"Hugging Face爬取线程出错: {e}")
-        finally:
-            # 最后一个生产者完成时，标记producer_done为True
-            with producer_done_lock:
-                producer_done_count += 1
 
     # 定义消费者
     def consumer():
         while True:
+            # 阻塞等待任务；批量评分时顺带取走队列中已有的任务；生产者全部结束后会收到结束标记
+            items = take_tasks(task_queue, options.batch_size)
             try:
-                # 从队列取任务（超时5秒，避免无限阻塞）
-                item = task_queue.get(timeout=5)
-                # 解析三元组：(link, tag, date)
-                link, tag, date = item
-                lark.logger.info(f"消费者处理链接（tag={tag}）: {link}")
-
-            # 调用大模型评分（复用rate_papers，传入单链接）
-                # 注意：rate_papers已改为使用全局OpenAI客户端
-                rating_result = rate_papers(
-                    sop_content=sop_content,
-                    tag_content=tag_content,
-                    date_str=date,
-                    link=link,  # 单链接作为列表传入
+                # 解析任务：(link, tag, date, paper)
+                papers = [item for item in items if item is not None]
+                for link, tag, date, paper in papers:
+                    lark.logger.info(f"消费者处理链接（tag={tag}）: {link}")
+
+                rating_results = rate_task_items(
+                    papers, sop_content, tag_content, relevance_content, limiter, cache, cascade, tail
                 )
 
-                # 按tag保存结果（线程安全）
-                if rating_result:
-                    with result_lock:
-                        if tag == 0:
-                            arxiv_results.append(rating_result)
-                        elif tag == 1:
-                            hf_results.append(rating_result)
-
-                # 标记任务完成
-                task_queue.task_done()
-                lark.logger.info(f"消费者完成链接（tag={tag}）: {link}")
-
-            except queue.Empty:
-                # 队列为空时，检查是否所有生产者已完成
-                with producer_done_lock:
-                    if producer_done_count == producer_count and task_queue.empty():
-                        lark.logger.info("消费者：所有任务已处理，退出")
-                        break  # 退出循环
+                # 按登记过该论文的所有tag保存结果
+                for link, tag, date, paper in papers:
+                    paper_index.complete(link, rating_results.get(link))
+                    if journal is not None:
+                        journal.done(link, rating_results.get(link))
+                    lark.logger.info(f"消费者完成链接（tag={tag}）: {link}")
             except Exception as e:
                 lark.logger.error(f"消费者处理出错: {e}")
-                if 'item' in locals():
-                    task_queue.task_done()  # 确保任务计数正确
+            finally:
+                # 每取出一个任务（包括结束标记）恰好标记一次完成
+                for _ in items:
+                    task_queue.task_done()
+            # 结束标记排在所有论文之后，收到时队列里已没有待评分的论文
+            if items[-1] is None:
+                lark.logger.info("消费者：所有任务已处理，退出")
+                return
 
 
      # -------------------------- 核心运行逻辑 --------------------------
@@ -261,52 +1376,687 @@ def main():
     hf_thread.start()
     lark.logger.info("所有生产者线程已启动")
 
-    # 2. 启动消费者线程（20个并发处理）
-    consumer_count = 20
+    # 2. 启动消费者线程
     consumer_threads = []
     for i in range(consumer_count):
         t = threading.Thread(target=consumer, name=f"consumer-{i}")
         t.start()
         consumer_threads.append(t)
     lark.logger.info(f"已启动{consumer_count}个消费者线程")
+    for item in restored_items:
+        task_queue.put(item)
 
     # 3. 等待生产者线程完成（确保所有链接入队）
     arxiv_thread.join()
     hf_thread.join()
     lark.logger.info("所有生产者线程已完成爬取")
 
-    # 4. 等待队列中所有任务处理完毕
-    task_queue.join()
-    lark.logger.info("队列中所有论文链接已处理完毕")
+    # 批量推理模式：HF也有的论文改为实时评分，其余arXiv论文交给批量推理
+    if offline_items:
+        online_items, offline_items = split_offline_items(offline_items, paper_index)
+        for item in online_items:
+            task_queue.put(item)
+
+    # 4. 每个消费者一个结束标记，处理完剩余任务后依次退出
+    for _ in consumer_threads:
+        task_queue.put(None)
+    finished = False
+    try:
+        if offline_items:
+            rate_offline_batch(
+                offline_items, sop_content, tag_content, relevance_content, options, paper_index, journal, cache, limiter
+            )
+        finished = True
+    finally:
+        # 批量推理出错时，实时评分的论文照常处理完并写入飞书
+        task_queue.join()
+        lark.logger.info("队列中所有论文链接已处理完毕")
+
+        # 5. 等待所有消费者线程退出
+        for t in consumer_threads:
+            t.join()
+        lark.logger.info("所有消费者线程已退出")
+
+        # 6. 等待剩余结果写入飞书，正常结束且全部成功后才删除续跑日志
+        all_written = close_result_writers(writers)
+        if journal is not None:
+            journal.close(remove=finished and all_written)
+
+    lark.logger.info("整个论文处理流程已完成")
+
+
+async def run_async(options: Optional[RunOptions] = None) -> None:
+    """asyncio版评分流水线：异步生产者 + 若干评分协程
+
+    所有评分请求共享一个AsyncOpenAI连接池，在途请求数量由options.concurrency控制，
+    不再受限于操作系统线程数量。
+
+    Args:
+        options (RunOptions): 运行配置
+    """
+    options = options or RunOptions()
+    concurrency = options.concurrency or DEFAULT_ASYNC_CONCURRENCY
+
+    sop_content, tag_content, relevance_content = await asyncio.to_thread(load_rating_docs, options.doc_cache_path)
+    cache = open_rating_cache(options.cache_path, sop_content, tag_content, relevance_content)
+    ledger = SeenLedger(options.ledger_path) if options.ledger_path else None
+    prefilter = open_prefilter(options, relevance_content)
+
+    task_queue = AsyncPaperTaskQueue(options.queue_capacity)
+    QUEUE_DEPTH.set_function(task_queue.qsize)
+    limiter = AsyncAdaptiveLimiter(initial_limit=INITIAL_LLM_CONCURRENCY, max_limit=concurrency)
+    cascade = open_cascade(options, AsyncAdaptiveLimiter(initial_limit=INITIAL_LLM_CONCURRENCY, max_limit=concurrency))
+    tail = open_tail_control(options)
+
+    journal = open_run_journal(options)
+    writers = open_result_writers(options, ledger, journal, (sop_content, tag_content, relevance_content))
+    paper_index = PaperIndex(lambda tag, rating_result: writers[tag].add(rating_result))
+    restored_items = journal.restore(paper_index) if journal is not None else []
+
+    arxiv_source, hf_source = open_paper_sources(options)
+    # 批量推理模式下arXiv论文先攒起来，生产者结束后统一提交
+    offline_items = [] if options.arxiv_mode == "batch" else None
+
+    async def produce(name, source, offline=None):
+        try:
+            async for item in source:
+                if not admit_paper(name, item, options, paper_index, ledger, journal, prefilter):
+                    continue
+                if offline is not None:
+                    offline.append(item)
+                    continue
+                await task_queue.put(item)
+                lark.logger.info(f"{name}爬取到链接并入队: {item[0]}（date: {item[2]}）")
+            lark.logger.info(f"{name}爬取完成，所有链接已入队")
+        except Exception as e:
+            lark.logger.error(f"{name}爬取协程出错: {e}")
+
+    async def consume():
+        while True:
+            items = await atake_tasks(task_queue, options.batch_size)
+            try:
+                papers = [item for item in items if item is not None]
+                for link, tag, date, paper in papers:
+                    lark.logger.info(f"消费者处理链接（tag={tag}）: {link}")
+                if len(papers) > 1:
+                    rating_results = await async_rate_paper_batch(
+                        sop_content=sop_content,
+                        tag_content=tag_content,
+                        items=[(link, date, paper) for link, _, date, paper in papers],
+                        relevance_content=relevance_content,
+                        limiter=limiter,
+                        cache=cache,
+                        cascade=cascade,
+                        tail=tail,
+                    )
+                elif papers:
+                    link, tag, date, paper = papers[0]
+                    rating_results = {
+                        link: await async_rate_papers(
+                            sop_content=sop_content,
+                            tag_content=tag_content,
+                            date_str=date,
+                            link=link,
+                            relevance_content=relevance_content,
+                            limiter=limiter,
+                            cache=cache,
+                            paper=paper,
+                            cascade=cascade,
+                            tail=tail,
+                        )
+                    }
+                for link, tag, date, paper in papers:
+                    paper_index.complete(link, rating_results.get(link))
+                    if journal is not None:
+                        journal.done(link, rating_results.get(link))
+                    lark.logger.info(f"消费者完成链接（tag={tag}）: {link}")
+            except Exception as e:
+                lark.logger.error(f"消费者处理出错: {e}")
+            finally:
+                for _ in items:
+                    task_queue.task_done()
+            # 生产者全部结束后放入的结束标记
+            if items[-1] is None:
+                return
+
+    consumer_count = consumer_count_for_batches(concurrency, options.batch_size)
+    consumers = [asyncio.create_task(consume(), name=f"consumer-{i}") for i in range(consumer_count)]
+    lark.logger.info(f"已启动{consumer_count}个评分协程")
+    # 队列有界，恢复出的任务在评分协程启动后再入队
+    for item in restored_items:
+        await task_queue.put(item)
+
+    await asyncio.gather(
+        produce("Arxiv", iterate_in_thread(arxiv_source), offline_items),
+        produce("Hugging Face", iterate_in_thread(hf_source)),
+    )
+    lark.logger.info("所有生产者已完成爬取")
+
+    offline_task = None
+    if offline_items:
+        online_items, offline_items = split_offline_items(offline_items, paper_index)
+        for item in online_items:
+            await task_queue.put(item)
+        # 批量推理在后台线程中提交和轮询，与实时评分同时进行
+        offline_task = asyncio.to_thread(
+            rate_offline_batch, offline_items, sop_content, tag_content, relevance_content, options, paper_index, journal, cache
+        )
+
+    # 每个评分协程一个结束标记，处理完剩余任务后依次退出
+    for _ in consumers:
+        await task_queue.put(None)
+    finished = False
+    try:
+        await asyncio.gather(*consumers, *([offline_task] if offline_task else []))
+        finished = True
+        lark.logger.info("队列中所有论文链接已处理完毕")
+    finally:
+        # 批量推理出错时，实时评分的论文照常处理完并写入飞书；正常结束且全部成功后才删除续跑日志
+        await asyncio.gather(*consumers, return_exceptions=True)
+        all_written = await asyncio.to_thread(close_result_writers, writers)
+        if journal is not None:
+            journal.close(remove=finished and all_written)
+
+    lark.logger.info("整个论文处理流程已完成")
+
+
+def run_coordinator(options: Optional[RunOptions] = None) -> None:
+    """分布式模式的coordinator：运行两个生产者，把任务写入共享队列，并把worker提交的结果写入飞书
+
+    查重、初筛、续跑日志和多维表格写入都只在coordinator中进行，worker只负责评分。
+
+    Args:
+        options (RunOptions): 运行配置
+    """
+    options = options or RunOptions()
+    if options.arxiv_mode == "batch":
+        lark.logger.warning("分布式模式不支持批量推理，arXiv论文改为由worker实时评分")
+
+    docs = load_rating_docs(options.doc_cache_path)
+    ledger = SeenLedger(options.ledger_path) if options.ledger_path else None
+    prefilter = open_prefilter(options, docs[2])
+    journal = open_run_journal(options)
+    # worker与coordinator读取同一份文档缓存，结果按coordinator加载的文档版本登记
+    writers = open_result_writers(options, ledger, journal, docs)
+    paper_index = PaperIndex(lambda tag, rating_result: writers[tag].add(rating_result))
+
+    work_queue = SQLiteWorkQueue(options.work_queue_path, lease_seconds=options.lease_seconds)
+    # 续跑时也开始新一轮运行，清除上一轮留下的关闭标记
+    work_queue.open_intake(clear=not options.resume)
+    QUEUE_DEPTH.set_function(lambda: work_queue.counts().get("queued", 0))
+    # 续跑时队列中已完成但未取回的结果仍会被collect()取回，未完成的任务保持原状态
+    for item in journal.restore(paper_index) if journal is not None else []:
+        work_queue.enqueue(item)
+
+    def producer(name: str, source) -> None:
+        try:
+            for item in source():
+                if admit_paper(name, item, options, paper_index, ledger, journal, prefilter):
+                    work_queue.enqueue(item)
+                    lark.logger.info(f"{name}爬取到链接并写入共享队列: {item[0]}（date: {item[2]}）")
+            lark.logger.info(f"{name}爬取完成，所有链接已入队")
+        except Exception as e:
+            lark.logger.error(f"{name}爬取线程出错: {e}")
+
+    arxiv_source, hf_source = open_paper_sources(options)
+    producer_threads = [
+        threading.Thread(target=producer, args=("Arxiv", arxiv_source), name="arxiv-producer"),
+        threading.Thread(target=producer, args=("Hugging Face", hf_source), name="hf-producer"),
+    ]
+    for t in producer_threads:
+        t.start()
+    lark.logger.info(f"coordinator已启动，共享队列: {options.work_queue_path}")
+
+    # 生产者结束后关闭入口，之后队列排空且结果全部取回即结束
+    intake_closed = False
+    while True:
+        for link, result in work_queue.collect():
+            paper_index.complete(link, result)
+            if journal is not None:
+                journal.done(link, result)
+        if intake_closed and work_queue.drained():
+            # drained()之前提交的结果可能还没取回
+            for link, result in work_queue.collect():
+                paper_index.complete(link, result)
+                if journal is not None:
+                    journal.done(link, result)
+            break
+        if not intake_closed and not any(t.is_alive() for t in producer_threads):
+            work_queue.close_intake()
+            intake_closed = True
+            lark.logger.info(f"所有生产者线程已完成爬取，等待worker评分：{work_queue.counts()}")
+            continue
+        time.sleep(WORK_QUEUE_POLL_INTERVAL)
+    work_queue.finish_run()
+    lark.logger.info(f"共享队列中所有任务已处理完毕：{work_queue.counts()}")
+    work_queue.close()
+
+    all_written = close_result_writers(writers)
+    if journal is not None:
+        journal.close(remove=all_written)
+    lark.logger.info("整个论文处理流程已完成")
+
+
+def run_worker(options: Optional[RunOptions] = None) -> None:
+    """分布式模式的worker：从共享队列租出任务评分并提交结果，队列排空且coordinator的生产者结束后退出
+
+    每个worker进程内有options.concurrency个评分线程，共享一个自适应限流器；
+    评分期间后台线程定期续租，进程被杀后租约到期，任务由其他worker重新评分。
+
+    Args:
+        options (RunOptions): 运行配置
+    """
+    options = options or RunOptions()
+    thread_count = options.concurrency or DEFAULT_CONSUMER_COUNT
+    worker_id = options.worker_id or f"{socket.gethostname()}-{os.getpid()}"
+
+    sop_content, tag_content, relevance_content = load_rating_docs(options.doc_cache_path)
+    cache = open_rating_cache(options.cache_path, sop_content, tag_content, relevance_content)
+    limiter = AdaptiveLimiter(initial_limit=INITIAL_LLM_CONCURRENCY, max_limit=thread_count)
+    cascade = open_cascade(options, AdaptiveLimiter(initial_limit=INITIAL_LLM_CONCURRENCY, max_limit=thread_count))
+    tail = open_tail_control(options)
+    work_queue = SQLiteWorkQueue(options.work_queue_path, lease_seconds=options.lease_seconds)
+
+    in_flight = set()
+    in_flight_lock = threading.Lock()
+    stopped = threading.Event()
+    # worker可能先于coordinator启动，此时队列里还是上一轮已结束的运行，要等新一轮运行开始后才信任drained()
+    stale_epoch = work_queue.finished_epoch()
+
+    def heartbeat() -> None:
+        # 续租间隔取租约的三分之一，一两次续租失败也不会丢失租约
+        while not stopped.wait(options.lease_seconds / 3):
+            with in_flight_lock:
+                task_ids = list(in_flight)
+            try:
+                work_queue.renew(worker_id, task_ids)
+            except Exception as e:
+                lark.logger.warning(f"worker {worker_id}续租失败: {e}")
+
+    def rater() -> None:
+        while True:
+            leased = work_queue.lease(worker_id, options.batch_size)
+            if not leased:
+                if work_queue.drained_since(stale_epoch):
+                    return
+                time.sleep(WORK_QUEUE_POLL_INTERVAL)
+                continue
+            task_ids = [task_id for task_id, _ in leased]
+            with in_flight_lock:
+                in_flight.update(task_ids)
+            try:
+                items = [item for _, item in leased]
+                try:
+                    rating_results = rate_task_items(
+                        items, sop_content, tag_content, relevance_content, limiter, cache, cascade, tail
+                    )
+                except Exception as e:
+                    lark.logger.error(f"worker评分出错: {e}")
+                    rating_results = {}
+                for task_id, item in leased:
+                    work_queue.complete(task_id, worker_id, rating_results.get(item[0]))
+                    lark.logger.info(f"worker完成链接（tag={item[1]}）: {item[0]}")
+            finally:
+                with in_flight_lock:
+                    in_flight.difference_update(task_ids)
 
-    # 5. 等待所有消费者线程退出
-    for t in consumer_threads:
+    heartbeat_thread = threading.Thread(target=heartbeat, name="lease-heartbeat", daemon=True)
+    heartbeat_thread.start()
+    rater_threads = [threading.Thread(target=rater, name=f"worker-{i}") for i in range(thread_count)]
+    for t in rater_threads:
+        t.start()
+    lark.logger.info(f"worker {worker_id}已启动{thread_count}个评分线程，共享队列: {options.work_queue_path}")
+    for t in rater_threads:
         t.join()
-    lark.logger.info("所有消费者线程已退出")
+    stopped.set()
+    work_queue.close()
+    lark.logger.info(f"worker {worker_id}：共享队列已排空，退出")
 
-    # 6. 最终结果处理（保存到飞书/本地等）
-    lark.logger.info(f"处理完成：arxiv共{len(arxiv_results)}篇，hf共{len(hf_results)}篇")
 
-    # 保存arxiv结果到飞书多维表格（假设函数已定义）
-    if arxiv_results:
-        arxiv_results.append(dict())
-        save_to_feishu_duowei(arxiv_results, ARXIV_TABLE_ID)
-        lark.logger.info(f"已保存{len(arxiv_results)-1}条arxiv结果到飞书")
-    else:
-        lark.logger.warning("未获取到有效arxiv结果")
+def run_rescore(options: Optional[RunOptions] = None) -> None:
+    """评分文档修改后只重评受影响的历史论文，并原地更新多维表格中的已有记录
 
-    # 保存hf结果到飞书多维表格
-    if hf_results:
-        hf_results.append(dict())
-        save_to_feishu_duowei(hf_results, HUGGING_FACE_TABLE_ID)
-        lark.logger.info(f"已保存{len(hf_results)-1}条hf结果到飞书")
-    else:
-        lark.logger.warning("未获取到有效hf结果")
+    台账中登记了每条记录的record_id、岗位tag和评分时的文档版本。与当前文档比较后，
+    引用了被修改tag的论文、以及（SOP或相关性文档修改时）分数在阈值附近的论文会被重评，
+    其余记录直接登记为当前版本下仍然有效。同一篇论文在两个表中的记录只评分一次。
+    只有登记了record_id的记录（即开始记录record_id之后写入的结果）可以重评。
+
+    Args:
+        options (RunOptions): 运行配置，评分并发上限取options.concurrency
+    """
+    options = options or RunOptions()
+    if not options.ledger_path:
+        raise ValueError("重评需要评分台账，请不要关闭--ledger-path")
+    concurrency = options.concurrency or DEFAULT_CONSUMER_COUNT
+
+    docs = load_rating_docs(options.doc_cache_path)
+    sop_content, tag_content, relevance_content = docs
+    ledger = SeenLedger(options.ledger_path)
+    try:
+        docs_hash = hash_documents(*docs)
+        ledger.save_docs(docs_hash, *docs)
+        records = ledger.stale_records(docs_hash)
+        if not records:
+            lark.logger.info("所有记录都是用当前版本的评分文档评出的，无需重评")
+            return
+        selected, unaffected = select_for_rescore(
+            records, ledger.get_docs, docs, options.rescore_thresholds, options.rescore_band
+        )
+        reasons = Counter(reason for _, reason in selected)
+        lark.logger.info(
+            f"共{len(records)}条记录使用旧版本评分文档，需要重评{len(selected)}条（{dict(reasons)}），"
+            f"{len(unaffected)}条不受影响"
+        )
+        if options.rescore_dry_run:
+            for record, reason in selected:
+                lark.logger.info(
+                    f"[{reason}] {record['link']}（tag={record['tag']}，score={record['score']}，"
+                    f"{record['tag_primary']}/{record['tag_secondary']}）"
+                )
+            return
+        ledger.revalidate(((record["paper_id"], record["tag"]) for record in unaffected), docs_hash)
+
+        papers: Dict[str, List[Dict[str, Any]]] = {}
+        for record, _ in selected:
+            papers.setdefault(record["paper_id"], []).append(record)
 
-    lark.logger.info("整个论文处理流程已完成") 
+        cache = open_rating_cache(options.cache_path, sop_content, tag_content, relevance_content)
+        limiter = AdaptiveLimiter(initial_limit=INITIAL_LLM_CONCURRENCY, max_limit=concurrency)
+        tail = open_tail_control(options)
+        writers = open_result_writers(options, ledger, docs=docs, update=True)
+
+        def rescore(group: List[Dict[str, Any]]) -> bool:
+            first = group[0]
+            paper = PaperRecord.from_dict(first["paper"]) if first["paper"] else None
+            result = rate_papers(
+                sop_content=sop_content,
+                tag_content=tag_content,
+                date_str=first["date"],
+                link=first["link"],
+                relevance_content=relevance_content,
+                limiter=limiter,
+                cache=cache,
+                paper=paper,
+                # 快速模型的初筛结果没有tag，原地覆盖后台账里的tag为空，按tag挑选时再也选不中这篇论文
+                cascade=None,
+                tail=tail,
+            )
+            if not result:
+                # 台账中的文档版本不变，下次重评时仍会被选中
+                lark.logger.warning(f"重评失败，保留原记录: {first['link']}")
+                return False
+            for record in group:
+                updated = dict(result, date=record["date"])
+                updated[RECORD_ID_KEY] = record["record_id"]
+                writers[record["tag"]].add(updated)
+            return True
+
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="rescore") as executor:
+            rescored = sum(executor.map(rescore, papers.values()))
+        all_written = close_result_writers(writers)
+        lark.logger.info(
+            f"重评完成：{len(papers)}篇论文中{rescored}篇重评成功，"
+            f"{'全部' if all_written else '部分'}记录已原地更新"
+        )
+    finally:
+        ledger.close()
+
+
+def parse_date(value: str) -> str:
+    """命令行日期参数，校验格式后原样返回YYYY-MM-DD字符串"""
+    try:
+        datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"日期格式应为YYYY-MM-DD: {value}")
+    return value
 
 
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="批量爬取论文并调用大模型评分，结果写入飞书多维表格")
+    parser.add_argument(
+        "--engine",
+        choices=("async", "thread"),
+        default="async",
+        help="评分流水线实现：async为asyncio引擎，thread为原有的线程池（兜底方案）",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=None,
+        help=f"评分请求的并发上限（限流器在此范围内自适应调整），默认async为{DEFAULT_ASYNC_CONCURRENCY}，thread为{DEFAULT_CONSUMER_COUNT}",
+    )
+    parser.add_argument(
+        "--cache-path",
+        default=DEFAULT_RATING_CACHE_PATH,
+        help="评分结果缓存文件路径，相同论文+模型+评分文档不会重复调用大模型",
+    )
+    parser.add_argument("--no-cache", action="store_true", help="不读取也不写入评分缓存")
+    parser.add_argument(
+        "--doc-cache-path",
+        default=DEFAULT_DOC_CACHE_PATH,
+        help="SOP/岗位tag/相关性文档的本地缓存路径，文档未修改时不重新拉取全文",
+    )
+    parser.add_argument("--no-doc-cache", action="store_true", help="每次运行都重新拉取评分文档全文")
+    parser.add_argument(
+        "--ledger-path",
+        default=DEFAULT_LEDGER_PATH,
+        help="已评分论文台账路径，生产者入队前据此跳过历史上已评分的论文",
+    )
+    parser.add_argument("--force", action="store_true", help="忽略台账，重新评分历史上已评分过的论文")
+    parser.add_argument("--journal-path", default=DEFAULT_JOURNAL_PATH, help="断点续跑日志路径")
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="从续跑日志恢复上次中断的运行：跳过已完成的链接，其余重新入队",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=None,
+        help="在本地该端口上提供Prometheus文本格式的指标（/metrics），默认不开启",
+    )
+    parser.add_argument(
+        "--write-chunk-size",
+        type=int,
+        default=DEFAULT_WRITE_CHUNK_SIZE,
+        help="评分过程中每凑满多少条结果写入一次多维表格",
+    )
+    parser.add_argument(
+        "--write-flush-interval",
+        type=float,
+        default=DEFAULT_WRITE_FLUSH_INTERVAL,
+        help="结果不满一批时最长等待多少秒写入多维表格",
+    )
+    parser.add_argument(
+        "--queue-capacity",
+        type=int,
+        default=DEFAULT_QUEUE_CAPACITY,
+        help="待评分任务队列的容量，队列满时爬取暂停；Hugging Face论文总是优先评分",
+    )
+    parser.add_argument(
+        "--prefilter-threshold",
+        type=float,
+        default=None,
+        help="用研究相关性文档对arXiv论文标题+摘要做本地TF-IDF初筛，相似度（0~1）低于该值的论文不调用大模型；默认不初筛",
+    )
+    parser.add_argument(
+        "--prefilter-mode",
+        choices=PREFILTER_MODES,
+        default="drop",
+        help="未达初筛阈值的论文：drop直接跳过，deprioritize排到最后评分",
+    )
+    parser.add_argument(
+        "--cascade-model",
+        default=DEFAULT_CASCADE_MODEL,
+        help="两级评分：先用该快速模型根据摘要打分，只有候选论文才交给思考模型；默认取环境变量CASCADE_MODEL，为空时不启用",
+    )
+    parser.add_argument(
+        "--cascade-escalate-score",
+        type=float,
+        default=DEFAULT_CASCADE_ESCALATE_SCORE,
+        help="快速模型打分达到该值的论文交给思考模型复评",
+    )
+    parser.add_argument(
+        "--cascade-min-confidence",
+        type=float,
+        default=DEFAULT_CASCADE_MIN_CONFIDENCE,
+        help="快速模型对分数的把握（0~1）低于该值时交给思考模型复评",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1,
+        help="每次请求最多合并评分的论文数（只合并带标题和摘要的arXiv论文），SOP系统提示只发送一次；默认1为逐篇评分",
+    )
+    parser.add_argument(
+        "--arxiv-mode",
+        choices=("online", "batch"),
+        default="online",
+        help="arXiv论文的评分方式：online实时评分；batch写入JSONL请求文件提交批量推理，等待结果后写回（HF论文始终实时评分）",
+    )
+    parser.add_argument(
+        "--batch-backend",
+        choices=("ark", "local"),
+        default="ark",
+        help=f"批量推理服务：ark为OpenAI兼容的Batch API（{ARK_BATCH_BASE_URL}，可用环境变量ARK_BATCH_BASE_URL修改），local为本地文件替身",
+    )
+    parser.add_argument("--batch-request-path", default=DEFAULT_BATCH_REQUEST_PATH, help="批量推理请求文件路径")
+    parser.add_argument(
+        "--batch-poll-interval",
+        type=float,
+        default=DEFAULT_BATCH_POLL_INTERVAL,
+        help="查询批量推理任务状态的间隔（秒）",
+    )
+    parser.add_argument("--batch-model", default=None, help="批量推理使用的模型ID，默认与实时评分相同")
+    parser.add_argument(
+        "--role",
+        choices=("single", "coordinator", "worker"),
+        default="single",
+        help="single为单进程运行；分布式模式下coordinator爬取并写入飞书，任意数量的worker进程从共享队列租任务评分",
+    )
+    parser.add_argument("--work-queue-path", default=DEFAULT_WORK_QUEUE_PATH, help="分布式模式的共享任务队列（SQLite文件）路径")
+    parser.add_argument(
+        "--lease-seconds",
+        type=float,
+        default=DEFAULT_LEASE_SECONDS,
+        help=f"worker租约时长，worker退出后超过该时间未续租的任务重新入队（默认{DEFAULT_LEASE_SECONDS:g}）",
+    )
+    parser.add_argument("--worker-id", default=None, help="worker标识，默认为主机名-进程号")
+    parser.add_argument(
+        "--start-date",
+        type=parse_date,
+        default=None,
+        help="补跑的开始日期(YYYY-MM-DD)：爬取该日期起每个工作日的HF每日论文和arXiv提交周期，默认只爬上一个工作日",
+    )
+    parser.add_argument("--end-date", type=parse_date, default=None, help="补跑的结束日期(YYYY-MM-DD)，包含当天，默认与--start-date相同")
+    parser.add_argument(
+        "--rating-timeout",
+        type=float,
+        default=DEFAULT_RATING_TIMEOUT,
+        help=f"单次评分请求的超时秒数，超时后重试（默认{DEFAULT_RATING_TIMEOUT:g}）",
+    )
+    parser.add_argument(
+        "--hedge-percentile",
+        type=float,
+        default=None,
+        help="请求耗时超过近期延迟的该分位数（如0.95）仍未返回时再发一次请求，先返回的生效；默认不对冲",
+    )
+    parser.add_argument(
+        "--breaker-failure-ratio",
+        type=float,
+        default=DEFAULT_BREAKER_FAILURE_RATIO,
+        help=f"最近{DEFAULT_BREAKER_WINDOW}次评分请求的失败比例达到该值时暂停发送，0为不熔断（默认{DEFAULT_BREAKER_FAILURE_RATIO}）",
+    )
+    parser.add_argument(
+        "--breaker-cooldown",
+        type=float,
+        default=DEFAULT_BREAKER_COOLDOWN,
+        help=f"熔断后暂停的秒数，之后放行一个探测请求（默认{DEFAULT_BREAKER_COOLDOWN:g}）",
+    )
+    parser.add_argument(
+        "--rescore",
+        action="store_true",
+        help="评分文档修改后只重评受影响的历史论文（引用了被修改tag、或分数在阈值附近），并原地更新多维表格记录",
+    )
+    parser.add_argument(
+        "--rescore-thresholds",
+        type=float,
+        nargs="+",
+        default=list(DEFAULT_SCORE_THRESHOLDS),
+        help=f"重评时的分数阈值（默认{' '.join(f'{t:g}' for t in DEFAULT_SCORE_THRESHOLDS)}）",
+    )
+    parser.add_argument(
+        "--rescore-band",
+        type=float,
+        default=DEFAULT_SCORE_BAND,
+        help=f"SOP或相关性文档修改时，重评分数在阈值±该值以内的论文（默认{DEFAULT_SCORE_BAND:g}）",
+    )
+    parser.add_argument("--rescore-dry-run", action="store_true", help="只列出需要重评的论文，不评分也不更新表格")
+    args = parser.parse_args(argv)
+    if args.end_date and not args.start_date:
+        parser.error("--end-date需要与--start-date一起使用")
+    if args.start_date and args.end_date and args.end_date < args.start_date:
+        parser.error("--end-date不能早于--start-date")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    options = RunOptions(
+        concurrency=args.concurrency,
+        cache_path=None if args.no_cache else args.cache_path,
+        doc_cache_path=None if args.no_doc_cache else args.doc_cache_path,
+        ledger_path=args.ledger_path,
+        force=args.force,
+        journal_path=args.journal_path,
+        resume=args.resume,
+        write_chunk_size=args.write_chunk_size,
+        write_flush_interval=args.write_flush_interval,
+        queue_capacity=args.queue_capacity,
+        prefilter_threshold=args.prefilter_threshold,
+        prefilter_mode=args.prefilter_mode,
+        cascade_model=args.cascade_model,
+        cascade_escalate_score=args.cascade_escalate_score,
+        cascade_min_confidence=args.cascade_min_confidence,
+        batch_size=max(1, args.batch_size),
+        arxiv_mode=args.arxiv_mode,
+        batch_backend=args.batch_backend,
+        batch_request_path=args.batch_request_path,
+        batch_poll_interval=args.batch_poll_interval,
+        batch_model=args.batch_model,
+        rating_timeout=args.rating_timeout,
+        hedge_percentile=args.hedge_percentile,
+        breaker_failure_ratio=args.breaker_failure_ratio,
+        breaker_cooldown=args.breaker_cooldown,
+        role=args.role,
+        work_queue_path=args.work_queue_path,
+        lease_seconds=args.lease_seconds,
+        worker_id=args.worker_id,
+        start_date=args.start_date,
+        end_date=args.end_date,
+        rescore_thresholds=tuple(args.rescore_thresholds),
+        rescore_band=args.rescore_band,
+        rescore_dry_run=args.rescore_dry_run,
+    )
+    if args.metrics_port is not None:
+        start_metrics_server(args.metrics_port)
+
+    start = time.monotonic()
+    try:
+        if args.rescore:
+            run_rescore(options)
+        elif args.role == "coordinator":
+            run_coordinator(options)
+        elif args.role == "worker":
+            run_worker(options)
+        elif args.engine == "thread":
+            run_threaded(options)
+        else:
+            asyncio.run(run_async(options))
+    finally:
+        elapsed = time.monotonic() - start
+        lark.logger.info(f"运行耗时{elapsed:.1f}秒，指标汇总：\n{REGISTRY.summary(elapsed)}")
+
 
 if __name__ == "__main__":
     main()
-
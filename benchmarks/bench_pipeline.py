@@ -0,0 +1,320 @@
+"""评分流水线的离线端到端压测
+
+在子进程中启动fake_services.py，把Ark、飞书、arXiv、HF的地址全部指向它，
+然后在本进程内运行batch_rate_papers.main()，结束后输出吞吐、单篇评分延迟分位数、
+峰值RSS和大模型调用次数。不需要网络，也不会消耗任何真实接口额度：
+
+    python benchmarks/bench_pipeline.py --engine async --concurrency 100 --arxiv-papers 500 --llm-429-rate 0.05
+
+--pipeline-args 之后的参数原样传给batch_rate_papers.main()，例如用本地批量推理替身评arXiv论文：
+
+    python benchmarks/bench_pipeline.py --pipeline-args --arxiv-mode batch --batch-backend local --batch-poll-interval 1
+
+--workers N 时本进程以coordinator角色运行，另起N个worker子进程从共享队列评分（分布式模式），
+--kill-worker-after 会在指定秒数后杀掉第一个worker，检验租约到期后任务能否被其他worker接手：
+
+    python benchmarks/bench_pipeline.py --workers 3 --kill-worker-after 3 --pipeline-args --lease-seconds 5
+
+补跑一周的论文（--vary-by-day让替身服务每天返回不同的论文）：
+
+    python benchmarks/bench_pipeline.py --vary-by-day --pipeline-args --start-date 2026-10-05 --end-date 2026-10-09
+
+--rescore-tags/--rescore-sop 会在评分结束后修改岗位tag文档中这些tag的说明（或SOP），
+再以--rescore运行一次，报告重评的大模型调用次数和原地更新的记录数：
+
+    python benchmarks/bench_pipeline.py --rescore-tags tag-3 --rescore-sop
+"""
+import argparse
+import contextvars
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+
+# 替身服务接受的参数，原样透传给fake_services.py
+FAKE_SERVICE_ARGS = (
+    "arxiv_papers",
+    "hf_papers",
+    "hf_overlap",
+    "llm_latency_ms",
+    "llm_latency_sigma",
+    "llm_error_rate",
+    "llm_429_rate",
+    "llm_stall_rate",
+    "llm_stall_seconds",
+    "llm_batch_malformed_rate",
+    "llm_max_concurrency",
+    "feishu_latency_ms",
+    "feishu_error_rate",
+    "arxiv_offtopic_rate",
+    "arxiv_latency_ms",
+    "hf_latency_ms",
+    "doc_revision",
+    "seed",
+)
+# 开关类参数，为True时传给替身服务
+FAKE_SERVICE_FLAGS = ("vary_by_day",)
+
+
+def parse_args(argv=None):
+    sys.path.insert(0, BENCH_DIR)
+    from fake_services import build_parser
+
+    parser = build_parser()
+    parser.description = "评分流水线离线压测"
+    parser.add_argument("--engine", choices=("async", "thread"), default="async")
+    parser.add_argument("--concurrency", type=int, default=None)
+    parser.add_argument("--json", action="store_true", help="以JSON格式输出报告")
+    parser.add_argument("--workers", type=int, default=0, help="分布式模式的worker进程数，0为单进程运行")
+    parser.add_argument("--kill-worker-after", type=float, default=None, help="多少秒后杀掉第一个worker进程")
+    parser.add_argument("--rescore-tags", nargs="*", default=[], help="评分后修改岗位tag文档中这些tag的说明，再运行一次重评")
+    parser.add_argument("--rescore-sop", action="store_true", help="评分后修改SOP文档，再运行一次重评")
+    parser.add_argument("--pipeline-args", nargs=argparse.REMAINDER, default=[], help="透传给batch_rate_papers.main()的其余参数")
+    return parser.parse_args(argv)
+
+
+def start_fake_services(args) -> tuple:
+    command = [sys.executable, os.path.join(BENCH_DIR, "fake_services.py"), "--port", "0"]
+    for name in FAKE_SERVICE_ARGS:
+        command += [f"--{name.replace('_', '-')}", str(getattr(args, name))]
+    command += [f"--{name.replace('_', '-')}" for name in FAKE_SERVICE_FLAGS if getattr(args, name)]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline().strip()
+    if not line.startswith("READY "):
+        process.kill()
+        raise RuntimeError(f"替身服务启动失败: {line}")
+    return process, f"http://127.0.0.1:{line.split()[1]}"
+
+
+def install_fake_environment(base_url: str, workdir: str) -> None:
+    """把所有外部服务地址指向替身服务，并在workdir中生成一份假的constants.py"""
+    os.environ["FEISHU_BASE_URL"] = base_url
+    os.environ["HF_BASE_URL"] = base_url
+    os.environ["ARXIV_QUERY_URL_FORMAT"] = f"{base_url}/api/query?{{}}"
+    # 替身服务不需要遵守arXiv的请求间隔
+    os.environ["ARXIV_REQUEST_INTERVAL"] = "0"
+    os.environ["ARK_BOTS_BASE_URL"] = f"{base_url}/api/v3/bots"
+
+    with open(os.path.join(workdir, "constants.py"), "w", encoding="utf-8") as f:
+        for name in ("APP_ID", "APP_SECRET", "ARK_API_KEY", "BOT_ID", "TABLE_APP_TOKEN", "SHEET_TOKEN", "SHEET_ID"):
+            f.write(f'{name} = "bench-{name.lower()}"\n')
+        f.write('RATING_SOP_DOC_TOKEN = "bench-sop"\n')
+        f.write('JOB_TAG_DOC_TOKEN = "bench-tag"\n')
+        f.write('RELEVANCE_DOC_TOKEN = "bench-relevance"\n')
+        f.write('HUGGING_FACE_TABLE_ID = "bench-hf-table"\n')
+        f.write('ARXIV_TABLE_ID = "bench-arxiv-table"\n')
+    # 放在仓库目录之前，保证导入的是这份假配置而不是真实的constants.py
+    sys.path.insert(0, workdir)
+
+
+def start_workers(count: int, pipeline_args: list, workdir: str) -> list:
+    """启动worker子进程，环境变量和假配置与本进程相同，日志写入workdir"""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([workdir, REPO_DIR]))
+    workers = []
+    for i in range(count):
+        log = open(os.path.join(workdir, f"worker-{i}.log"), "w", encoding="utf-8")
+        command = [sys.executable, os.path.join(REPO_DIR, "batch_rate_papers.py"), *pipeline_args]
+        command += ["--role", "worker", "--worker-id", f"bench-worker-{i}"]
+        workers.append(subprocess.Popen(command, cwd=REPO_DIR, env=env, stdout=log, stderr=subprocess.STDOUT))
+    return workers
+
+
+def edit_documents(base_url: str, tags: list, sop: bool) -> None:
+    """修改替身服务中的评分文档，模拟HR编辑SOP或岗位tag文档"""
+    from fake_services import document_content
+
+    edits = {}
+    if tags:
+        lines = [
+            f"{line}（已修订）" if any(line.startswith(f"{tag}:") for tag in tags) else line
+            for line in document_content("bench-tag").splitlines()
+        ]
+        edits["bench-tag"] = "\n".join(lines) + "\n"
+    if sop:
+        edits["bench-sop"] = document_content("bench-sop") + "score candidates conservatively\n"
+    for doc_token, content in edits.items():
+        request = urllib.request.Request(
+            f"{base_url}/_docs/{doc_token}",
+            data=json.dumps({"content": content}).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+        urllib.request.urlopen(request).close()
+
+
+def fetch_stats(base_url: str) -> dict:
+    with urllib.request.urlopen(f"{base_url}/_stats") as response:
+        return json.loads(response.read())
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def instrument_rating(batch_rate_papers, latencies: list) -> None:
+    """记录每篇论文从开始评分到拿到结果（含重试）的耗时；批量评分时本批每篇论文记一次批次耗时"""
+    sync_rate, async_rate = batch_rate_papers.rate_papers, batch_rate_papers.async_rate_papers
+    sync_batch, async_batch = batch_rate_papers.rate_paper_batch, batch_rate_papers.async_rate_paper_batch
+    # 批量评分内部逐篇回退时不重复计数
+    in_batch = contextvars.ContextVar("in_batch", default=False)
+
+    def record(start: float, count: int = 1) -> None:
+        latencies.extend([time.perf_counter() - start] * count)
+
+    def rate_papers(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return sync_rate(*args, **kwargs)
+        finally:
+            if not in_batch.get():
+                record(start)
+
+    async def async_rate_papers(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await async_rate(*args, **kwargs)
+        finally:
+            if not in_batch.get():
+                record(start)
+
+    def rate_paper_batch(*args, **kwargs):
+        start = time.perf_counter()
+        token = in_batch.set(True)
+        try:
+            return sync_batch(*args, **kwargs)
+        finally:
+            in_batch.reset(token)
+            record(start, len(kwargs["items"]))
+
+    async def async_rate_paper_batch(*args, **kwargs):
+        start = time.perf_counter()
+        token = in_batch.set(True)
+        try:
+            return await async_batch(*args, **kwargs)
+        finally:
+            in_batch.reset(token)
+            record(start, len(kwargs["items"]))
+
+    batch_rate_papers.rate_papers = rate_papers
+    batch_rate_papers.async_rate_papers = async_rate_papers
+    batch_rate_papers.rate_paper_batch = rate_paper_batch
+    batch_rate_papers.async_rate_paper_batch = async_rate_paper_batch
+
+
+def run(args) -> dict:
+    process, base_url = start_fake_services(args)
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    try:
+        sys.path.insert(0, REPO_DIR)
+        install_fake_environment(base_url, workdir)
+        import batch_rate_papers
+
+        latencies = []
+        instrument_rating(batch_rate_papers, latencies)
+
+        pipeline_args = [
+            "--engine", args.engine,
+            "--cache-path", os.path.join(workdir, "rating_cache.sqlite3"),
+            "--doc-cache-path", os.path.join(workdir, "feishu_docs.json"),
+            "--ledger-path", os.path.join(workdir, "seen_papers.sqlite3"),
+            "--journal-path", os.path.join(workdir, "run_journal.jsonl"),
+            "--batch-request-path", os.path.join(workdir, "batch_requests.jsonl"),
+        ]
+        if args.concurrency:
+            pipeline_args += ["--concurrency", str(args.concurrency)]
+        pipeline_args += args.pipeline_args
+
+        start = time.perf_counter()
+        if args.workers:
+            pipeline_args += ["--work-queue-path", os.path.join(workdir, "work_queue.sqlite3")]
+            workers = start_workers(args.workers, pipeline_args, workdir)
+            killer = None
+            if args.kill_worker_after is not None:
+                killer = threading.Timer(args.kill_worker_after, workers[0].kill)
+                killer.start()
+            batch_rate_papers.main(pipeline_args + ["--role", "coordinator"])
+            if killer is not None:
+                killer.cancel()
+            for worker in workers:
+                worker.wait()
+        else:
+            batch_rate_papers.main(pipeline_args)
+        elapsed = time.perf_counter() - start
+        stats = fetch_stats(base_url)
+        # 重评阶段的评分延迟也会记入latencies，只统计首次运行的部分
+        latencies_rated = len(latencies)
+
+        rescore = None
+        if args.rescore_tags or args.rescore_sop:
+            edit_documents(base_url, args.rescore_tags, args.rescore_sop)
+            rescore_start = time.perf_counter()
+            batch_rate_papers.main(pipeline_args + ["--rescore"])
+            rescore_stats = fetch_stats(base_url)
+            rescore = {
+                "elapsed_s": round(time.perf_counter() - rescore_start, 3),
+                "papers_rescored": len(latencies) - latencies_rated,
+                "llm_calls": rescore_stats.get("llm_calls", 0) - stats.get("llm_calls", 0),
+                "records_updated": rescore_stats.get("bitable_records_updated", 0),
+            }
+    finally:
+        process.kill()
+        process.wait()
+
+    # Linux上ru_maxrss单位为KB，macOS上为字节
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_rss_mb = max_rss / (1024 * 1024) if sys.platform == "darwin" else max_rss / 1024
+    latencies = latencies[:latencies_rated]
+    papers_rated = len(latencies)
+    if args.workers:
+        # 评分发生在worker进程中，本进程无法统计单篇延迟，评分数取共享队列中完成的任务数
+        from work_queue import SQLiteWorkQueue
+
+        work_queue = SQLiteWorkQueue(os.path.join(workdir, "work_queue.sqlite3"))
+        papers_rated = work_queue.counts().get("done", 0)
+        work_queue.close()
+    return {
+        "engine": "distributed" if args.workers else args.engine,
+        "papers_rated": papers_rated,
+        "elapsed_s": round(elapsed, 3),
+        "papers_per_s": round(papers_rated / elapsed, 2) if elapsed else 0.0,
+        "latency_p50_s": round(percentile(latencies, 50), 3),
+        "latency_p95_s": round(percentile(latencies, 95), 3),
+        "latency_p99_s": round(percentile(latencies, 99), 3),
+        "peak_rss_mb": round(peak_rss_mb, 1),
+        "llm_calls": stats.get("llm_calls", 0),
+        "llm_429": stats.get("llm_429", 0),
+        "llm_500": stats.get("llm_500", 0),
+        "bitable_records": stats.get("bitable_records", 0),
+        "service_stats": stats,
+        **({"rescore": rescore} if rescore else {}),
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run(args)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+    print("\n========== 压测结果 ==========")
+    for key, value in report.items():
+        if key not in ("service_stats", "rescore"):
+            print(f"{key:>16}: {value}")
+    print(f"{'service_stats':>16}: {json.dumps(report['service_stats'], ensure_ascii=False)}")
+    if "rescore" in report:
+        print(f"{'rescore':>16}: {json.dumps(report['rescore'], ensure_ascii=False)}")
+
+
+if __name__ == "__main__":
+    main()
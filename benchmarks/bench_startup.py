@@ -0,0 +1,96 @@
+"""评分入口的启动耗时压测
+
+在全新的子进程中导入batch_rate_papers并解析命令行参数，重复若干次取中位数，
+同时列出导入阶段被加载的重量级SDK。这些SDK应该在真正用到时才导入，
+短时间运行的定时任务和测试不需要为它们付出导入时间：
+
+    python benchmarks/bench_startup.py --runs 5 --max-import-seconds 0.5
+
+超过--max-import-seconds或导入阶段加载了重量级SDK时以非零状态码退出，可以放进CI。
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+
+# 只应在对应功能被用到时才导入的模块
+HEAVY_MODULES = ("lark_oapi", "openai", "arxiv", "bs4")
+
+CHILD_CODE = """
+import json, sys, time
+start = time.perf_counter()
+import batch_rate_papers
+imported = time.perf_counter()
+batch_rate_papers.parse_args([])
+parsed = time.perf_counter()
+print(json.dumps({
+    "import_s": imported - start,
+    "parse_args_s": parsed - imported,
+    "heavy_modules": [name for name in %r if name in sys.modules],
+}))
+""" % (HEAVY_MODULES,)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="重复次数，取中位数")
+    parser.add_argument("--max-import-seconds", type=float, default=None, help="导入耗时中位数的上限，超过时返回非零状态码")
+    parser.add_argument("--json", action="store_true", help="以JSON格式输出报告")
+    return parser.parse_args(argv)
+
+
+def run_once(env: dict) -> dict:
+    start = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD_CODE],
+        cwd=REPO_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    report = json.loads(output.strip().splitlines()[-1])
+    report["process_s"] = time.perf_counter() - start
+    return report
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    sys.path.insert(0, BENCH_DIR)
+    from bench_pipeline import install_fake_environment
+
+    workdir = tempfile.mkdtemp(prefix="bench-startup-")
+    # 不会发出任何请求，地址只需要合法
+    install_fake_environment("http://127.0.0.1:9", workdir)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([workdir, REPO_DIR]))
+
+    runs = [run_once(env) for _ in range(max(1, args.runs))]
+    report = {
+        "runs": len(runs),
+        "import_median_s": round(statistics.median(run["import_s"] for run in runs), 3),
+        "parse_args_median_s": round(statistics.median(run["parse_args_s"] for run in runs), 4),
+        "process_median_s": round(statistics.median(run["process_s"] for run in runs), 3),
+        "heavy_modules": sorted({name for run in runs for name in run["heavy_modules"]}),
+    }
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        for key, value in report.items():
+            print(f"{key}: {value}")
+
+    failed = bool(report["heavy_modules"])
+    if args.max_import_seconds is not None and report["import_median_s"] > args.max_import_seconds:
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,420 @@
+"""本地替身服务：在一个HTTP端口上模拟Ark bots、飞书、arXiv API和Hugging Face Daily Papers
+
+用于离线压测评分流水线，不消耗任何真实接口额度。单独运行：
+
+    python benchmarks/fake_services.py --arxiv-papers 500 --llm-latency-ms 800 --llm-429-rate 0.05
+
+启动后在标准输出打印一行 "READY <port>"，GET /_stats 返回各接口的调用次数。
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from xml.sax.saxutils import escape
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="评分流水线的本地替身服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0, help="监听端口，0为随机端口")
+    parser.add_argument("--arxiv-papers", type=int, default=300, help="arXiv查询返回的论文数量")
+    parser.add_argument("--hf-papers", type=int, default=40, help="HF每日论文页面的论文数量")
+    parser.add_argument("--hf-overlap", type=float, default=0.5, help="HF论文中同时出现在arXiv结果里的比例")
+    parser.add_argument("--llm-latency-ms", type=float, default=500.0, help="评分接口延迟的中位数（毫秒）")
+    parser.add_argument("--llm-latency-sigma", type=float, default=0.5, help="评分接口延迟的对数正态分布sigma，越大长尾越重")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="评分接口返回500的概率")
+    parser.add_argument("--llm-stall-rate", type=float, default=0.0, help="评分请求卡住的概率，用于模拟长尾")
+    parser.add_argument("--llm-stall-seconds", type=float, default=120.0, help="卡住的评分请求的延迟（秒）")
+    parser.add_argument("--llm-429-rate", type=float, default=0.0, help="评分接口返回429的概率")
+    parser.add_argument("--llm-batch-malformed-rate", type=float, default=0.0, help="批量评分响应中漏掉一篇论文的概率")
+    parser.add_argument("--llm-max-concurrency", type=int, default=0, help="评分接口的并发上限，超过时返回429，0为不限")
+    parser.add_argument("--feishu-latency-ms", type=float, default=50.0, help="飞书接口延迟（毫秒）")
+    parser.add_argument("--feishu-error-rate", type=float, default=0.0, help="多维表格写入失败的概率")
+    parser.add_argument("--arxiv-offtopic-rate", type=float, default=0.5, help="arXiv论文中与研究相关性文档无关的比例")
+    parser.add_argument("--arxiv-latency-ms", type=float, default=200.0, help="arXiv每页查询延迟（毫秒）")
+    parser.add_argument("--hf-latency-ms", type=float, default=200.0, help="HF页面延迟（毫秒）")
+    parser.add_argument("--doc-revision", type=int, default=1, help="飞书文档返回的revision_id")
+    parser.add_argument("--vary-by-day", action="store_true", help="每天返回不同的论文（补跑多天的压测用），默认每天相同")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser
+
+
+def make_paper_ids(config) -> tuple:
+    """生成arXiv和HF两个来源的论文ID，HF中有hf_overlap比例与arXiv重复"""
+    arxiv_ids = [f"2501.{i:05d}" for i in range(config.arxiv_papers)]
+    overlap = min(int(config.hf_papers * config.hf_overlap), len(arxiv_ids))
+    hf_ids = arxiv_ids[:overlap] + [f"2412.{i:05d}" for i in range(config.hf_papers - overlap)]
+    return arxiv_ids, hf_ids
+
+
+def paper_id_for_day(config, arxiv_id: str, day) -> str:
+    """--vary-by-day时把论文ID的年月部分换成按日期变化的值，使每天的论文互不相同"""
+    if not config.vary_by_day:
+        return arxiv_id
+    return f"{arxiv_id[:2]}{day.toordinal() % 100:02d}{arxiv_id[4:]}"
+
+
+class FakeState:
+    def __init__(self, config):
+        self.config = config
+        self.random = random.Random(config.seed)
+        self.lock = threading.Lock()
+        self.stats = {}
+        self.llm_in_flight = 0
+        self.arxiv_ids, self.hf_ids = make_paper_ids(config)
+        # 通过POST /_docs/{doc_token}修改过的文档内容，以及各文档被修改的次数（累加到revision_id上）
+        self.docs = {}
+        self.doc_edits = {}
+
+    def count(self, key: str) -> None:
+        with self.lock:
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+    def roll(self, probability: float) -> bool:
+        with self.lock:
+            return self.random.random() < probability
+
+    def llm_latency(self) -> float:
+        with self.lock:
+            return self.random.lognormvariate(0, self.config.llm_latency_sigma) * self.config.llm_latency_ms / 1000
+
+
+def document_content(doc_token: str) -> str:
+    """飞书文档的默认内容；岗位tag文档每行一个tag，与rating_content产出的tag对应"""
+    content = f"# {doc_token}\n\nlarge language model agents reasoning benchmark evaluation\n"
+    if "tag" in doc_token:
+        content += "".join(f"tag-{i}: research direction {i}\n" for i in range(7))
+    return content
+
+
+def rating_content(paper_text: str) -> str:
+    """根据论文内容生成稳定的评分JSON"""
+    digest = int(hashlib.md5(paper_text.encode("utf-8")).hexdigest(), 16)
+    return json.dumps(
+        {
+            "score": digest % 10 + 1,
+            "summary": "benchmark summary",
+            "tag_primary": f"tag-{digest % 7}",
+            "contact_tag_primary": "",
+            "tag_secondary": f"tag-{digest % 5}",
+            "contact_tag_secondary": "",
+            "是否有华人": "否",
+        },
+        ensure_ascii=False,
+    )
+
+
+# 研究相关性文档覆盖的主题，以及与之无关的主题
+ON_TOPIC_ABSTRACTS = (
+    "We study large language model agents that plan and use tools, with a reasoning benchmark for evaluation.",
+    "A benchmark for evaluating reasoning of large language models on multi-step math problems.",
+)
+OFF_TOPIC_ABSTRACTS = (
+    "We present a control policy for traffic signals at urban intersections using queue length sensors.",
+    "Protein structure prediction with geometric graph networks trained on crystallography data.",
+    "A survey of wireless spectrum allocation for satellite communication networks.",
+)
+
+
+def arxiv_abstract(state: FakeState, arxiv_id: str) -> str:
+    """按论文ID稳定地决定摘要主题"""
+    digest = int(hashlib.md5(arxiv_id.encode("utf-8")).hexdigest(), 16)
+    if digest % 1000 < state.config.arxiv_offtopic_rate * 1000:
+        return OFF_TOPIC_ABSTRACTS[digest % len(OFF_TOPIC_ABSTRACTS)]
+    return ON_TOPIC_ABSTRACTS[digest % len(ON_TOPIC_ABSTRACTS)]
+
+
+def arxiv_window_ids(state: FakeState, search_query: str) -> list:
+    """按search_query中的submittedDate:[A TO B]过滤论文
+
+    每篇论文在一天中有固定的提交时刻（均匀分布在24小时内），某一天的该时刻落在[A, B)内即命中，
+    因此把一个时间段切成首尾相接的小窗口查询时，每天的论文恰好出现一次。
+    """
+    match = re.search(r"submittedDate:\[(\d{12}) TO (\d{12})\]", search_query)
+    if not match:
+        return state.arxiv_ids
+    window_start, window_end = (datetime.strptime(value, "%Y%m%d%H%M") for value in match.groups())
+    day_start = window_start.replace(hour=0, minute=0)
+    total = max(len(state.arxiv_ids), 1)
+    ids = []
+    for index, arxiv_id in enumerate(state.arxiv_ids):
+        submitted = day_start + timedelta(minutes=index * 1440 / total)
+        if submitted < window_start:
+            submitted += timedelta(days=1)
+        if submitted < window_end:
+            ids.append(paper_id_for_day(state.config, arxiv_id, submitted.date()))
+    return ids
+
+
+def batch_rating_content(state: FakeState, paper_text: str) -> str:
+    """批量评分的输出：按"论文ID："切分用户消息，每篇论文一个带id的评分对象"""
+    blocks = re.split(r"(?=\[\d+\] 论文ID：)", paper_text)
+    entries = []
+    for block in blocks:
+        match = re.match(r"\[\d+\] 论文ID：(\S+)\n", block)
+        if match:
+            entry = json.loads(rating_content(block[match.end():].strip()))
+            entries.append({"id": match.group(1), **entry})
+    if entries and state.roll(state.config.llm_batch_malformed_rate):
+        state.count("llm_batch_malformed")
+        entries.pop()
+    return json.dumps(entries, ensure_ascii=False)
+
+
+def triage_content(paper_text: str) -> str:
+    """两级评分中快速模型的输出：与rating_content同一篇论文分数一致，并给出把握程度"""
+    digest = int(hashlib.md5(paper_text.encode("utf-8")).hexdigest(), 16)
+    return json.dumps(
+        {"score": digest % 10 + 1, "confidence": round(0.5 + (digest >> 8) % 50 / 100, 2), "summary": "benchmark triage"},
+        ensure_ascii=False,
+    )
+
+
+def arxiv_feed(state: FakeState, search_query: str, start: int, max_results: int) -> str:
+    now = datetime.now(timezone.utc) - timedelta(days=1)
+    arxiv_ids = arxiv_window_ids(state, search_query)
+    entries = []
+    for offset, arxiv_id in enumerate(arxiv_ids[start:start + max_results]):
+        published = (now - timedelta(minutes=start + offset)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        entries.append(
+            f"""<entry>
+<id>http://arxiv.org/abs/{arxiv_id}v1</id>
+<updated>{published}</updated>
+<published>{published}</published>
+<title>Benchmark paper {arxiv_id}</title>
+<summary>{escape(arxiv_abstract(state, arxiv_id))}</summary>
+<author><name>Author {arxiv_id}</name></author>
+<link href="http://arxiv.org/abs/{arxiv_id}v1" rel="alternate" type="text/html"/>
+<link title="pdf" href="http://arxiv.org/pdf/{arxiv_id}v1" rel="related" type="application/pdf"/>
+<arxiv:primary_category term="cs.AI" scheme="http://arxiv.org/schemas/atom"/>
+<category term="cs.AI" scheme="http://arxiv.org/schemas/atom"/>
+</entry>"""
+        )
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom" xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/" xmlns:arxiv="http://arxiv.org/schemas/atom">
+<title>arXiv Query</title>
+<id>http://arxiv.org/api/fake</id>
+<updated>{now.strftime("%Y-%m-%dT%H:%M:%SZ")}</updated>
+<opensearch:totalResults>{len(arxiv_ids)}</opensearch:totalResults>
+<opensearch:startIndex>{start}</opensearch:startIndex>
+<opensearch:itemsPerPage>{max_results}</opensearch:itemsPerPage>
+{"".join(entries)}
+</feed>"""
+
+
+def make_handler(state: FakeState):
+    config = state.config
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status: int, body, content_type: str = "application/json", headers: dict = None) -> None:
+            if not isinstance(body, (bytes, str)):
+                body = json.dumps(body, ensure_ascii=False)
+            if isinstance(body, str):
+                body = body.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _body(self) -> dict:
+            length = int(self.headers.get("Content-Length") or 0)
+            data = self.rfile.read(length) if length else b""
+            try:
+                return json.loads(data or b"{}")
+            except json.JSONDecodeError:
+                return {}
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+
+            if url.path == "/_stats":
+                with state.lock:
+                    return self._send(200, dict(state.stats))
+
+            if url.path.startswith("/api/query"):
+                state.count("arxiv_pages")
+                time.sleep(config.arxiv_latency_ms / 1000)
+                start = int(query.get("start", ["0"])[0])
+                max_results = int(query.get("max_results", ["100"])[0])
+                search_query = query.get("search_query", [""])[0]
+                return self._send(200, arxiv_feed(state, search_query, start, max_results), "application/atom+xml")
+
+            if url.path.startswith("/papers/date/"):
+                state.count("hf_pages")
+                time.sleep(config.hf_latency_ms / 1000)
+                day = datetime.strptime(url.path.rsplit("/", 1)[-1], "%Y-%m-%d").date()
+                hf_ids = [paper_id_for_day(config, arxiv_id, day) for arxiv_id in state.hf_ids]
+                links = "".join(
+                    f'<a href="/papers/{arxiv_id}">Paper {arxiv_id}</a><a href="/papers/{arxiv_id}#community">discuss</a>'
+                    for arxiv_id in hf_ids
+                )
+                return self._send(200, f"<html><body>{links}</body></html>", "text/html")
+
+            if url.path == "/open-apis/docs/v1/content":
+                state.count("feishu_docs")
+                time.sleep(config.feishu_latency_ms / 1000)
+                doc_token = query.get("doc_token", [""])[0]
+                with state.lock:
+                    content = state.docs.get(doc_token) or document_content(doc_token)
+                return self._send(200, {"code": 0, "msg": "success", "data": {"content": content}})
+
+            if url.path.startswith("/open-apis/docx/v1/documents/"):
+                state.count("feishu_doc_revisions")
+                time.sleep(config.feishu_latency_ms / 1000)
+                document_id = url.path.rsplit("/", 1)[-1]
+                revision = config.doc_revision + state.doc_edits.get(document_id, 0)
+                document = {"document_id": document_id, "revision_id": revision, "title": document_id}
+                return self._send(200, {"code": 0, "msg": "success", "data": {"document": document}})
+
+            if url.path.startswith("/open-apis/sheets/v2/spreadsheets/"):
+                state.count("feishu_sheets_read")
+                time.sleep(config.feishu_latency_ms / 1000)
+                return self._send(200, {"code": 0, "data": {"valueRange": {"values": []}}})
+
+            self._send(404, {"code": 404, "msg": f"unknown path {url.path}"})
+
+        def do_PUT(self):
+            url = urlparse(self.path)
+            self._body()
+            if url.path.startswith("/open-apis/sheets/v2/spreadsheets/"):
+                state.count("feishu_sheets_write")
+                time.sleep(config.feishu_latency_ms / 1000)
+                return self._send(200, {"code": 0, "msg": "success", "data": {}})
+            self._send(404, {"code": 404, "msg": f"unknown path {url.path}"})
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            body = self._body()
+
+            if url.path.endswith("/chat/completions"):
+                return self._chat_completion(body)
+
+            if url.path == "/open-apis/auth/v3/app_access_token/internal":
+                state.count("feishu_auth")
+                time.sleep(config.feishu_latency_ms / 1000)
+                return self._send(200, {"code": 0, "msg": "ok", "app_access_token": "fake-token", "expire": 7200})
+
+            if url.path.startswith("/_docs/"):
+                # 压测用：修改一篇文档的内容，revision_id随之加一
+                doc_token = url.path.rsplit("/", 1)[-1]
+                with state.lock:
+                    state.docs[doc_token] = body["content"]
+                    state.doc_edits[doc_token] = state.doc_edits.get(doc_token, 0) + 1
+                return self._send(200, {"code": 0, "msg": "success"})
+
+            if re.match(r"^/open-apis/bitable/v1/apps/[^/]+/tables/[^/]+/records/batch_update$", url.path):
+                state.count("bitable_batch_update")
+                time.sleep(config.feishu_latency_ms / 1000)
+                if state.roll(config.feishu_error_rate):
+                    return self._send(200, {"code": 1254000, "msg": "injected bitable error"})
+                records = body.get("records", [])
+                with state.lock:
+                    state.stats["bitable_records_updated"] = state.stats.get("bitable_records_updated", 0) + len(records)
+                return self._send(200, {"code": 0, "msg": "success", "data": {"records": records}})
+
+            match = re.match(r"^/open-apis/bitable/v1/apps/[^/]+/tables/([^/]+)/records/batch_create$", url.path)
+            if match:
+                state.count("bitable_batch_create")
+                time.sleep(config.feishu_latency_ms / 1000)
+                if state.roll(config.feishu_error_rate):
+                    return self._send(200, {"code": 1254000, "msg": "injected bitable error"})
+                records = body.get("records", [])
+                with state.lock:
+                    state.stats["bitable_records"] = state.stats.get("bitable_records", 0) + len(records)
+                created = [
+                    {"record_id": f"rec{state.random.getrandbits(32):08x}", "fields": record.get("fields", {})}
+                    for record in records
+                ]
+                return self._send(200, {"code": 0, "msg": "success", "data": {"records": created}})
+
+            self._send(404, {"code": 404, "msg": f"unknown path {url.path}"})
+
+        def _chat_completion(self, body: dict):
+            # 模型名中带fast的视为两级评分中的快速模型：延迟更低、输出更短
+            fast = "fast" in str(body.get("model", ""))
+            state.count("llm_fast_calls" if fast else "llm_calls")
+            with state.lock:
+                state.llm_in_flight += 1
+                in_flight = state.llm_in_flight
+            try:
+                if config.llm_max_concurrency and in_flight > config.llm_max_concurrency:
+                    state.count("llm_429")
+                    return self._send(429, {"error": {"message": "too many concurrent requests", "type": "rate_limit"}}, headers={"Retry-After": "1"})
+                if state.roll(config.llm_429_rate):
+                    state.count("llm_429")
+                    return self._send(429, {"error": {"message": "injected rate limit", "type": "rate_limit"}})
+                if state.roll(config.llm_stall_rate):
+                    state.count("llm_stalled")
+                    time.sleep(config.llm_stall_seconds)
+                else:
+                    time.sleep(state.llm_latency() / (5 if fast else 1))
+                if state.roll(config.llm_error_rate):
+                    state.count("llm_500")
+                    return self._send(500, {"error": {"message": "injected server error", "type": "server_error"}})
+
+                messages = body.get("messages", [])
+                paper_text = messages[-1].get("content", "") if messages else ""
+                prompt_tokens = sum(len(str(m.get("content", ""))) for m in messages) // 4
+                if fast:
+                    content = triage_content(paper_text)
+                elif "论文ID：" in paper_text:
+                    state.count("llm_batch_calls")
+                    content = batch_rating_content(state, paper_text)
+                else:
+                    content = rating_content(paper_text)
+                completion_tokens = len(content) // 4
+                with state.lock:
+                    state.stats["llm_prompt_tokens"] = state.stats.get("llm_prompt_tokens", 0) + prompt_tokens
+                    state.stats["llm_completion_tokens"] = state.stats.get("llm_completion_tokens", 0) + completion_tokens
+                return self._send(
+                    200,
+                    {
+                        "id": "chatcmpl-fake",
+                        "object": "chat.completion",
+                        "created": int(time.time()),
+                        "model": body.get("model", "fake"),
+                        "choices": [
+                            {
+                                "index": 0,
+                                "message": {"role": "assistant", "content": f"```json\n{content}\n```"},
+                                "finish_reason": "stop",
+                            }
+                        ],
+                        "usage": {
+                            "prompt_tokens": prompt_tokens,
+                            "completion_tokens": completion_tokens,
+                            "total_tokens": prompt_tokens + completion_tokens,
+                        },
+                    },
+                )
+            finally:
+                with state.lock:
+                    state.llm_in_flight -= 1
+
+    return Handler
+
+
+def serve(config) -> None:
+    server = ThreadingHTTPServer((config.host, config.port), make_handler(FakeState(config)))
+    server.daemon_threads = True
+    print(f"READY {server.server_address[1]}", flush=True)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    serve(build_parser().parse_args())
@@ -0,0 +1,517 @@
+import asyncio
+import collections
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Optional, Tuple
+
+from lazy_imports import LazyModule, lark
+
+from metrics import CIRCUIT_BREAKER_OPENS, HEDGED_REQUESTS, LLM_LATENCY, LLM_REQUESTS, RETRIES
+
+
+# openai只在真正发生错误、需要判断错误类型时才导入
+openai = LazyModule("openai")
+
+
+def throttle_errors() -> tuple:
+    """限流/超时类错误：需要收缩并发"""
+    return (openai.RateLimitError, openai.APITimeoutError)
+
+
+def retryable_errors() -> tuple:
+    """可以重试的错误：限流、超时、连接失败以及服务端5xx"""
+    return throttle_errors() + (openai.APIConnectionError, openai.InternalServerError)
+
+
+class _AIMDController:
+    """AIMD（加性增、乘性减）并发上限计算
+
+    - 请求成功且延迟没有明显上升时，上限每个"窗口"约增加1
+    - 请求成功但延迟超过基线的latency_tolerance倍时，上限保持不变
+    - 遇到429或超时时，上限乘以backoff_ratio；同一波拥塞只收缩一次
+    """
+
+    def __init__(
+        self,
+        initial_limit: int = 8,
+        min_limit: int = 1,
+        max_limit: int = 200,
+        backoff_ratio: float = 0.5,
+        latency_tolerance: float = 2.0,
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max(max_limit, min_limit)
+        self.backoff_ratio = backoff_ratio
+        self.latency_tolerance = latency_tolerance
+        self._limit = float(min(max(initial_limit, min_limit), self.max_limit))
+        self._baseline_latency = None
+        self._last_decrease = 0.0
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def _record_success(self, latency: float) -> None:
+        # 基线延迟取观测到的最小值，并缓慢向上漂移以适应模型整体变慢
+        if self._baseline_latency is None or latency < self._baseline_latency:
+            self._baseline_latency = latency
+        else:
+            self._baseline_latency += (latency - self._baseline_latency) * 0.01
+
+        if latency <= self._baseline_latency * self.latency_tolerance:
+            self._limit = min(self.max_limit, self._limit + 1.0 / max(self._limit, 1.0))
+
+    def _record_throttle(self, latency: Optional[float] = None) -> None:
+        now = time.monotonic()
+        # 在途请求几乎同时返回429时只收缩一次，避免上限被一次拥塞打到底
+        cooldown = self._baseline_latency or 1.0
+        if now - self._last_decrease < cooldown:
+            return
+        self._last_decrease = now
+        self._limit = max(self.min_limit, self._limit * self.backoff_ratio)
+        lark.logger.warning(f"大模型接口限流/超时，并发上限调整为{self.limit}")
+
+
+class AdaptiveLimiter(_AIMDController):
+    """线程版自适应并发限制器，用于同步OpenAI client"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cond = threading.Condition()
+        self._in_flight = 0
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def acquire(self) -> None:
+        with self._cond:
+            while self._in_flight >= self.limit:
+                self._cond.wait()
+            self._in_flight += 1
+
+    def try_acquire(self) -> bool:
+        """有空闲名额时占用一个并返回True，否则立即返回False"""
+        with self._cond:
+            if self._in_flight >= self.limit:
+                return False
+            self._in_flight += 1
+            return True
+
+    def release(self) -> None:
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def on_success(self, latency: float) -> None:
+        with self._cond:
+            self._record_success(latency)
+            self._cond.notify_all()
+
+    def on_throttle(self, latency: Optional[float] = None) -> None:
+        with self._cond:
+            self._record_throttle(latency)
+
+
+class AsyncAdaptiveLimiter(_AIMDController):
+    """协程版自适应并发限制器，用于AsyncOpenAI client"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cond = asyncio.Condition()
+        self._in_flight = 0
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    async def acquire(self) -> None:
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._in_flight < self.limit)
+            self._in_flight += 1
+
+    def try_acquire(self) -> bool:
+        """有空闲名额时占用一个并返回True，否则立即返回False（在事件循环内调用，无需加锁）"""
+        if self._in_flight >= self.limit:
+            return False
+        self._in_flight += 1
+        return True
+
+    async def release(self) -> None:
+        async with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    async def on_success(self, latency: float) -> None:
+        async with self._cond:
+            self._record_success(latency)
+            self._cond.notify_all()
+
+    async def on_throttle(self, latency: Optional[float] = None) -> None:
+        async with self._cond:
+            self._record_throttle(latency)
+
+
+class Hedger:
+    """对冲请求策略：一次请求耗时超过近期延迟的percentile分位数仍未返回时，再发一次相同的请求
+
+    两个请求谁先成功用谁，另一个被取消。为了不放大负载，对冲请求数不超过总请求数的max_ratio。
+    同步请求在Hedger自己的线程池中执行，线程数应不少于调用线程数的两倍，否则原请求会在池中排队而触发多余的对冲。
+
+    Args:
+        percentile (float): 触发对冲的延迟分位数，如0.95
+        min_samples (int): 样本数不足时不对冲
+        max_ratio (float): 对冲请求占总请求的比例上限
+        window (int): 参与计算分位数的最近成功请求数
+        max_workers (int): 同步对冲线程池的线程数
+    """
+
+    def __init__(
+        self,
+        percentile: float = 0.95,
+        min_samples: int = 20,
+        max_ratio: float = 0.1,
+        window: int = 500,
+        max_workers: int = 64,
+    ):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.max_ratio = max_ratio
+        self.max_workers = max_workers
+        self._latencies = collections.deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._calls = 0
+        self._hedges = 0
+        self._executor = None
+
+    def record(self, latency: float) -> None:
+        with self._lock:
+            self._latencies.append(latency)
+
+    def delay(self) -> Optional[float]:
+        """本次请求在多少秒后发出对冲请求，None表示不对冲"""
+        with self._lock:
+            self._calls += 1
+            if len(self._latencies) < self.min_samples or self._hedges >= self._calls * self.max_ratio:
+                return None
+            ordered = sorted(self._latencies)
+            return ordered[min(len(ordered) - 1, int(self.percentile * len(ordered)))]
+
+    def on_hedge(self) -> None:
+        with self._lock:
+            self._hedges += 1
+
+    def executor(self) -> ThreadPoolExecutor:
+        """同步对冲请求的线程池，第一次使用时创建；被放弃的请求无法中断，会在达到客户端超时前自行结束"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="hedge")
+            return self._executor
+
+
+def _release_when_all_done(futures: list, release: Callable) -> None:
+    """所有future结束（包括被取消）后调用一次release"""
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def on_done(_) -> None:
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            release()
+
+    for future in futures:
+        future.add_done_callback(on_done)
+
+
+def hedged_call(fn: Callable, hedger: Optional[Hedger] = None, limiter: Optional[AdaptiveLimiter] = None):
+    """调用fn，必要时发出对冲请求，返回先成功的结果；两个请求都失败时抛出原请求的异常
+
+    调用方已为原请求占用limiter的一个名额；对冲请求另占一个名额，没有空闲名额时不对冲。
+    这个名额在两个请求都结束后才释放，被放弃的请求仍在运行时也计入在途请求。
+    """
+    delay = hedger.delay() if hedger else None
+    if delay is None:
+        return fn()
+    executor = hedger.executor()
+    primary = executor.submit(fn)
+    done, _ = wait([primary], timeout=delay)
+    if done:
+        return primary.result()
+    if limiter and not limiter.try_acquire():
+        return primary.result()
+    hedger.on_hedge()
+    hedge = executor.submit(fn)
+    if limiter:
+        _release_when_all_done([primary, hedge], limiter.release)
+    pending, error = {primary, hedge}, None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                HEDGED_REQUESTS.inc(winner="hedge" if future is hedge else "primary")
+                for other in pending:
+                    other.cancel()
+                return future.result()
+            if error is None or future is primary:
+                error = future.exception()
+    raise error
+
+
+async def async_hedged_call(
+    fn: Callable, hedger: Optional[Hedger] = None, limiter: Optional[AsyncAdaptiveLimiter] = None
+):
+    """hedged_call的协程版本，落后的请求会被真正取消；对冲请求同样另占limiter的一个名额"""
+    delay = hedger.delay() if hedger else None
+    if delay is None:
+        return await fn()
+    primary = asyncio.ensure_future(fn())
+    hedge, pending, error = None, {primary}, None
+    try:
+        done, pending = await asyncio.wait(pending, timeout=delay)
+        if done:
+            return primary.result()
+        if limiter and not limiter.try_acquire():
+            return await primary
+        hedger.on_hedge()
+        hedge = asyncio.ensure_future(fn())
+        pending.add(hedge)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    HEDGED_REQUESTS.inc(winner="hedge" if task is hedge else "primary")
+                    return task.result()
+                if error is None or task is primary:
+                    error = task.exception()
+        raise error
+    finally:
+        # 调用方被取消时也要取消在途的请求
+        for task in pending:
+            task.cancel()
+        if hedge is not None and limiter:
+            await limiter.release()
+
+
+class CircuitBreaker:
+    """熔断器：最近的请求中失败比例过高时暂停发送请求
+
+    - closed：正常发送，记录最近window次请求的成败
+    - open：失败比例达到failure_ratio后打开，cooldown秒内所有请求等待
+    - half-open：冷却结束后只放行一个探测请求，成功则关闭，失败则重新打开
+
+    Args:
+        failure_ratio (float): 打开熔断器的失败比例，<=0时不熔断
+        window (int): 统计失败比例的最近请求数
+        min_requests (int): 请求数不足时不熔断
+        cooldown (float): 打开后暂停的秒数
+    """
+
+    def __init__(self, failure_ratio: float = 0.5, window: int = 20, min_requests: int = 10, cooldown: float = 30.0):
+        self.failure_ratio = failure_ratio
+        self.min_requests = min_requests
+        self.cooldown = cooldown
+        self._outcomes = collections.deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._opened_at = None
+        self._probing = False
+
+    def _wait_time(self) -> Tuple[float, bool]:
+        """本次请求还需要等待的秒数（0表示可以发送），以及放行的是否是探测请求"""
+        with self._lock:
+            if self._opened_at is None:
+                return 0.0, False
+            remaining = self._opened_at + self.cooldown - time.monotonic()
+            if remaining > 0:
+                return remaining, False
+            # 冷却结束：只放行一个探测请求，其余请求继续等待探测结果
+            if not self._probing:
+                self._probing = True
+                return 0.0, True
+            return 1.0, False
+
+    def wait(self) -> bool:
+        """等待直到可以发送请求
+
+        Returns:
+            bool: True表示本次请求是半开状态下的探测请求，调用方必须用record()给出结论
+        """
+        while True:
+            delay, probe = self._wait_time()
+            if delay <= 0:
+                return probe
+            time.sleep(min(delay, 1.0))
+
+    async def async_wait(self) -> bool:
+        """wait的协程版本"""
+        while True:
+            delay, probe = self._wait_time()
+            if delay <= 0:
+                return probe
+            await asyncio.sleep(min(delay, 1.0))
+
+    def record(self, success: bool, probe: bool = False) -> None:
+        """记录一次请求的成败
+
+        Args:
+            success (bool): 请求是否成功
+            probe (bool): 是否是wait()放行的探测请求；打开期间只有探测请求的结果会关闭或重新打开熔断器，
+                打开前发出、打开后才返回的请求结果被忽略
+        """
+        with self._lock:
+            if self._opened_at is not None:
+                if probe and self._probing:
+                    self._probing = False
+                    if success:
+                        self._opened_at = None
+                        self._outcomes.clear()
+                        lark.logger.warning("熔断器探测请求成功，恢复发送评分请求")
+                    else:
+                        self._opened_at = time.monotonic()
+                return
+            self._outcomes.append(success)
+            failures = self._outcomes.count(False)
+            if (
+                self.failure_ratio > 0
+                and len(self._outcomes) >= self.min_requests
+                and failures >= self.failure_ratio * len(self._outcomes)
+            ):
+                self._opened_at = time.monotonic()
+                CIRCUIT_BREAKER_OPENS.inc()
+                lark.logger.error(f"最近{len(self._outcomes)}次评分请求中{failures}次失败，熔断器打开，暂停{self.cooldown:.0f}秒")
+
+
+def backoff_delay(attempt: int, error: Exception = None, base_delay: float = 1.0, max_delay: float = 60.0) -> float:
+    """计算第attempt次重试前的等待时间（full jitter指数退避）
+
+    如果服务端通过Retry-After告知了等待时间，则以它为下限。
+    """
+    delay = random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            delay = max(delay, min(float(retry_after), max_delay))
+        except ValueError:
+            pass
+    return delay
+
+
+def call_with_retry(
+    fn: Callable,
+    limiter: Optional[AdaptiveLimiter] = None,
+    max_attempts: int = 6,
+    base_delay: float = 1.0,
+    max_delay: float = 60.0,
+    breaker: Optional[CircuitBreaker] = None,
+    hedger: Optional[Hedger] = None,
+):
+    """在并发限制器下调用fn，限流/超时/5xx时按抖动退避重试，并记录大模型请求指标
+
+    Args:
+        fn (Callable): 无参调用，通常是对client.chat.completions.create的包装
+        limiter (AdaptiveLimiter): 并发限制器，为None时不限流
+        max_attempts (int): 最大尝试次数
+        base_delay (float): 退避基数（秒）
+        max_delay (float): 单次退避上限（秒）
+        breaker (CircuitBreaker): 熔断器，打开期间暂停发送请求
+        hedger (Hedger): 对冲策略，为None时不发对冲请求
+
+    Returns:
+        fn的返回值；重试耗尽时抛出最后一次的异常
+    """
+    for attempt in range(max_attempts):
+        probe = breaker.wait() if breaker else False
+        if limiter:
+            limiter.acquire()
+        start = time.monotonic()
+        try:
+            ret = hedged_call(fn, hedger, limiter)
+        except retryable_errors() as e:
+            latency = time.monotonic() - start
+            LLM_LATENCY.observe(latency)
+            LLM_REQUESTS.inc(outcome=type(e).__name__)
+            if breaker:
+                breaker.record(False, probe)
+            if limiter and isinstance(e, throttle_errors()):
+                limiter.on_throttle(latency)
+            if attempt == max_attempts - 1:
+                raise
+            delay = backoff_delay(attempt, e, base_delay, max_delay)
+            RETRIES.inc(kind="llm")
+            lark.logger.warning(f"大模型调用失败（{type(e).__name__}），{delay:.1f}秒后第{attempt + 1}次重试")
+        except BaseException:
+            # 不可重试的错误和取消不计入失败比例，但探测请求必须有结论，否则其余请求会一直等待
+            if probe:
+                breaker.record(False, probe)
+            raise
+        else:
+            latency = time.monotonic() - start
+            LLM_LATENCY.observe(latency)
+            LLM_REQUESTS.inc(outcome="ok")
+            if breaker:
+                breaker.record(True, probe)
+            if hedger:
+                hedger.record(latency)
+            if limiter:
+                limiter.on_success(latency)
+            return ret
+        finally:
+            if limiter:
+                limiter.release()
+        time.sleep(delay)
+
+
+async def async_call_with_retry(
+    fn: Callable,
+    limiter: Optional[AsyncAdaptiveLimiter] = None,
+    max_attempts: int = 6,
+    base_delay: float = 1.0,
+    max_delay: float = 60.0,
+    breaker: Optional[CircuitBreaker] = None,
+    hedger: Optional[Hedger] = None,
+):
+    """call_with_retry的协程版本，fn返回一个awaitable"""
+    for attempt in range(max_attempts):
+        probe = await breaker.async_wait() if breaker else False
+        if limiter:
+            await limiter.acquire()
+        start = time.monotonic()
+        try:
+            ret = await async_hedged_call(fn, hedger, limiter)
+        except retryable_errors() as e:
+            latency = time.monotonic() - start
+            LLM_LATENCY.observe(latency)
+            LLM_REQUESTS.inc(outcome=type(e).__name__)
+            if breaker:
+                breaker.record(False, probe)
+            if limiter and isinstance(e, throttle_errors()):
+                await limiter.on_throttle(latency)
+            if attempt == max_attempts - 1:
+                raise
+            delay = backoff_delay(attempt, e, base_delay, max_delay)
+            RETRIES.inc(kind="llm")
+            lark.logger.warning(f"大模型调用失败（{type(e).__name__}），{delay:.1f}秒后第{attempt + 1}次重试")
+        except BaseException:
+            # 不可重试的错误和取消不计入失败比例，但探测请求必须有结论，否则其余请求会一直等待
+            if probe:
+                breaker.record(False, probe)
+            raise
+        else:
+            latency = time.monotonic() - start
+            LLM_LATENCY.observe(latency)
+            LLM_REQUESTS.inc(outcome="ok")
+            if breaker:
+                breaker.record(True, probe)
+            if hedger:
+                hedger.record(latency)
+            if limiter:
+                await limiter.on_success(latency)
+            return ret
+        finally:
+            if limiter:
+                await limiter.release()
+        await asyncio.sleep(delay)
@@ -0,0 +1,94 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence
+
+from lazy_imports import lark
+
+from utils import get_feishu_doc_content, get_feishu_doc_revision
+
+
+DEFAULT_DOC_CACHE_PATH = os.path.join(".cache", "feishu_docs.json")
+
+
+def fetch_documents(doc_tokens: Sequence[str], access_token: str) -> List[str]:
+    """并发拉取多篇飞书文档的全文，顺序与doc_tokens一致"""
+    with ThreadPoolExecutor(max_workers=max(1, len(doc_tokens))) as executor:
+        return list(executor.map(lambda token: get_feishu_doc_content(token, access_token), doc_tokens))
+
+
+class FeishuDocCache:
+    """评分文档（SOP/岗位tag/相关性）的本地缓存，按文档token和revision_id失效
+
+    每次加载先并发查询各文档的revision_id（只返回元信息），与本地记录一致的文档直接使用缓存内容，
+    版本变化或没有缓存的文档再并发拉取全文。文档内容没有变化时，启动阶段只需要几次轻量请求。
+
+    Args:
+        path (str): 缓存文件路径
+    """
+
+    def __init__(self, path: str = DEFAULT_DOC_CACHE_PATH):
+        self.path = path
+        # doc_token -> {"revision_id": int, "content": str, "fetched_at": float}
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    self._entries = json.load(f).get("documents", {})
+            except (OSError, ValueError) as e:
+                lark.logger.warning(f"文档缓存{path}读取失败，重新拉取全部文档: {e}")
+
+    def _revision(self, doc_token: str, access_token: str) -> Optional[int]:
+        try:
+            return get_feishu_doc_revision(doc_token, access_token)
+        except Exception as e:
+            lark.logger.warning(f"查询文档{doc_token}版本失败，重新拉取全文: {e}")
+            return None
+
+    def load(self, doc_tokens: Sequence[str], access_token: str) -> List[str]:
+        """返回各文档的最新内容，顺序与doc_tokens一致
+
+        拉取全文失败时，若本地有旧版本则使用旧版本并告警，否则抛出异常。
+        """
+        with ThreadPoolExecutor(max_workers=max(1, len(doc_tokens))) as executor:
+            revisions = list(executor.map(lambda token: self._revision(token, access_token), doc_tokens))
+
+        stale = [
+            (token, revision)
+            for token, revision in zip(doc_tokens, revisions)
+            if revision is None or self._entries.get(token, {}).get("revision_id") != revision
+        ]
+        if stale:
+            with ThreadPoolExecutor(max_workers=len(stale)) as executor:
+                futures = [
+                    (token, revision, executor.submit(get_feishu_doc_content, token, access_token))
+                    for token, revision in stale
+                ]
+            for token, revision, future in futures:
+                try:
+                    content = future.result()
+                except Exception:
+                    if token not in self._entries:
+                        raise
+                    lark.logger.error(f"拉取文档{token}失败，使用本地缓存的版本{self._entries[token].get('revision_id')}")
+                    continue
+                self._entries[token] = {
+                    "revision_id": revision,
+                    "content": content,
+                    "fetched_at": time.time(),
+                }
+            self._save()
+            lark.logger.info(f"已更新{len(stale)}篇评分文档的缓存：{', '.join(token for token, _ in stale)}")
+        else:
+            lark.logger.info(f"{len(doc_tokens)}篇评分文档均未修改，使用本地缓存")
+        return [self._entries[token]["content"] for token in doc_tokens]
+
+    def _save(self) -> None:
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # 多个worker进程可能同时刷新缓存，临时文件按进程区分
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"documents": self._entries}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,115 @@
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from lazy_imports import lark
+
+from utils import PaperRecord, get_arxiv_id
+
+
+DEFAULT_JOURNAL_PATH = os.path.join(".cache", "run_journal.jsonl")
+
+
+class RunJournal:
+    """评分运行的追加式日志，用于进程崩溃后的断点续跑
+
+    每登记一个待评分任务写一行pending，每完成一篇论文写一行done，结果写入飞书后写一行written，
+    每行写入后立即flush。续跑时跳过已写入飞书的任务，先按pending重建论文索引，
+    再用done恢复已有结果，没有done的任务重新入队。
+
+    Args:
+        path (str): 日志文件路径
+        resume (bool): True时保留已有日志用于续跑，False时清空重新开始
+    """
+
+    def __init__(self, path: str = DEFAULT_JOURNAL_PATH, resume: bool = False):
+        self.path = path
+        self._lock = threading.Lock()
+        self._pending: List[Tuple[str, int, str, Optional[PaperRecord]]] = []
+        # arxiv_id -> (link, result)；两个来源的链接写法可能不同，按论文ID对应
+        self._done: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+        self._written = set()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        if resume and os.path.exists(path):
+            self._load()
+        self._file = open(path, "a" if resume else "w", encoding="utf-8")
+        # 上次被杀时最后一行可能没有换行符，补上换行避免和新写入的行粘在一起
+        if resume and self._file.tell() > 0:
+            with open(path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    self._file.write("\n")
+
+    def _load(self) -> None:
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # 进程被杀时最后一行可能只写了一半
+                    lark.logger.warning(f"跳过损坏的日志行: {line[:100]}")
+                    continue
+                if entry["event"] == "pending":
+                    paper = PaperRecord.from_dict(entry["paper"]) if entry.get("paper") else None
+                    self._pending.append((entry["link"], entry["tag"], entry["date"], paper))
+                elif entry["event"] == "done":
+                    self._done[get_arxiv_id(entry["link"])] = (entry["link"], entry["result"])
+                elif entry["event"] == "written":
+                    self._written.add((get_arxiv_id(entry["link"]), entry["tag"]))
+        lark.logger.info(f"已从{self.path}读取{len(self._pending)}条任务，其中{len(self._done)}篇已完成评分")
+
+    def _write(self, entry: Dict[str, Any]) -> None:
+        line = json.dumps(entry, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def pending(self, link: str, tag: int, date: str, paper: Optional[PaperRecord] = None) -> None:
+        """记录一个已登记的任务，论文元数据一并记录，续跑时不必重新爬取"""
+        entry = {"event": "pending", "link": link, "tag": tag, "date": date}
+        if paper is not None:
+            entry["paper"] = paper.to_dict()
+        self._write(entry)
+
+    def done(self, link: str, result: Optional[Dict[str, Any]]) -> None:
+        """记录一篇论文的评分结果，评分失败的论文不记录，续跑时会重新评分"""
+        if result:
+            self._write({"event": "done", "link": link, "result": result})
+
+    def written(self, link: str, tag: int) -> None:
+        """记录一条结果已写入对应来源的多维表格"""
+        self._write({"event": "written", "link": link, "tag": tag})
+
+    def restore(self, paper_index) -> List[Tuple[str, int, str, Optional[PaperRecord]]]:
+        """把日志中的任务和结果恢复到论文索引
+
+        Args:
+            paper_index (PaperIndex): 本次运行的论文索引
+
+        Returns:
+            List[Tuple[str, int, str, Optional[PaperRecord]]]: 需要重新入队评分的(link, tag, date, paper)
+        """
+        requeue = []
+        restored = set()
+        for item in self._pending:
+            # 已写入飞书的结果不再重复写入
+            if (get_arxiv_id(item[0]), item[1]) in self._written:
+                continue
+            restored.add(get_arxiv_id(item[0]))
+            if paper_index.claim(*item[:3]) and get_arxiv_id(item[0]) not in self._done:
+                requeue.append(item)
+        for paper_id, (link, result) in self._done.items():
+            if paper_id in restored:
+                paper_index.complete(link, result)
+        lark.logger.info(f"续跑：恢复{len(self._done)}条已完成结果，重新入队{len(requeue)}条任务")
+        return requeue
+
+    def close(self, remove: bool = False) -> None:
+        """关闭日志；所有结果都成功写入飞书后remove=True删除日志"""
+        with self._lock:
+            self._file.close()
+        if remove and os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,63 @@
+import importlib
+import logging
+import sys
+import threading
+
+
+# 飞书SDK的logger名称和格式，与lark_oapi.core.log保持一致
+LARK_LOGGER_NAME = "Lark"
+LARK_LOG_FORMAT = "[Lark] [%(asctime)s] [%(levelname)s] %(message)s"
+
+
+class LazyModule:
+    """第一次访问属性时才导入的模块代理
+
+    `lark = LazyModule("lark_oapi")`之后，`lark.Client`等写法与`import lark_oapi as lark`相同，
+    只是导入推迟到第一次真正用到的时候。构造时传入的关键字参数作为不触发导入的属性。
+
+    Args:
+        name (str): 模块名
+        **attributes: 不需要导入模块即可访问的属性
+    """
+
+    def __init__(self, name: str, **attributes):
+        self.__name__ = name
+        self._module = None
+        self._lock = threading.Lock()
+        self.__dict__.update(attributes)
+
+    def _load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self.__name__)
+        return self._module
+
+    def __getattr__(self, name: str):
+        return getattr(self._load(), name)
+
+
+def _lark_sdk_loaded(record: logging.LogRecord) -> bool:
+    return "lark_oapi.core.log" not in sys.modules
+
+
+def get_lark_logger() -> logging.Logger:
+    """返回飞书SDK使用的logger，不导入lark_oapi
+
+    lark_oapi在导入时会给同一个logger挂上自己的handler（输出到stdout，默认WARNING级别）。
+    导入之前由这里挂的handler按相同格式输出，导入之后该handler自动静默，避免重复打印。
+    """
+    logger = logging.getLogger(LARK_LOGGER_NAME)
+    if "lark_oapi.core.log" not in sys.modules and not any(
+        _lark_sdk_loaded in handler.filters for handler in logger.handlers
+    ):
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter(LARK_LOG_FORMAT))
+        handler.addFilter(_lark_sdk_loaded)
+        logger.addHandler(handler)
+        logger.setLevel(logging.WARNING)
+    return logger
+
+
+# 导入lark_oapi会加载全部飞书开放平台接口的模型（约2秒），只用logger的模块不需要等它
+lark = LazyModule("lark_oapi", logger=get_lark_logger())
@@ -0,0 +1,182 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from lazy_imports import lark
+
+from utils import get_arxiv_id
+
+
+DEFAULT_LEDGER_PATH = os.path.join(".cache", "seen_papers.sqlite3")
+# 多维表格中记录ID和论文元数据在评分结果中的内部字段（写入表格时会被去掉）
+RECORD_ID_KEY = "_record_id"
+PAPER_KEY = "_paper"
+
+BITABLE_RECORD_COLUMNS = (
+    "paper_id", "tag", "record_id", "link", "date", "score", "tag_primary", "tag_secondary", "paper", "docs_hash", "rated_at"
+)
+
+
+class SeenLedger:
+    """跨天的已评分论文台账，记录论文ID、分数和日期
+
+    打开时把全部论文ID载入内存集合，生产者入队前的查重只是一次集合查找，
+    检查上万条候选ID也只需要毫秒级。本次运行新登记的论文只写入SQLite，
+    不影响本次运行内的查重（同一篇论文仍需分发给两个来源），下次运行才会被跳过。
+
+    同时记录每条结果在多维表格中的record_id、岗位tag和评分时使用的评分文档版本，
+    以及各版本评分文档的内容，评分文档修改后可以只重评受影响的论文并原地更新表格（见rescore.py）。
+
+    Args:
+        path (str): 台账文件路径
+    """
+
+    def __init__(self, path: str = DEFAULT_LEDGER_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS rated_papers (
+                paper_id TEXT PRIMARY KEY,
+                score TEXT,
+                date TEXT,
+                tag INTEGER,
+                rated_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS rated_papers_date ON rated_papers (date)")
+        # 每个来源（tag）各有一条多维表格记录
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS bitable_records (
+                paper_id TEXT NOT NULL,
+                tag INTEGER NOT NULL,
+                record_id TEXT NOT NULL,
+                link TEXT NOT NULL,
+                date TEXT,
+                score TEXT,
+                tag_primary TEXT,
+                tag_secondary TEXT,
+                paper TEXT,
+                docs_hash TEXT,
+                rated_at REAL NOT NULL,
+                PRIMARY KEY (paper_id, tag)
+            )
+            """
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS rating_docs (
+                docs_hash TEXT PRIMARY KEY,
+                sop_content TEXT NOT NULL,
+                tag_content TEXT NOT NULL,
+                relevance_content TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+
+        self._seen = {row[0] for row in self._conn.execute("SELECT paper_id FROM rated_papers")}
+        lark.logger.info(f"已加载评分台账，共{len(self._seen)}篇历史论文")
+
+    def __contains__(self, link: str) -> bool:
+        return get_arxiv_id(link) in self._seen
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def record(self, link: str, tag: int, result: Dict[str, Any], docs_hash: Optional[str] = None) -> None:
+        """记录一篇论文的评分结果
+
+        结果中带有多维表格的record_id时，一并记录该条记录、岗位tag和评分文档版本docs_hash。
+        """
+        paper_id = get_arxiv_id(link)
+        score = None if result.get("score") is None else str(result.get("score"))
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO rated_papers (paper_id, score, date, tag, rated_at) VALUES (?, ?, ?, ?, ?)",
+                (paper_id, score, result.get("date"), tag, now),
+            )
+            if result.get(RECORD_ID_KEY):
+                paper = result.get(PAPER_KEY)
+                self._conn.execute(
+                    f"INSERT OR REPLACE INTO bitable_records ({', '.join(BITABLE_RECORD_COLUMNS)}) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        paper_id,
+                        tag,
+                        result[RECORD_ID_KEY],
+                        link,
+                        result.get("date"),
+                        score,
+                        json.dumps(result.get("tag_primary"), ensure_ascii=False),
+                        json.dumps(result.get("tag_secondary"), ensure_ascii=False),
+                        json.dumps(paper, ensure_ascii=False) if paper else None,
+                        docs_hash,
+                        now,
+                    ),
+                )
+            self._conn.commit()
+
+    def save_docs(self, docs_hash: str, sop_content: str, tag_content: str, relevance_content: str) -> None:
+        """保存一个版本的评分文档，重评时用来和新版本比较"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO rating_docs VALUES (?, ?, ?, ?, ?)",
+                (docs_hash, sop_content, tag_content, relevance_content, time.time()),
+            )
+            self._conn.commit()
+
+    def get_docs(self, docs_hash: str) -> Optional[Tuple[str, str, str]]:
+        """查询某个版本的评分文档(sop_content, tag_content, relevance_content)，没有保存过时返回None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT sop_content, tag_content, relevance_content FROM rating_docs WHERE docs_hash = ?",
+                (docs_hash,),
+            ).fetchone()
+        return tuple(row) if row else None
+
+    def stale_records(self, docs_hash: str) -> List[Dict[str, Any]]:
+        """不是用docs_hash这一版评分文档评出的多维表格记录
+
+        Returns:
+            List[Dict[str, Any]]: 各列组成的字典，tag_primary/tag_secondary/paper已从JSON还原
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(BITABLE_RECORD_COLUMNS)} FROM bitable_records "
+                "WHERE docs_hash IS NULL OR docs_hash != ? ORDER BY rated_at",
+                (docs_hash,),
+            ).fetchall()
+        records = []
+        for row in rows:
+            record = dict(zip(BITABLE_RECORD_COLUMNS, row))
+            for key in ("tag_primary", "tag_secondary", "paper"):
+                record[key] = json.loads(record[key]) if record[key] else None
+            records.append(record)
+        return records
+
+    def revalidate(self, keys: Iterable[Tuple[str, int]], docs_hash: str) -> None:
+        """把不受评分文档修改影响的记录标记为新版本文档下仍然有效，keys为(paper_id, tag)"""
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE bitable_records SET docs_hash = ? WHERE paper_id = ? AND tag = ?",
+                [(docs_hash, paper_id, tag) for paper_id, tag in keys],
+            )
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,255 @@
+import bisect
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional, Tuple
+
+from lazy_imports import lark
+
+
+# 延迟类直方图的默认分桶（秒）
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(labels: Dict[str, str]) -> Tuple[Tuple[str, str], ...]:
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str):
+        super().__init__(name, documentation)
+        self._values: Dict[Tuple[Tuple[str, str], ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+
+class Gauge(_Metric):
+    """可增可减的瞬时值，也可以绑定一个函数在采集时取值（如队列深度）"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str):
+        super().__init__(name, documentation)
+        self._values: Dict[Tuple[Tuple[str, str], ...], float] = {}
+        self._functions: Dict[Tuple[Tuple[str, str], ...], Callable[[], float]] = {}
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, fn: Callable[[], float], **labels) -> None:
+        with self._lock:
+            self._functions[self._key(labels)] = fn
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+            functions = dict(self._functions)
+        for key, fn in functions.items():
+            try:
+                values[key] = fn()
+            except Exception:
+                continue
+        return [(self.name, key, value) for key, value in values.items()]
+
+
+class Histogram(_Metric):
+    """分桶直方图，用于延迟等分布类指标"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [各分桶计数..., +Inf计数, sum]
+        self._values: Dict[Tuple[Tuple[str, str], ...], list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.setdefault(key, [0] * (len(self.buckets) + 2))
+            counts[index] += 1
+            counts[-1] += value
+
+    def time(self, **labels) -> "_Timer":
+        """with HISTOGRAM.time(...): 记录代码块耗时"""
+        return _Timer(self, labels)
+
+    def count(self, **labels) -> int:
+        counts = self._values.get(self._key(labels))
+        return sum(counts[:-1]) if counts else 0
+
+    def quantile(self, q: float, **labels) -> float:
+        """按分桶线性插值估算分位数"""
+        counts = self._values.get(self._key(labels))
+        if not counts:
+            return 0.0
+        total = sum(counts[:-1])
+        target = q * total
+        cumulative = 0
+        lower = 0.0
+        for bound, count in zip(self.buckets + (float("inf"),), counts[:-1]):
+            if count and cumulative + count >= target:
+                if bound == float("inf"):
+                    return lower
+                return lower + (bound - lower) * (target - cumulative) / count
+            cumulative += count
+            lower = bound if bound != float("inf") else lower
+        return lower
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            items = [(key, list(counts)) for key, counts in self._values.items()]
+        for key, counts in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts[:-1]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                samples.append((f"{self.name}_bucket", key + (("le", le),), cumulative))
+            samples.append((f"{self.name}_count", key, cumulative))
+            samples.append((f"{self.name}_sum", key, counts[-1]))
+        return samples
+
+    def label_sets(self):
+        return [dict(key) for key in self._values]
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: Dict[str, str]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.monotonic() - self.start, **self.labels)
+        return False
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str) -> Counter:
+        return self.register(Counter(name, documentation))
+
+    def gauge(self, name: str, documentation: str) -> Gauge:
+        return self.register(Gauge(name, documentation))
+
+    def histogram(self, name: str, documentation: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, buckets))
+
+    def render(self) -> str:
+        """按Prometheus文本格式输出所有指标"""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self, elapsed: Optional[float] = None) -> str:
+        """运行结束时打印的人类可读汇总，给出elapsed时计数器同时显示每秒速率"""
+        lines = []
+        for metric in self._metrics:
+            if isinstance(metric, Histogram):
+                for labels in metric.label_sets():
+                    count = metric.count(**labels)
+                    lines.append(
+                        f"{metric.name}{_format_labels(tuple(sorted(labels.items())))}: "
+                        f"count={count} p50={metric.quantile(0.5, **labels):.3f}s "
+                        f"p95={metric.quantile(0.95, **labels):.3f}s p99={metric.quantile(0.99, **labels):.3f}s"
+                    )
+            else:
+                for name, labels, value in metric.samples():
+                    line = f"{name}{_format_labels(labels)}: {value:g}"
+                    if isinstance(metric, Counter) and elapsed:
+                        line += f" ({value / elapsed:.2f}/s)"
+                    lines.append(line)
+        return "\n".join(lines)
+
+
+REGISTRY = Registry()
+
+# 生产者
+PAPERS_PRODUCED = REGISTRY.counter("papers_produced_total", "生产者爬取到的论文数，按来源区分")
+PAPERS_SKIPPED = REGISTRY.counter("papers_skipped_total", "入队前被跳过的论文数，按原因区分")
+QUEUE_DEPTH = REGISTRY.gauge("task_queue_depth", "任务队列中等待评分的论文数")
+# 大模型
+LLM_LATENCY = REGISTRY.histogram("llm_request_seconds", "单次大模型评分请求耗时")
+LLM_REQUESTS = REGISTRY.counter("llm_requests_total", "大模型评分请求数，按结果区分")
+LLM_TOKENS = REGISTRY.counter("llm_tokens_total", "大模型消耗的token数，按prompt/completion区分")
+RATING_PARSE_FAILURES = REGISTRY.counter("rating_parse_failures_total", "评分结果解析失败次数")
+RATINGS_BY_TIER = REGISTRY.counter("ratings_decided_total", "大模型给出的最终评分数，按决定评分的模型层级（fast/full）区分")
+# 飞书写入
+FEISHU_WRITE_LATENCY = REGISTRY.histogram("feishu_write_seconds", "多维表格单批写入耗时", (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+FEISHU_RECORDS_WRITTEN = REGISTRY.counter("feishu_records_written_total", "成功写入多维表格的记录数")
+# 重试
+RETRIES = REGISTRY.counter("retries_total", "重试次数，按调用类型区分")
+# 长尾控制
+HEDGED_REQUESTS = REGISTRY.counter("llm_hedged_requests_total", "发出的对冲请求数，按先返回的是原请求还是对冲请求区分")
+CIRCUIT_BREAKER_OPENS = REGISTRY.counter("circuit_breaker_open_total", "熔断器打开（暂停发送评分请求）的次数")
+
+
+def start_metrics_server(port: int, host: str = "127.0.0.1", registry: Registry = REGISTRY) -> ThreadingHTTPServer:
+    """在后台线程中启动指标HTTP服务，GET /metrics 返回Prometheus文本格式"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    lark.logger.info(f"指标服务已启动: http://{host}:{server.server_address[1]}/metrics")
+    return server
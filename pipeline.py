@@ -0,0 +1,289 @@
+import asyncio
+import heapq
+import itertools
+import queue
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from lazy_imports import lark
+
+from metrics import FEISHU_RECORDS_WRITTEN, FEISHU_WRITE_LATENCY, RETRIES
+from utils import get_arxiv_id
+
+
+# 多维表格单次batch_create的记录数上限为1000，留出余量
+DEFAULT_WRITE_CHUNK_SIZE = 200
+# 缓冲区中最早的一条结果等待超过该秒数时即使不满一批也写入
+DEFAULT_WRITE_FLUSH_INTERVAL = 30.0
+DEFAULT_WRITE_MAX_ATTEMPTS = 4
+
+# 任务队列容量，生产者在队列满时阻塞，内存占用与爬取量无关
+DEFAULT_QUEUE_CAPACITY = 1000
+# 数值越小越先评分：Hugging Face（tag=1）优先于arXiv（tag=0）
+SOURCE_PRIORITY = {1: 0, 0: 1}
+# 初筛判定为低相关的论文排在其他论文之后
+LOW_PRIORITY = max(SOURCE_PRIORITY.values()) + 1
+# 结束标记排在所有论文之后
+END_OF_STREAM_PRIORITY = LOW_PRIORITY + 1
+# 批量评分时取到第一篇论文后最多再等多少秒凑满一批；生产者边爬边入队，不等待时往往只能取到一篇
+DEFAULT_BATCH_LINGER = 0.05
+
+
+def task_priority(item) -> int:
+    """任务的优先级，item为None时视为结束标记"""
+    if item is None:
+        return END_OF_STREAM_PRIORITY
+    paper = item[3]
+    if paper is not None and paper.low_priority:
+        return LOW_PRIORITY
+    return SOURCE_PRIORITY.get(item[1], LOW_PRIORITY)
+
+
+class PaperTaskQueue(queue.Queue):
+    """线程版有界优先任务队列
+
+    put/get的用法与queue.Queue相同，内部按(优先级, 入队序号, item)排序：
+    同一优先级内保持先进先出，Hugging Face论文总是排在arXiv论文之前。
+
+    Args:
+        maxsize (int): 队列容量，满时put阻塞；<=0表示不限
+    """
+
+    def _init(self, maxsize):
+        self.queue = []
+        self._seq = itertools.count()
+
+    def _qsize(self):
+        return len(self.queue)
+
+    def _put(self, item):
+        heapq.heappush(self.queue, (task_priority(item), next(self._seq), item))
+
+    def _get(self):
+        return heapq.heappop(self.queue)[2]
+
+
+class AsyncPaperTaskQueue(asyncio.Queue):
+    """PaperTaskQueue的asyncio版本"""
+
+    def _init(self, maxsize):
+        self._queue = []
+        self._seq = itertools.count()
+
+    def _put(self, item):
+        heapq.heappush(self._queue, (task_priority(item), next(self._seq), item))
+
+    def _get(self):
+        return heapq.heappop(self._queue)[2]
+
+
+def take_tasks(task_queue: PaperTaskQueue, max_items: int = 1, linger: float = DEFAULT_BATCH_LINGER) -> list:
+    """阻塞取出一个任务，再取走队列中的后续任务，最多max_items个
+
+    队列暂时为空时最多再等待linger秒凑满一批。取到结束标记（None）即停止，
+    因此结束标记只可能是返回列表的最后一个元素。调用方需要对返回的每个元素各调用一次task_done()。
+    """
+    items = [task_queue.get()]
+    deadline = time.monotonic() + linger
+    while items[-1] is not None and len(items) < max_items:
+        try:
+            items.append(task_queue.get(timeout=max(0.0, deadline - time.monotonic())))
+        except queue.Empty:
+            break
+    return items
+
+
+async def atake_tasks(task_queue: AsyncPaperTaskQueue, max_items: int = 1, linger: float = DEFAULT_BATCH_LINGER) -> list:
+    """take_tasks的asyncio版本"""
+    items = [await task_queue.get()]
+    deadline = time.monotonic() + linger
+    while items[-1] is not None and len(items) < max_items:
+        try:
+            items.append(task_queue.get_nowait())
+        except asyncio.QueueEmpty:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                items.append(await asyncio.wait_for(task_queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+    return items
+
+
+def consumer_count_for_batches(concurrency: int, batch_size: int) -> int:
+    """批量评分时的消费者数量：每个消费者一次取走最多batch_size篇，按在途论文数换算
+
+    消费者数量远多于排队的论文时，每个消费者只能分到一篇，凑不成批。
+    """
+    return max(1, -(-concurrency // max(1, batch_size)))
+
+
+class PaperIndex:
+    """单次运行内的论文索引，保证同一篇论文只评分一次
+
+    Hugging Face和arXiv两个生产者经常产出同一篇论文。第一个登记的来源负责入队评分，
+    后登记的来源只记录自己的tag和日期；评分完成后结果会分发给所有登记过的来源。
+
+    Args:
+        sink (Callable): sink(tag, result)，把一条结果交给对应来源（结果列表或写入器）
+    """
+
+    def __init__(self, sink: Callable[[int, Dict[str, Any]], None]):
+        self._sink = sink
+        self._lock = threading.Lock()
+        # arxiv_id -> {"sources": {tag: date}, "done": bool, "result": dict}
+        self._entries = {}
+
+    def claim(self, link: str, tag: int, date: str) -> bool:
+        """登记一篇论文
+
+        Returns:
+            bool: True表示第一次出现，调用方需要将其入队评分；False表示已由其他来源入队
+        """
+        paper_id = get_arxiv_id(link)
+        with self._lock:
+            entry = self._entries.get(paper_id)
+            if entry is None:
+                self._entries[paper_id] = {"sources": {tag: date}, "done": False, "result": None}
+                return True
+            if tag not in entry["sources"]:
+                entry["sources"][tag] = date
+                # 已经评分完成，直接把结果补发给新来源
+                if entry["done"] and entry["result"]:
+                    self._emit(tag, date, entry["result"])
+            return False
+
+    def sources(self, link: str) -> Dict[int, str]:
+        """登记过该论文的来源，tag -> date"""
+        with self._lock:
+            entry = self._entries.get(get_arxiv_id(link))
+            return dict(entry["sources"]) if entry else {}
+
+    def complete(self, link: str, result: Optional[Dict[str, Any]]) -> None:
+        """记录评分结果，并分发给所有登记过该论文的来源"""
+        paper_id = get_arxiv_id(link)
+        with self._lock:
+            entry = self._entries.setdefault(paper_id, {"sources": {}, "done": False, "result": None})
+            entry["done"] = True
+            entry["result"] = result
+            if result:
+                for tag, date in entry["sources"].items():
+                    self._emit(tag, date, result)
+
+    def _emit(self, tag: int, date: str, result: Dict[str, Any]) -> None:
+        # 每个来源各自一份结果，日期使用该来源自己的日期
+        fanned = dict(result)
+        fanned["date"] = date
+        self._sink(tag, fanned)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class BitableStreamWriter:
+    """边评分边写入多维表格的写入器
+
+    评分结果通过add()放入内部队列，后台线程按条数或时间凑成一批后调用write_fn写入；
+    每一批单独重试，某一批最终失败不会影响其他批次。
+
+    Args:
+        name (str): 写入器名称，用于日志
+        write_fn (Callable): write_fn(records) -> bool，写入一批记录并返回是否成功
+        chunk_size (int): 每批最多写入的记录数
+        flush_interval (float): 不满一批时最长等待的秒数
+        max_attempts (int): 每批的最大尝试次数
+        on_written (Callable): on_written(records)，一批写入成功后的回调
+        trailing_blank (bool): 结束时是否追加一行空记录，作为不同天结果之间的分隔
+    """
+
+    def __init__(
+        self,
+        name: str,
+        write_fn: Callable[[List[Dict[str, Any]]], bool],
+        chunk_size: int = DEFAULT_WRITE_CHUNK_SIZE,
+        flush_interval: float = DEFAULT_WRITE_FLUSH_INTERVAL,
+        max_attempts: int = DEFAULT_WRITE_MAX_ATTEMPTS,
+        on_written: Optional[Callable[[List[Dict[str, Any]]], None]] = None,
+        trailing_blank: bool = True,
+    ):
+        self.name = name
+        self.write_fn = write_fn
+        self.chunk_size = chunk_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.on_written = on_written
+        self.trailing_blank = trailing_blank
+        self.written_count = 0
+        self.failed_records: List[Dict[str, Any]] = []
+
+        self._queue = queue.Queue()
+        self._closed = object()
+        self._thread = threading.Thread(target=self._run, name=f"{name}-writer", daemon=True)
+        self._thread.start()
+
+    def add(self, record: Dict[str, Any]) -> None:
+        """提交一条结果，不会阻塞调用方"""
+        self._queue.put(record)
+
+    def close(self) -> None:
+        """写完缓冲区中剩余的结果后退出后台线程"""
+        self._queue.put(self._closed)
+        self._thread.join()
+        lark.logger.info(
+            f"{self.name}写入完成：成功{self.written_count}条，失败{len(self.failed_records)}条"
+        )
+
+    def _run(self) -> None:
+        buffer = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                record = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                record = None
+
+            if record is self._closed:
+                if self.trailing_blank and (buffer or self.written_count):
+                    buffer.append(dict())
+                if buffer:
+                    self._write_chunk(buffer)
+                return
+
+            if record is not None:
+                if not buffer:
+                    deadline = time.monotonic() + self.flush_interval
+                buffer.append(record)
+
+            if len(buffer) >= self.chunk_size or (buffer and time.monotonic() >= deadline):
+                self._write_chunk(buffer)
+                buffer = []
+                deadline = None
+
+    def _write_chunk(self, records: List[Dict[str, Any]]) -> None:
+        for attempt in range(self.max_attempts):
+            try:
+                with FEISHU_WRITE_LATENCY.time(table=self.name):
+                    ok = self.write_fn(records)
+            except Exception as e:
+                lark.logger.error(f"{self.name}写入出错: {type(e).__name__} - {e}")
+                ok = False
+            if ok:
+                # 末尾的空分隔行不计数
+                real_records = [record for record in records if record]
+                self.written_count += len(real_records)
+                FEISHU_RECORDS_WRITTEN.inc(len(real_records), table=self.name)
+                lark.logger.info(f"{self.name}已写入{len(real_records)}条结果（累计{self.written_count}条）")
+                if self.on_written is not None and real_records:
+                    self.on_written(real_records)
+                return
+            if attempt < self.max_attempts - 1:
+                delay = random.uniform(0, min(30.0, 2 ** attempt))
+                RETRIES.inc(kind="feishu")
+                lark.logger.warning(f"{self.name}第{attempt + 1}次写入{len(records)}条失败，{delay:.1f}秒后重试")
+                time.sleep(delay)
+        lark.logger.error(f"{self.name}写入{len(records)}条结果最终失败，已跳过该批")
+        self.failed_records.extend(record for record in records if record)
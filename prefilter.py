@@ -0,0 +1,123 @@
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Optional
+
+from lazy_imports import lark
+
+from utils import PaperRecord
+
+
+# 低于阈值的论文的处理方式：drop直接丢弃，deprioritize排到所有论文之后再评分
+PREFILTER_MODES = ("drop", "deprioritize")
+
+_ENGLISH_WORD = re.compile(r"[a-z][a-z0-9\-]+")
+_CJK_RUN = re.compile(r"[一-鿿]+")
+# 常见英文虚词，不参与相关性计算
+_STOPWORDS = frozenset(
+    """
+    a an and are as at be by can for from has have in into is it its of on or our over that the their
+    these this those to via we which while with without using based paper propose proposed show results
+    approach method methods new novel study work also such than both more most however
+    """.split()
+)
+
+
+def _normalize_word(word: str) -> str:
+    """粗略去掉英文复数，让model/models、agent/agents落到同一个词上"""
+    word = word.strip("-")
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    """中英混合分词：英文按单词（小写、去停用词），中文按相邻两字切分（单字成词时保留单字）"""
+    text = text.lower()
+    tokens = [
+        _normalize_word(word)
+        for word in _ENGLISH_WORD.findall(text)
+        if word not in _STOPWORDS
+    ]
+    for run in _CJK_RUN.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return [token for token in tokens if len(token) > 1 or _CJK_RUN.match(token)]
+
+
+class RelevancePrefilter:
+    """用研究相关性文档对论文做本地TF-IDF初筛，不调用大模型
+
+    相关性文档按行切成若干段落（通常每段是一个研究方向），以段落为语料计算IDF，
+    论文的标题+摘要与每个段落计算TF-IDF余弦相似度，取最大值作为相关性分数：
+    论文只要和任意一个研究方向足够接近就算相关。
+
+    Args:
+        relevance_content (str): 研究相关性文档内容
+        threshold (float): 相关性分数阈值，取值[0, 1]，低于阈值的论文被丢弃或降低优先级
+        mode (str): "drop"或"deprioritize"
+    """
+
+    def __init__(self, relevance_content: str, threshold: float, mode: str = "drop"):
+        if mode not in PREFILTER_MODES:
+            raise ValueError(f"未知的初筛模式: {mode}")
+        self.threshold = threshold
+        self.mode = mode
+
+        sections = [tokenize(line) for line in relevance_content.splitlines()]
+        sections = [tokens for tokens in sections if tokens]
+        document_frequency = Counter(term for tokens in sections for term in set(tokens))
+        total = len(sections)
+        # 平滑IDF；相关性文档里没出现过的词取最大IDF，只影响论文向量的模长
+        self._idf: Dict[str, float] = {
+            term: math.log((1 + total) / (1 + df)) + 1 for term, df in document_frequency.items()
+        }
+        self._default_idf = math.log(1 + total) + 1
+
+        # 倒排索引：term -> [(段落序号, 归一化后的权重)]
+        self._postings: Dict[str, List[tuple]] = {}
+        for index, tokens in enumerate(sections):
+            for term, weight in self._vectorize(tokens).items():
+                self._postings.setdefault(term, []).append((index, weight))
+        self._section_count = total
+        lark.logger.info(f"相关性初筛已启用：{total}个段落，阈值{threshold}，模式{mode}")
+
+    def _vectorize(self, tokens: List[str]) -> Dict[str, float]:
+        """对数TF × IDF，并做L2归一化"""
+        vector = {
+            term: (1 + math.log(count)) * self._idf.get(term, self._default_idf)
+            for term, count in Counter(tokens).items()
+        }
+        norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+        if not norm:
+            return {}
+        return {term: weight / norm for term, weight in vector.items()}
+
+    def score(self, text: str) -> float:
+        """文本与相关性文档中最接近的段落的余弦相似度"""
+        if not self._section_count:
+            return 1.0
+        similarities = [0.0] * self._section_count
+        for term, weight in self._vectorize(tokenize(text)).items():
+            for index, section_weight in self._postings.get(term, ()):
+                similarities[index] += weight * section_weight
+        return max(similarities)
+
+    def check(self, paper: Optional[PaperRecord]) -> bool:
+        """给论文打相关性分数，返回是否达到阈值
+
+        没有元数据的论文（如Hugging Face来源）无法初筛，一律视为相关。
+        分数记录在paper.relevance上，deprioritize模式下未达阈值的论文标记为低优先级。
+        """
+        if paper is None or not (paper.title or paper.abstract):
+            return True
+        paper.relevance = round(self.score(f"{paper.title}\n{paper.abstract}"), 4)
+        if paper.relevance >= self.threshold:
+            return True
+        if self.mode == "deprioritize":
+            paper.low_priority = True
+        return False
@@ -0,0 +1,132 @@
+import functools
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from lazy_imports import lark
+
+
+DEFAULT_RATING_CACHE_PATH = os.path.join(".cache", "rating_cache.sqlite3")
+# 缓存总大小上限（按结果JSON字节数计），超过后按最近访问时间淘汰
+DEFAULT_RATING_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+
+@functools.lru_cache(maxsize=16)
+def hash_documents(*contents: Optional[str]) -> str:
+    """计算评分所依赖文档（SOP/岗位tag/相关性）的内容哈希
+
+    任何一个文档内容变化都会得到不同的哈希，从而让旧的缓存自动失效。
+    每篇论文评分时都会调用，同一组文档只计算一次。
+    """
+    digest = hashlib.sha256()
+    for content in contents:
+        data = (content or "").encode("utf-8")
+        # 带上长度前缀，避免不同文档拼接后产生歧义
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class RatingCache:
+    """基于SQLite的评分结果缓存，按(论文ID, 模型, 文档哈希)内容寻址
+
+    Args:
+        path (str): 缓存文件路径
+        docs_hash (str): 当前评分文档的哈希，打开时会清除其他版本文档下的缓存
+        max_bytes (int): 缓存总大小上限
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_RATING_CACHE_PATH,
+        docs_hash: Optional[str] = None,
+        max_bytes: int = DEFAULT_RATING_CACHE_MAX_BYTES,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS ratings (
+                key TEXT PRIMARY KEY,
+                paper_id TEXT NOT NULL,
+                model TEXT NOT NULL,
+                docs_hash TEXT NOT NULL,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ratings_accessed_at ON ratings (accessed_at)")
+        self._conn.commit()
+
+        if docs_hash:
+            self.invalidate_except(docs_hash)
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM ratings").fetchone()[0]
+
+    @staticmethod
+    def make_key(paper_id: str, model: str, docs_hash: str) -> str:
+        return hashlib.sha256(f"{paper_id}\0{model}\0{docs_hash}".encode("utf-8")).hexdigest()
+
+    def get(self, paper_id: str, model: str, docs_hash: str) -> Optional[Dict[str, Any]]:
+        """读取缓存的评分结果，未命中返回None"""
+        key = self.make_key(paper_id, model, docs_hash)
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM ratings WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE ratings SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        return json.loads(row[0])
+
+    def put(self, paper_id: str, model: str, docs_hash: str, result: Dict[str, Any]) -> None:
+        """写入评分结果，超出容量时淘汰最久未访问的条目"""
+        key = self.make_key(paper_id, model, docs_hash)
+        value = json.dumps(result, ensure_ascii=False)
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM ratings WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO ratings VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, paper_id, model, docs_hash, value, size, time.time()),
+            )
+            self._total_bytes += size - (old[0] if old else 0)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        # 淘汰到上限的90%，避免每次写入都触发淘汰
+        target = self.max_bytes * 0.9
+        evicted = 0
+        rows = self._conn.execute("SELECT key, size FROM ratings ORDER BY accessed_at").fetchall()
+        for key, size in rows:
+            if self._total_bytes <= target:
+                break
+            self._conn.execute("DELETE FROM ratings WHERE key = ?", (key,))
+            self._total_bytes -= size
+            evicted += 1
+        lark.logger.info(f"评分缓存超出容量，已淘汰{evicted}条")
+
+    def invalidate_except(self, docs_hash: str) -> None:
+        """删除非当前文档版本下的缓存（SOP/tag/相关性文档变化后自动失效）"""
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM ratings WHERE docs_hash != ?", (docs_hash,))
+            self._conn.commit()
+        if cursor.rowcount:
+            lark.logger.info(f"评分文档已变化，清除{cursor.rowcount}条旧缓存")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
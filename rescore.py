@@ -0,0 +1,157 @@
+import difflib
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from lazy_imports import lark
+
+
+# 分数阈值（候选线，与两级评分的复评线一致）和阈值附近的分数带：
+# SOP或相关性文档修改后，只有分数落在阈值±带宽内的论文最可能改变结论
+DEFAULT_SCORE_THRESHOLDS = (6.0,)
+DEFAULT_SCORE_BAND = 1.0
+
+# 重评原因
+REASON_TAG = "tag"
+REASON_BAND = "band"
+
+
+def split_tags(value: Any) -> Set[str]:
+    """把结果中的tag字段（字符串、逗号/顿号分隔的字符串或列表）拆成tag名集合"""
+    if not value:
+        return set()
+    if isinstance(value, (list, tuple)):
+        return {tag for item in value for tag in split_tags(item)}
+    return {part.strip() for part in re.split(r"[,，、;；/]", str(value)) if part.strip()}
+
+
+def _line_owners(lines: Sequence[str], tags: Set[str]) -> List[Set[str]]:
+    """每一行所属的tag：行内提到的tag；没有提到时沿用上一个提到tag的行（即所在小节的标题）"""
+    owners, current = [], set()
+    for line in lines:
+        mentioned = {tag for tag in tags if tag in line}
+        if mentioned:
+            current = mentioned
+        owners.append(mentioned or current)
+    return owners
+
+
+def changed_tags(old_content: str, new_content: str, tags: Iterable[str]) -> Tuple[Set[str], bool]:
+    """比较两个版本的岗位tag文档，找出内容被修改过的tag
+
+    按行diff，修改过的行归属于行内提到的tag或所在小节的tag。
+
+    Args:
+        tags (Iterable[str]): 需要判断的tag名（历史结果中出现过的tag）
+
+    Returns:
+        Tuple[Set[str], bool]: 修改过的tag，以及是否修改了不属于任何tag的部分（如文档开头的通用说明）
+    """
+    tags = set(tags)
+    old_lines, new_lines = old_content.splitlines(), new_content.splitlines()
+    old_owners, new_owners = _line_owners(old_lines, tags), _line_owners(new_lines, tags)
+    changed, general = set(), False
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    for op, i1, i2, j1, j2 in matcher.get_opcodes():
+        if op == "equal":
+            continue
+        for owners, line in zip(old_owners[i1:i2] + new_owners[j1:j2], old_lines[i1:i2] + new_lines[j1:j2]):
+            if owners:
+                changed |= owners
+            elif line.strip():
+                general = True
+    return changed, general
+
+
+@dataclass
+class DocsDiff:
+    """某一版评分文档与当前版本的差异"""
+
+    # 旧版本文档没有保存过，无法比较
+    unknown: bool = False
+    sop_changed: bool = False
+    relevance_changed: bool = False
+    # 岗位tag文档中被修改的tag，以及是否修改了通用部分
+    tags: Set[str] = field(default_factory=set)
+    tag_doc_general: bool = False
+
+    @property
+    def affects_scores(self) -> bool:
+        """修改可能影响所有论文的分数，按分数带挑选"""
+        return self.unknown or self.sop_changed or self.relevance_changed or self.tag_doc_general
+
+
+def diff_documents(
+    old_docs: Optional[Tuple[str, str, str]], new_docs: Tuple[str, str, str], tags: Iterable[str]
+) -> DocsDiff:
+    """比较两个版本的(sop_content, tag_content, relevance_content)，old_docs为None时视为未知版本"""
+    if old_docs is None:
+        return DocsDiff(unknown=True)
+    tag_changes, general = changed_tags(old_docs[1], new_docs[1], tags)
+    return DocsDiff(
+        sop_changed=old_docs[0] != new_docs[0],
+        relevance_changed=old_docs[2] != new_docs[2],
+        tags=tag_changes,
+        tag_doc_general=general,
+    )
+
+
+def near_threshold(score: Any, thresholds: Sequence[float], band: float) -> bool:
+    """分数落在任一阈值±band内；分数缺失或无法解析时也视为需要重评"""
+    try:
+        score = float(score)
+    except (TypeError, ValueError):
+        return True
+    return any(abs(score - threshold) <= band for threshold in thresholds)
+
+
+def rescore_reason(record: Dict[str, Any], diff: DocsDiff, thresholds: Sequence[float], band: float) -> Optional[str]:
+    """一条历史记录是否需要重评，需要时返回原因（tag或band），否则返回None"""
+    if (split_tags(record.get("tag_primary")) | split_tags(record.get("tag_secondary"))) & diff.tags:
+        return REASON_TAG
+    if diff.affects_scores and near_threshold(record.get("score"), thresholds, band):
+        return REASON_BAND
+    return None
+
+
+def select_for_rescore(
+    records: List[Dict[str, Any]],
+    load_docs,
+    new_docs: Tuple[str, str, str],
+    thresholds: Sequence[float] = DEFAULT_SCORE_THRESHOLDS,
+    band: float = DEFAULT_SCORE_BAND,
+) -> Tuple[List[Tuple[Dict[str, Any], str]], List[Dict[str, Any]]]:
+    """从旧版本评分文档下的历史记录中挑出需要重评的部分
+
+    每个旧版本只与当前版本比较一次：引用了被修改tag的记录按tag重评；
+    SOP、相关性文档或tag文档通用部分被修改（或旧版本未保存）时，分数在阈值附近的记录按分数带重评。
+
+    Args:
+        records (List[Dict[str, Any]]): SeenLedger.stale_records()返回的记录
+        load_docs (Callable): load_docs(docs_hash) -> 该版本的评分文档或None，如SeenLedger.get_docs
+        new_docs (Tuple[str, str, str]): 当前的(sop_content, tag_content, relevance_content)
+
+    Returns:
+        Tuple[list, list]: [(需要重评的记录, 原因)]，以及不受影响的记录
+    """
+    by_hash: Dict[Optional[str], List[Dict[str, Any]]] = {}
+    for record in records:
+        by_hash.setdefault(record.get("docs_hash"), []).append(record)
+
+    selected, unaffected = [], []
+    for docs_hash, group in by_hash.items():
+        tags = set()
+        for record in group:
+            tags |= split_tags(record.get("tag_primary")) | split_tags(record.get("tag_secondary"))
+        diff = diff_documents(load_docs(docs_hash) if docs_hash else None, new_docs, tags)
+        lark.logger.info(
+            f"评分文档版本{(docs_hash or '未知')[:12]}：{len(group)}条记录，SOP{'已' if diff.sop_changed else '未'}修改，"
+            f"修改过的tag: {sorted(diff.tags) or '无'}{'，旧版本文档未保存' if diff.unknown else ''}"
+        )
+        for record in group:
+            reason = rescore_reason(record, diff, thresholds, band)
+            if reason is None:
+                unaffected.append(record)
+            else:
+                selected.append((record, reason))
+    return selected, unaffected
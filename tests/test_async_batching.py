@@ -0,0 +1,35 @@
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH = os.path.join(ROOT, "benchmarks", "bench_pipeline.py")
+
+
+def run_bench(*argv):
+    # 压测脚本在导入流水线前替换服务地址和constants，放在子进程中运行，不受其他测试已导入模块的影响
+    proc = subprocess.run(
+        [sys.executable, BENCH, "--json", *argv], cwd=ROOT, capture_output=True, text=True, timeout=300, check=True
+    )
+    # 日志与报告共用stdout，报告是最后一个JSON对象
+    return json.loads(proc.stdout[proc.stdout.rindex("\n{") + 1 :])
+
+
+def test_async_engine_batches_at_default_concurrency():
+    """默认并发（200个评分协程）下--batch-size也要真正合并请求"""
+    report = run_bench(
+        "--engine", "async",
+        "--arxiv-papers", "160",
+        "--hf-papers", "20",
+        "--llm-latency-ms", "200",
+        "--arxiv-latency-ms", "20",
+        "--hf-latency-ms", "20",
+        "--feishu-latency-ms", "5",
+        "--pipeline-args", "--batch-size", "8",
+    )
+
+    assert report["papers_rated"] > 0
+    assert report["service_stats"].get("llm_batch_calls", 0) > 0
+    # 每次请求平均超过两篇论文
+    assert report["llm_calls"] * 2 < report["papers_rated"]
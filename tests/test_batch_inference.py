@@ -0,0 +1,26 @@
+from batch_inference import run_batch
+
+
+class UnreachableBackend:
+    def submit(self, request_path):
+        raise ConnectionError("connection refused")
+
+
+class BrokenDownloadBackend:
+    def submit(self, request_path):
+        return "batch-1"
+
+    def poll(self, batch_id):
+        return "completed"
+
+    def download(self, batch_id, output_path):
+        raise ConnectionError("connection reset")
+
+
+def test_submit_failure_falls_back(tmp_path):
+    """批量推理服务不可用时返回空结果，由调用方回退为实时评分"""
+    assert run_batch(UnreachableBackend(), str(tmp_path / "requests.jsonl"), poll_interval=0) == {}
+
+
+def test_download_failure_falls_back(tmp_path):
+    assert run_batch(BrokenDownloadBackend(), str(tmp_path / "requests.jsonl"), poll_interval=0) == {}
@@ -0,0 +1,28 @@
+from concurrency import CircuitBreaker
+
+
+def open_breaker() -> CircuitBreaker:
+    breaker = CircuitBreaker(failure_ratio=0.5, window=4, min_requests=2, cooldown=0)
+    breaker.record(False)
+    breaker.record(False)
+    return breaker
+
+
+def test_stale_result_does_not_settle_probe():
+    """熔断器打开前发出的请求在探测期间返回，不能代替探测请求给出结论"""
+    breaker = open_breaker()
+    assert breaker.wait() is True
+    # 打开前发出的请求现在才成功返回
+    breaker.record(True)
+    assert breaker._opened_at is not None and breaker._probing
+
+    breaker.record(True, probe=True)
+    assert breaker._opened_at is None and not breaker._probing
+    assert breaker.wait() is False
+
+
+def test_failed_probe_reopens():
+    breaker = open_breaker()
+    assert breaker.wait() is True
+    breaker.record(False, probe=True)
+    assert breaker._opened_at is not None and not breaker._probing
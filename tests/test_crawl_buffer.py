@@ -0,0 +1,32 @@
+import threading
+import time
+
+import utils
+
+
+def test_closing_range_harvest_releases_fetch_threads(monkeypatch):
+    """有界缓冲已满时下游提前结束迭代，各日期的爬取线程放弃等待并退出"""
+    finished = []
+
+    def many_links(date_str):
+        try:
+            for i in range(utils.CRAWL_BUFFER_SIZE * 4):
+                yield (f"https://arxiv.org/pdf/{date_str}.{i:05d}", 1, date_str, None)
+        finally:
+            finished.append(date_str)
+
+    monkeypatch.setattr(utils, "get_huggingface_daily_papers_arxiv_links", many_links)
+    links = utils.get_huggingface_daily_papers_in_range("2026-10-12", "2026-10-13", max_workers=2)
+    assert next(links)
+    # 等两个线程把缓冲填满
+    time.sleep(0.2)
+    links.close()
+
+    def fetch_threads():
+        return [t for t in threading.enumerate() if t.name.startswith("hf-day")]
+
+    deadline = time.monotonic() + 5
+    while (len(finished) < 2 or fetch_threads()) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert sorted(finished) == ["2026-10-12", "2026-10-13"]
+    assert not fetch_threads()
@@ -0,0 +1,51 @@
+import threading
+import time
+
+from concurrency import AdaptiveLimiter, Hedger, hedged_call
+
+
+def primed_hedger() -> Hedger:
+    hedger = Hedger(percentile=0.5, min_samples=1, max_ratio=1.0, max_workers=4)
+    hedger.record(0.01)
+    return hedger
+
+
+def test_abandoned_request_keeps_its_limiter_slot():
+    """对冲请求先返回后，仍在运行的原请求继续占用一个名额，直到它真正结束"""
+    limiter = AdaptiveLimiter(initial_limit=4, max_limit=4)
+    release_primary = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(None)
+        if len(calls) == 1:
+            release_primary.wait(5)
+            return "primary"
+        return "hedge"
+
+    limiter.acquire()  # 调用方为原请求占用的名额
+    assert hedged_call(fn, primed_hedger(), limiter) == "hedge"
+    limiter.release()
+    assert limiter.in_flight == 1
+
+    release_primary.set()
+    deadline = time.monotonic() + 5
+    while limiter.in_flight and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert limiter.in_flight == 0
+
+
+def test_no_hedge_without_free_slot():
+    """并发名额已满时不发对冲请求，只等原请求"""
+    limiter = AdaptiveLimiter(initial_limit=1, max_limit=1)
+    calls = []
+
+    def fn():
+        calls.append(None)
+        time.sleep(0.1)
+        return len(calls)
+
+    limiter.acquire()
+    assert hedged_call(fn, primed_hedger(), limiter) == 1
+    limiter.release()
+    assert len(calls) == 1 and limiter.in_flight == 0
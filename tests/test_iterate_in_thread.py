@@ -0,0 +1,46 @@
+import asyncio
+import threading
+
+from utils import iterate_in_thread
+
+
+def test_pump_stops_when_consumer_breaks_early():
+    """调用方提前break后，后台线程不再阻塞在满的缓冲上，并关闭同步生成器"""
+    closed = threading.Event()
+
+    def numbers():
+        try:
+            i = 0
+            while True:
+                yield i
+                i += 1
+        finally:
+            closed.set()
+
+    async def consume():
+        items = iterate_in_thread(numbers, buffer_size=2)
+        async for item in items:
+            if item == 3:
+                break
+        await items.aclose()
+        # 后台线程在默认线程池中退出，等待它关闭生成器
+        return await asyncio.to_thread(closed.wait, 5)
+
+    assert asyncio.run(consume())
+
+
+def test_generator_errors_reach_the_consumer():
+    def broken():
+        yield 1
+        raise ValueError("boom")
+
+    async def consume():
+        seen = []
+        try:
+            async for item in iterate_in_thread(broken):
+                seen.append(item)
+        except ValueError:
+            return seen
+        return None
+
+    assert asyncio.run(consume()) == [1]
@@ -0,0 +1,28 @@
+from journal import RunJournal
+from pipeline import PaperIndex
+from utils import PaperRecord
+
+
+def test_resume_after_crash_between_source_writes(tmp_path):
+    """同一篇论文来自arXiv和HF，只有arXiv那一条写入飞书后进程崩溃：续跑时HF只补写一次，不重新评分"""
+    path = str(tmp_path / "run_journal.jsonl")
+    arxiv_link = "https://arxiv.org/pdf/2501.00001v1"
+    hf_link = "https://arxiv.org/pdf/2501.00001"
+    result = {"score": 7, "link": {"link": arxiv_link, "text": arxiv_link}, "date": "EDT 20261015 14:00到20261016 14:00"}
+
+    journal = RunJournal(path)
+    journal.pending(arxiv_link, 0, "EDT 20261015 14:00到20261016 14:00", PaperRecord(arxiv_id="2501.00001", title="t"))
+    journal.pending(hf_link, 1, "2026-10-16")
+    journal.done(arxiv_link, result)
+    journal.written(arxiv_link, 0)
+    # 崩溃：日志保留，HF那一条还没写入
+    journal.close()
+
+    emitted = []
+    paper_index = PaperIndex(lambda tag, rating_result: emitted.append((tag, rating_result["date"])))
+    resumed = RunJournal(path, resume=True)
+    requeue = resumed.restore(paper_index)
+    resumed.close()
+
+    assert requeue == []
+    assert emitted == [(1, "2026-10-16")]
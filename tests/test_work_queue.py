@@ -0,0 +1,59 @@
+from work_queue import SQLiteWorkQueue
+
+
+LINK = "https://arxiv.org/pdf/2501.00001v1"
+
+
+def test_resume_clears_previous_close(tmp_path):
+    """上一轮运行结束后，续跑的coordinator开始新一轮运行，先启动的worker不能按旧的关闭标记退出"""
+    path = str(tmp_path / "work_queue.sqlite3")
+    coordinator = SQLiteWorkQueue(path)
+    first = coordinator.open_intake()
+    coordinator.close_intake()
+    coordinator.finish_run()
+
+    # worker先于续跑的coordinator启动，读到的是上一轮已结束的运行
+    worker = SQLiteWorkQueue(path)
+    stale_epoch = worker.finished_epoch()
+    assert stale_epoch == first
+    assert worker.drained(first)
+    assert not worker.drained_since(stale_epoch)
+
+    second = coordinator.open_intake(clear=False)
+    assert second != first
+    assert worker.intake_state() == (second, False)
+    assert not worker.drained_since(stale_epoch)
+
+    coordinator.enqueue((LINK, 0, "2026-10-16", None))
+    coordinator.close_intake()
+    assert not worker.drained_since(stale_epoch)
+    task_id, _ = worker.lease("w1")[0]
+    worker.complete(task_id, "w1", {"score": 7})
+    assert worker.drained_since(stale_epoch)
+    assert not worker.drained(first)
+    worker.close()
+    coordinator.close()
+
+
+def test_late_worker_joins_closed_run(tmp_path):
+    """coordinator关闭入口后才启动的worker加入当前这一轮，评完剩余任务后退出"""
+    path = str(tmp_path / "work_queue.sqlite3")
+    coordinator = SQLiteWorkQueue(path)
+    coordinator.open_intake()
+    coordinator.enqueue((LINK, 0, "2026-10-16", None))
+    coordinator.close_intake()
+
+    worker = SQLiteWorkQueue(path)
+    stale_epoch = worker.finished_epoch()
+    assert stale_epoch is None
+    assert not worker.drained_since(stale_epoch)
+    task_id, _ = worker.lease("w1")[0]
+    worker.complete(task_id, "w1", {"score": 7})
+    assert worker.drained_since(stale_epoch)
+
+    # 队列排空后、coordinator结束前启动的worker同样直接退出
+    late = SQLiteWorkQueue(path)
+    assert late.drained_since(late.finished_epoch())
+    late.close()
+    worker.close()
+    coordinator.close()
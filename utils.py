@@ -1,17 +1,124 @@
+import asyncio
 import json
+import os
+import queue
+import threading
 import time
 from datetime import datetime, timedelta, timezone
 
-import lark_oapi as lark
 import requests
-from lark_oapi.api.bitable.v1 import *
-from lark_oapi.api.docs.v1 import *
-
-from bs4 import BeautifulSoup
 import re
 
-import arxiv
-from datetime import datetime, timedelta
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from dataclasses import asdict, dataclass
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+from requests.adapters import HTTPAdapter
+
+from lazy_imports import LazyModule, lark
+
+if TYPE_CHECKING:
+    from lark_oapi.api.bitable.v1 import AppTableRecord
+
+# arxiv只在爬取arXiv时才导入；飞书接口的请求类在各自的函数中导入
+arxiv = LazyModule("arxiv")
+
+
+# 各外部服务的地址，可通过环境变量指向本地替身服务（见benchmarks/）
+FEISHU_BASE_URL = os.environ.get("FEISHU_BASE_URL", "https://open.feishu.cn")
+HF_BASE_URL = os.environ.get("HF_BASE_URL", "https://huggingface.co")
+ARXIV_QUERY_URL_FORMAT = os.environ.get("ARXIV_QUERY_URL_FORMAT", "https://export.arxiv.org/api/query?{}")
+
+# HTTP请求默认超时（连接超时, 读取超时），单位秒
+DEFAULT_HTTP_TIMEOUT = (5, 30)
+# 连接池中每个host保持的最大连接数
+HTTP_POOL_MAXSIZE = 32
+# 飞书SDK请求超时，单位秒
+LARK_TIMEOUT = 30
+
+# 每页条数（接口上限2000）和单页重试次数
+ARXIV_PAGE_SIZE = 500
+ARXIV_NUM_RETRIES = 5
+# arXiv API要求同一来源每3秒最多一次请求，本地替身服务可以把间隔设为0
+ARXIV_REQUEST_INTERVAL = float(os.environ.get("ARXIV_REQUEST_INTERVAL", "3"))
+# arXiv爬取：把提交时间段切成若干窗口并行查询和解析，所有窗口的请求共享同一个请求间隔。
+# 每个窗口至少一次请求，窗口按预估投稿量切分，使每个窗口预计一页取完，总请求数与不切分时相当
+ARXIV_EXPECTED_PAPERS_PER_DAY = 600
+ARXIV_WINDOW_HOURS = 24 * ARXIV_PAGE_SIZE / ARXIV_EXPECTED_PAPERS_PER_DAY
+ARXIV_MAX_WORKERS = 4
+# 补跑多天时并行爬取的Hugging Face日期数
+HF_MAX_WORKERS = 4
+# 爬虫后台线程与消费方之间的有界缓冲，消费方处理不过来时爬虫线程暂停，内存占用有上限
+CRAWL_BUFFER_SIZE = 256
+# 后台线程等待缓冲空位时，每隔多少秒检查一次消费方是否已停止迭代
+BUFFER_PUT_POLL_SECONDS = 0.5
+
+_client_lock = threading.Lock()
+_http_session = None
+_lark_client = None
+
+
+def get_http_session() -> requests.Session:
+    """返回进程内共享的requests.Session，复用keep-alive连接，避免每次请求重新TLS握手"""
+    global _http_session
+    if _http_session is None:
+        with _client_lock:
+            if _http_session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=8, pool_maxsize=HTTP_POOL_MAXSIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _http_session = session
+    return _http_session
+
+
+class RequestSpacer:
+    """跨线程共享的请求间隔：任意两次请求的开始时间至少相隔interval秒，按调用顺序排队"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def wait(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+_arxiv_spacer = RequestSpacer(ARXIV_REQUEST_INTERVAL)
+
+
+class _ArxivSession(requests.Session):
+    """arxiv.Client使用的session，每次请求（包括翻页和重试）前都经过共享的请求间隔"""
+
+    def request(self, *args, **kwargs):
+        _arxiv_spacer.wait()
+        return super().request(*args, **kwargs)
+
+
+def get_lark_client() -> "lark.Client":
+    """返回进程内共享的飞书SDK client
+
+    使用 user_access_token 需开启 token 配置, 并在 request_option 中配置 token。
+    日志级别为INFO，DEBUG级别会打印每个请求的完整内容。
+    """
+    global _lark_client
+    if _lark_client is None:
+        with _client_lock:
+            if _lark_client is None:
+                _lark_client = (
+                    lark.Client.builder()
+                    .enable_set_token(True)
+                    .log_level(lark.LogLevel.INFO)
+                    .domain(FEISHU_BASE_URL)
+                    .timeout(LARK_TIMEOUT)
+                    .build()
+                )
+    return _lark_client
 
 
 def get_access_token(app_id, app_secret):
@@ -22,7 +129,7 @@ def get_access_token(app_id, app_secret):
     :return: 包含app_access_token和过期时间的字典，失败时返回None
     """
     # 定义API请求的URL
-    url = "https://open.feishu.cn/open-apis/auth/v3/app_access_token/internal"
+    url = f"{FEISHU_BASE_URL}/open-apis/auth/v3/app_access_token/internal"
 
     # 设置请求头
     headers = {"Content-Type": "application/json; charset=utf-8"}
@@ -32,7 +139,7 @@ def get_access_token(app_id, app_secret):
 
     try:
         # 发送POST请求
-        response = requests.post(url, headers=headers, data=json.dumps(payload))
+        response = get_http_session().post(url, headers=headers, data=json.dumps(payload), timeout=DEFAULT_HTTP_TIMEOUT)
 
         # 解析响应内容
         result = response.json()
@@ -66,6 +173,49 @@ def get_access_token(app_id, app_secret):
         return None
 
 
+class AccessTokenProvider:
+    """带缓存的飞书access_token提供者，线程安全
+
+    token在过期前refresh_margin秒内视为即将过期并刷新；多个线程同时发现需要刷新时，
+    只有一个会真正发起请求，其余等待并复用它的结果。
+
+    Args:
+        app_id: 应用的唯一标识符
+        app_secret: 应用的密钥
+        refresh_margin (int): 提前刷新的秒数
+    """
+
+    def __init__(self, app_id, app_secret, refresh_margin: int = 300):
+        self.app_id = app_id
+        self.app_secret = app_secret
+        self.refresh_margin = refresh_margin
+        self._lock = threading.Lock()
+        self._token = None
+        self._expires_at = 0.0
+
+    def _valid_token(self):
+        if self._token and time.time() < self._expires_at - self.refresh_margin:
+            return self._token
+        return None
+
+    def get(self) -> str:
+        """返回有效的access_token，必要时刷新"""
+        token = self._valid_token()
+        if token:
+            return token
+        with self._lock:
+            # 等锁期间可能已经被其他线程刷新
+            token = self._valid_token()
+            if token:
+                return token
+            result = get_access_token(self.app_id, self.app_secret)
+            if not result:
+                raise Exception("获取access_token失败")
+            self._token = result["access_token"]
+            self._expires_at = result["timestamp"] + (result["expire"] or 0)
+            return self._token
+
+
 def get_feishu_doc_content(doc_token: str, access_token: str) -> str:
     """获取飞书文档内容
 
@@ -76,13 +226,9 @@ def get_feishu_doc_content(doc_token: str, access_token: str) -> str:
     Returns:
         str: 文档内容
     """
-    # 创建client
-    client = (
-        lark.Client.builder()
-        .enable_set_token(True)
-        .log_level(lark.LogLevel.DEBUG)
-        .build()
-    )
+    from lark_oapi.api.docs.v1 import GetContentRequest, GetContentResponse
+
+    client = get_lark_client()
 
     # 构造请求对象
     request: GetContentRequest = (
@@ -106,7 +252,93 @@ def get_feishu_doc_content(doc_token: str, access_token: str) -> str:
     return response.data.content
 
 
-def get_rating_prompt(sop_content: str, tag_content: str, paper_content: str, relevance_content: str = None) -> list:
+def get_feishu_doc_revision(doc_token: str, access_token: str) -> int:
+    """获取飞书文档的当前版本号，只返回文档元信息，比拉取全文快得多
+
+    Args:
+        doc_token (str): 文档的 token
+        access_token (str): 访问令牌
+
+    Returns:
+        int: 文档的revision_id，文档每次修改后递增
+    """
+    from lark_oapi.api.docx.v1 import GetDocumentRequest, GetDocumentResponse
+
+    client = get_lark_client()
+    request: GetDocumentRequest = GetDocumentRequest.builder().document_id(doc_token).build()
+    option = lark.RequestOption.builder().user_access_token(access_token).build()
+    response: GetDocumentResponse = client.docx.v1.document.get(request, option)
+
+    if not response.success():
+        raise Exception(
+            f"client.docx.v1.document.get failed, code: {response.code}, msg: {response.msg}, log_id: {response.get_log_id()}"
+        )
+    return response.data.document.revision_id
+
+
+@dataclass(slots=True)
+class PaperRecord:
+    """生产者随链接一起产出的论文元数据
+
+    arXiv生产者直接从查询结果中取得标题、摘要和作者，评分时放进提示词，
+    模型不需要再读PDF才能知道这些信息；也可以映射到多维表格的列。
+    Hugging Face页面上只有论文ID，不产出元数据。
+    """
+
+    arxiv_id: str
+    title: str = ""
+    abstract: str = ""
+    authors: Tuple[str, ...] = ()
+    categories: Tuple[str, ...] = ()
+    # 首次提交和最近更新日期，格式YYYY-MM-DD
+    published: str = ""
+    updated: str = ""
+    # 本地相关性初筛的分数，以及是否因分数过低被排到最后评分（见prefilter.py）
+    relevance: Optional[float] = None
+    low_priority: bool = False
+
+    @classmethod
+    def from_arxiv_result(cls, result: "arxiv.Result") -> "PaperRecord":
+        return cls(
+            arxiv_id=get_arxiv_id(result.entry_id),
+            title=" ".join(result.title.split()),
+            abstract=" ".join(result.summary.split()),
+            authors=tuple(author.name for author in result.authors),
+            categories=tuple(result.categories),
+            published=result.published.strftime("%Y-%m-%d") if result.published else "",
+            updated=result.updated.strftime("%Y-%m-%d") if result.updated else "",
+        )
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "PaperRecord":
+        data = dict(data)
+        data["authors"] = tuple(data.get("authors") or ())
+        data["categories"] = tuple(data.get("categories") or ())
+        return cls(**data)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    def prompt_text(self) -> str:
+        """拼成提示词中的论文信息，摘要放在最后"""
+        lines = [f"标题：{self.title}"]
+        if self.authors:
+            lines.append(f"作者：{', '.join(self.authors)}")
+        if self.categories:
+            lines.append(f"分类：{', '.join(self.categories)}")
+        if self.published:
+            lines.append(f"提交日期：{self.published}")
+        lines.append(f"摘要：{self.abstract}")
+        return "\n".join(lines)
+
+
+def get_rating_prompt(
+    sop_content: str,
+    tag_content: str,
+    paper_content: str,
+    relevance_content: str = None,
+    paper: Optional[PaperRecord] = None,
+) -> list:
 
     system_prompt = f"""
     你是一个专业的......严格按以下逻辑执行任务，并最终输出指定的JSON格式。
@@ -126,9 +358,66 @@ def get_rating_prompt(sop_content: str, tag_content: str, paper_content: str, re
     """
     return [
         {"role": "system", "content": f"{system_prompt}"},
-        {"role": "user", "content": f"论文链接：{paper_content}"},
+        {"role": "user", "content": get_paper_message(paper_content, paper)},
     ]
 
+
+def get_batch_rating_prompt(
+    sop_content: str,
+    tag_content: str,
+    papers: List[Tuple[str, PaperRecord]],
+    relevance_content: str = None,
+) -> list:
+    """一次请求评多篇论文的提示词：系统提示与单篇评分相同，只在末尾追加批量输出格式
+
+    Args:
+        papers (List[Tuple[str, PaperRecord]]): [(论文链接, 论文元数据)]
+
+    Returns:
+        list: messages，要求模型输出JSON数组，每个元素带有对应论文的id
+    """
+    system_prompt = get_rating_prompt(sop_content, tag_content, "", relevance_content)[0]["content"]
+    system_prompt += f"""
+    批量评分要求：
+    - 用户消息中包含{len(papers)}篇论文，每篇以"论文ID："开头
+    - 对每篇论文分别按上述要求评分，输出一个JSON数组，数组中每个元素是一篇论文的评分JSON对象
+    - 每个元素必须额外包含"id"字段，值为对应论文的论文ID；不要遗漏或合并论文
+    """
+    paper_messages = [
+        f"[{index}] 论文ID：{paper.arxiv_id}\n{get_paper_message(link, paper)}"
+        for index, (link, paper) in enumerate(papers, start=1)
+    ]
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": "\n\n".join(paper_messages)},
+    ]
+
+
+def get_triage_prompt(relevance_content: str, paper_content: str, paper: PaperRecord) -> list:
+    """两级评分中快速模型使用的初筛提示词，只看标题和摘要，输出很短的JSON"""
+
+    system_prompt = f"""
+    你是论文初筛助手。根据下面的研究方向说明，只依据论文的标题和摘要，判断论文与研究方向的相关程度并打分。
+
+    研究方向说明：
+    {relevance_content}
+
+    输出要求：
+    - 只输出一个JSON对象，不要输出其他内容
+    - 格式：{{"score": 1到10的整数, "confidence": 0到1之间的小数，表示你对该分数的把握, "summary": "一句话中文概括"}}
+    """
+    return [
+        {"role": "system", "content": f"{system_prompt}"},
+        {"role": "user", "content": get_paper_message(paper_content, paper)},
+    ]
+
+
+def get_paper_message(paper_content: str, paper: Optional[PaperRecord] = None) -> str:
+    """评分提示词中的论文部分：有元数据时先给出标题、作者和摘要，再给出链接"""
+    if paper is None:
+        return f"论文链接：{paper_content}"
+    return f"{paper.prompt_text()}\n论文链接：{paper_content}"
+
 #对于论文作者中没有华人的文章，则不需要依照岗位tag文档进行岗位符合度的判断。
 
 # SDK 使用说明: https://open.feishu.cn/document/uAjLw4CM/ukTMukTMukTM/server-side-sdk/python--sdk/preparations-before-development
@@ -138,16 +427,21 @@ def add_records_to_dowei(
     table_id: str,
     user_access_token: str,
     records: List[Dict[str, Any]],
-):
-    # 创建client
-    # 使用 user_access_token 需开启 token 配置, 并在 request_option 中配置 token
-    client = (
-        lark.Client.builder()
-        .enable_set_token(True)
-        .log_level(lark.LogLevel.DEBUG)
-        .build()
+) -> Optional[List["AppTableRecord"]]:
+    """批量新增多维表格记录
+
+    Returns:
+        List[AppTableRecord]: 成功时返回新增的记录（包含record_id），失败时返回None
+    """
+    from lark_oapi.api.bitable.v1 import (
+        AppTableRecord,
+        BatchCreateAppTableRecordRequest,
+        BatchCreateAppTableRecordRequestBody,
+        BatchCreateAppTableRecordResponse,
     )
 
+    client = get_lark_client()
+
     # 构造请求对象
     request: BatchCreateAppTableRecordRequest = (
         BatchCreateAppTableRecordRequest.builder()
@@ -177,10 +471,64 @@ def add_records_to_dowei(
         lark.logger.error(
             f"client.bitable.v1.app_table_record.batch_create failed, code: {response.code}, msg: {response.msg}, log_id: {response.get_log_id()}, resp: \n{json.dumps(json.loads(response.raw.content), indent=4, ensure_ascii=False)}"
         )
-        return
+        return None
 
     # 处理业务结果
     lark.logger.info(lark.JSON.marshal(response.data, indent=4))
+    return response.data.records or []
+
+def update_records_in_dowei(
+    table_app_token: str,
+    table_id: str,
+    user_access_token: str,
+    records: Dict[str, Dict[str, Any]],
+) -> bool:
+    """批量更新多维表格中已有的记录（单次最多500条）
+
+    Args:
+        records (Dict[str, Dict[str, Any]]): record_id -> 要更新的字段
+
+    Returns:
+        bool: 是否更新成功
+    """
+    from lark_oapi.api.bitable.v1 import (
+        AppTableRecord,
+        BatchUpdateAppTableRecordRequest,
+        BatchUpdateAppTableRecordRequestBody,
+        BatchUpdateAppTableRecordResponse,
+    )
+
+    client = get_lark_client()
+
+    request: BatchUpdateAppTableRecordRequest = (
+        BatchUpdateAppTableRecordRequest.builder()
+        .app_token(table_app_token)
+        .table_id(table_id)
+        .request_body(
+            BatchUpdateAppTableRecordRequestBody.builder()
+            .records(
+                [
+                    AppTableRecord.builder().record_id(record_id).fields(fields).build()
+                    for record_id, fields in records.items()
+                ]
+            )
+            .build()
+        )
+        .build()
+    )
+
+    option = lark.RequestOption.builder().user_access_token(user_access_token).build()
+    response: BatchUpdateAppTableRecordResponse = (
+        client.bitable.v1.app_table_record.batch_update(request, option)
+    )
+
+    if not response.success():
+        lark.logger.error(
+            f"client.bitable.v1.app_table_record.batch_update failed, code: {response.code}, msg: {response.msg}, log_id: {response.get_log_id()}"
+        )
+        return False
+    lark.logger.info(f"已更新多维表格{table_id}中的{len(records)}条记录")
+    return True
 
 def get_feishu_sheet_content(doc_token: str, sheet_id: str, range: str, access_token: str) -> list[str]:
     """
@@ -197,7 +545,7 @@ def get_feishu_sheet_content(doc_token: str, sheet_id: str, range: str, access_t
         表格内容，格式为列表，例如 [1,2,3]
     """
     # 构建请求 URL
-    url = f"https://open.feishu.cn/open-apis/sheets/v2/spreadsheets/{doc_token}/values/{sheet_id}!{range}"
+    url = f"{FEISHU_BASE_URL}/open-apis/sheets/v2/spreadsheets/{doc_token}/values/{sheet_id}!{range}"
     
     # 设置请求头
     headers = {
@@ -206,7 +554,7 @@ def get_feishu_sheet_content(doc_token: str, sheet_id: str, range: str, access_t
     
     try:
         # 发送 GET 请求
-        response = requests.get(url, headers=headers)
+        response = get_http_session().get(url, headers=headers, timeout=DEFAULT_HTTP_TIMEOUT)
         response.raise_for_status()  # 检查请求是否成功
         
         # 解析 JSON 响应
@@ -237,7 +585,7 @@ def add_records_to_feishu_sheet(spreadsheet_token, sheet_id, range, user_access_
         dict: API 响应结果，包含操作状态和相关数据
     """
     # 飞书 API 基础配置
-    base_url = "https://open.feishu.cn/open-apis/sheets/v2/spreadsheets"
+    base_url = f"{FEISHU_BASE_URL}/open-apis/sheets/v2/spreadsheets"
     access_token = user_access_token # 需替换为实际令牌
     
     # 构建请求 URL（包含完整范围）
@@ -259,7 +607,7 @@ def add_records_to_feishu_sheet(spreadsheet_token, sheet_id, range, user_access_
     
     try:
         # 发送 PUT 请求
-        response = requests.put(url, headers=headers, data=json.dumps(payload))
+        response = get_http_session().put(url, headers=headers, data=json.dumps(payload), timeout=DEFAULT_HTTP_TIMEOUT)
         response.raise_for_status()  # 检查请求是否成功
         
         # 返回 API 响应
@@ -281,6 +629,34 @@ def clean_link(link):
         link = re.sub(r'\?.*$', '', link)
         return link
 
+def get_arxiv_id(link: str) -> str:
+    """从论文链接中提取不带版本号的arXiv ID，提取不到时返回清理后的链接
+
+    例如 https://arxiv.org/pdf/2501.01234v2 -> 2501.01234
+    """
+    match = re.search(r'(\d{4}\.\d{4,5})(v\d+)?', link)
+    return match.group(1) if match else clean_link(link)
+
+def get_last_working_day(day: datetime) -> datetime:
+    """day之前最近的一个工作日（周一至周五）"""
+    day -= timedelta(days=1)
+    while day.weekday() >= 5:
+        day -= timedelta(days=1)
+    return day
+
+
+def get_working_days(start_date: str, end_date: str) -> List[datetime]:
+    """[start_date, end_date]（YYYY-MM-DD，首尾都包含）中的所有工作日"""
+    day = datetime.strptime(start_date, "%Y-%m-%d")
+    end = datetime.strptime(end_date, "%Y-%m-%d")
+    days = []
+    while day <= end:
+        if day.weekday() < 5:
+            days.append(day)
+        day += timedelta(days=1)
+    return days
+
+
 def get_huggingface_daily_papers_arxiv_links(date_str=None):
     """
     从Hugging Face Daily Papers获取arXiv链接，自动去重并返回列表
@@ -292,6 +668,7 @@ def get_huggingface_daily_papers_arxiv_links(date_str=None):
         list: 去重后的arXiv链接列表
         str: 论文对应的发表日期
     """
+    from bs4 import BeautifulSoup
 
     # 创建一个用来去重的存储器
     hf_visited = set()
@@ -299,16 +676,9 @@ def get_huggingface_daily_papers_arxiv_links(date_str=None):
 
     # 计算日期（默认为上一个工作日）
     if not date_str:
-        today = datetime.today()
-        offset = 1
-        while True:
-            last_working_day = today - timedelta(days=offset)
-            if last_working_day.weekday() < 5:  # 0-4是工作日
-                break
-            offset += 1
-        date_str = last_working_day.strftime("%Y-%m-%d")
+        date_str = get_last_working_day(datetime.today()).strftime("%Y-%m-%d")
     
-    url = f"https://huggingface.co/papers/date/{date_str}"
+    url = f"{HF_BASE_URL}/papers/date/{date_str}"
     lark.logger.info(f"正在获取{date_str}的Daily Papers: {url}")
     
     headers = {
@@ -317,7 +687,7 @@ def get_huggingface_daily_papers_arxiv_links(date_str=None):
     
     try:
         # 发送HTTP请求
-        response = requests.get(url, headers=headers, timeout=15)
+        response = get_http_session().get(url, headers=headers, timeout=(DEFAULT_HTTP_TIMEOUT[0], 15))
         response.raise_for_status()
         
         # 解析HTML内容
@@ -329,10 +699,13 @@ def get_huggingface_daily_papers_arxiv_links(date_str=None):
             if '/papers/' in href:
                 parts = href.split('/')
                 arxiv_id = next((p for p in parts if re.match(r'\d+\.\d+', p)), None)
-                if arxiv_id and clean_link(arxiv_id) not in hf_visited:
+                if arxiv_id:
+                    # 与arxiv生产者使用同一种ID规范化方式（去掉锚点、参数和版本号）
+                    arxiv_id = get_arxiv_id(clean_link(arxiv_id))
+                if arxiv_id and arxiv_id not in hf_visited:
                     hf_visited.add(arxiv_id)    
                     hf_count += 1                
-                    yield (f"https://arxiv.org/pdf/{arxiv_id}",1, date_str)
+                    yield (f"https://arxiv.org/pdf/{arxiv_id}",1, date_str, None)
         
         lark.logger.info(f"成功爬取到Hugging Face上{date_str}的{hf_count}条链接")
 
@@ -342,15 +715,146 @@ def get_huggingface_daily_papers_arxiv_links(date_str=None):
         lark.logger.error(f"发生错误: {e}，已经成功爬取到{hf_count}条链接")
 
 
+def _put_unless_stopped(results: queue.Queue, item, stop: threading.Event) -> bool:
+    """把item放进有界队列，队列满时等待；消费方已停止迭代（stop被设置）时放弃并返回False"""
+    while not stop.is_set():
+        try:
+            results.put(item, timeout=BUFFER_PUT_POLL_SECONDS)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def get_huggingface_daily_papers_in_range(start_date: str, end_date: str, max_workers: int = HF_MAX_WORKERS):
+    """
+    并行爬取[start_date, end_date]中每个工作日的Hugging Face Daily Papers，用于补跑错过的日期
+
+    每一天由get_huggingface_daily_papers_arxiv_links单独爬取，日期仍是论文所在的那一天；
+    同一篇论文出现在多天时只产出最先爬到的一次。
+
+    Args:
+        start_date (str): 开始日期(YYYY-MM-DD)
+        end_date (str): 结束日期(YYYY-MM-DD)，包含当天
+        max_workers (int): 并行爬取的天数
+
+    Returns:
+        list: 去重后的arXiv链接列表
+        str: 论文对应的发表日期
+    """
+    days = [day.strftime("%Y-%m-%d") for day in get_working_days(start_date, end_date)]
+    results = queue.Queue(maxsize=CRAWL_BUFFER_SIZE)
+    stop = threading.Event()
+
+    def fetch_day(date_str):
+        try:
+            for item in get_huggingface_daily_papers_arxiv_links(date_str):
+                if not _put_unless_stopped(results, item, stop):
+                    break
+        finally:
+            _put_unless_stopped(results, None, stop)
+
+    hf_visited = set()
+    executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="hf-day")
+    try:
+        for date_str in days:
+            executor.submit(fetch_day, date_str)
+        pending = len(days)
+        while pending:
+            item = results.get()
+            if item is None:
+                pending -= 1
+                continue
+            arxiv_id = get_arxiv_id(item[0])
+            if arxiv_id not in hf_visited:
+                hf_visited.add(arxiv_id)
+                yield item
+        lark.logger.info(f"成功爬取到Hugging Face上{start_date}到{end_date}（{len(days)}个工作日）的{len(hf_visited)}条链接")
+    finally:
+        stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def split_time_windows(start: datetime, end: datetime, window_hours: float) -> list:
+    """把[start, end]切成若干首尾相接、长度不超过window_hours小时的时间窗口"""
+    windows = []
+    step = timedelta(hours=window_hours)
+    window_start = start
+    while window_start < end:
+        window_end = min(window_start + step, end)
+        windows.append((window_start, window_end))
+        window_start = window_end
+    return windows
+
+
+def get_arxiv_period(day: datetime) -> Tuple[datetime, datetime, str]:
+    """day这一天的论文对应的arXiv提交周期：上一个工作日14:00到当天14:00（EDT）
+
+    周一的周期从上周五14:00开始，包含周末提交的论文。
+
+    Returns:
+        Tuple[datetime, datetime, str]: 周期开始时间、结束时间和写入结果的周期描述
+    """
+    start_date_str = get_last_working_day(day).strftime("%Y%m%d")
+    end_date_str = day.strftime("%Y%m%d")
+    period_start = datetime.strptime(f"{start_date_str}1400", "%Y%m%d%H%M")
+    period_end = datetime.strptime(f"{end_date_str}1400", "%Y%m%d%H%M")
+    return period_start, period_end, f"EDT {start_date_str} 14:00到{end_date_str} 14:00"
+
+
+def _fetch_arxiv_window(
+    window_start: datetime, window_end: datetime, period_str: str, results: queue.Queue, stop: threading.Event
+) -> None:
+    """爬取一个时间窗口内的论文，逐条放入(link, period_str, PaperRecord)，结束时放入窗口结束标记（成功为None，失败为异常）"""
+    query = f"cat:cs.AI AND submittedDate:[{window_start:%Y%m%d%H%M} TO {window_end:%Y%m%d%H%M}]"
+    search = arxiv.Search(
+        query=query,
+        max_results=None,
+        sort_by=arxiv.SortCriterion.SubmittedDate,
+        sort_order=arxiv.SortOrder.Descending,
+    )
+    # arxiv.Client记录了上次请求时间，不是线程安全的，每个窗口单独创建；
+    # 它自带的间隔只约束单个client，请求间隔改由所有窗口共享的_ArxivSession保证
+    client = arxiv.Client(page_size=ARXIV_PAGE_SIZE, delay_seconds=0, num_retries=ARXIV_NUM_RETRIES)
+    client.query_url_format = ARXIV_QUERY_URL_FORMAT
+    client._session = _ArxivSession()
+    try:
+        for result in client.results(search):
+            entry = (clean_link(result.pdf_url), period_str, PaperRecord.from_arxiv_result(result))
+            if not _put_unless_stopped(results, entry, stop):
+                break
+        _put_unless_stopped(results, None, stop)
+    except Exception as e:
+        lark.logger.error(f"爬取arxiv时间窗口{window_start:%m-%d %H:%M}~{window_end:%m-%d %H:%M}时出错: {e}")
+        _put_unless_stopped(results, e, stop)
 
 
-def get_arxiv_paper_links():
+def get_arxiv_paper_links(
+    window_hours: float = ARXIV_WINDOW_HOURS,
+    max_workers: int = ARXIV_MAX_WORKERS,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+):
     """
     爬取前一个公布周期arXiv上AI领域的所有论文PDF链接
 
+    提交时间段被切成若干window_hours小时的窗口，由max_workers个线程并行翻页和解析，
+    结果合并去重后按到达顺序产出，不必等整个时间段串行翻完。
+    所有窗口的请求共享ARXIV_REQUEST_INTERVAL的请求间隔，整体请求频率不超过arXiv API的限制；
+    默认窗口按预估投稿量切分，每个窗口预计一页取完，不会因为窗口过多而多发请求。
+    指定start_date时改为爬取[start_date, end_date]中每个工作日的提交周期（补跑错过的日期），
+    所有周期的窗口一起并行查询，每篇论文的日期是它所在的那个周期。
+
+    Args:
+        window_hours (float): 每个查询窗口的小时数
+        max_workers (int): 并行查询的窗口数
+        start_date (str, optional): 开始日期(YYYY-MM-DD)，默认只爬上一个工作日的周期
+        end_date (str, optional): 结束日期(YYYY-MM-DD)，包含当天，默认与start_date相同
+
     Returns:
         list[str]: 去重后的pdf links
         str: 论文对应的提交周期
+        PaperRecord: 论文元数据
     """
     
     # 创建一个用来去重的存储器
@@ -358,43 +862,113 @@ def get_arxiv_paper_links():
     # 计数
     arxiv_count = 0
 
-    #计算日期
-    today = datetime.today()
-    if today.weekday() in (0,1):
-        start_date = today - timedelta(days = 4) # 周一从上周四开始爬，周二从上周五开始爬
+    # 计算提交周期：默认是上一个工作日的周期（周一爬上周四到上周五，周二爬上周五到周一，其余爬前天到昨天）
+    if start_date:
+        days = get_working_days(start_date, end_date or start_date)
     else:
-        start_date = today - timedelta(days = 2) # 周三/四/五都从当天的前天开始爬
-    if today.weekday() == 0:
-        end_date = today - timedelta(days = 3) # 周一爬到上周五
-    else:
-        end_date = today - timedelta(days = 1) # 其他都爬到前一天
-
-    # 转换成字符串
-    start_date_str = start_date.strftime("%Y%m%d")
-    end_date_str = end_date.strftime("%Y%m%d")
-    period_str = f"EDT {start_date_str} 14:00到{end_date_str} 14:00"
-
-    # 构建query
-    query = f'cat:cs.AI AND submittedDate:[{start_date_str}1400 TO {end_date_str}1400]'
-    
-    # 执行查询
-    search = arxiv.Search(
-        query=query,
-        max_results=10000,
-        sort_by=arxiv.SortCriterion.SubmittedDate,
-        sort_order=arxiv.SortOrder.Descending
-    )
+        days = [get_last_working_day(datetime.today())]
+    periods = [get_arxiv_period(day) for day in days]
+    if not periods:
+        lark.logger.warning(f"{start_date}到{end_date}之间没有工作日，不爬取arxiv")
+        return
+    # 日志中的整体时间段
+    period_str = f"EDT {periods[0][0]:%Y%m%d} 14:00到{periods[-1][1]:%Y%m%d} 14:00"
+
+    # 切分查询窗口：每个周期[start 14:00, end 14:00]各自切分
+    windows = [
+        (window_start, window_end, period[2])
+        for period in periods
+        for window_start, window_end in split_time_windows(period[0], period[1], window_hours)
+    ]
 
-    # 生成链接
+    # 生成链接：有界队列，下游处理不过来时窗口线程暂停翻页
+    results = queue.Queue(maxsize=CRAWL_BUFFER_SIZE)
+    stop = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="arxiv-window")
     try:
-        for result in arxiv.Client().results(search):
-            link = clean_link(result.pdf_url)
-            if link not in arxiv_visited and arxiv_visited.add(link) is None:
+        for window_start, window_end, window_period in windows:
+            executor.submit(_fetch_arxiv_window, window_start, window_end, window_period, results, stop)
+
+        pending, failed = len(windows), 0
+        while pending:
+            entry = results.get()
+            if entry is None or isinstance(entry, Exception):
+                pending -= 1
+                failed += entry is not None
+                continue
+            link, paper_period, paper = entry
+            # 相邻窗口的边界是闭区间，同一篇论文可能出现两次
+            arxiv_id = get_arxiv_id(link)
+            if arxiv_id not in arxiv_visited and arxiv_visited.add(arxiv_id) is None:
                 arxiv_count += 1
-                yield (link, 0, period_str)
-        lark.logger.info(f"成功爬取到ArXiv上{period_str}的{arxiv_count}条链接")        
+                yield (link, 0, paper_period, paper)
+
+        if failed:
+            raise RuntimeError(f"{failed}/{len(windows)}个时间窗口爬取失败")
+        lark.logger.info(f"成功爬取到ArXiv上{period_str}的{arxiv_count}条链接（{len(windows)}个时间窗口）")
 
     except Exception as e:
         lark.logger.error(f"爬取arxiv链接时出错: {e}，已经成功爬取到{arxiv_count}条链接")
         raise
+    finally:
+        # 下游提前结束迭代时让各窗口尽快停止翻页
+        stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
 
+async def iterate_in_thread(gen_factory, *args, buffer_size: int = CRAWL_BUFFER_SIZE, **kwargs):
+    """在后台线程中驱动同步生成器，并以异步生成器的形式产出结果
+
+    爬虫生成器内部是阻塞的网络请求，直接在事件循环中迭代会卡住所有评分协程，
+    因此放到默认线程池中执行，通过一个有界的asyncio.Queue把结果交回事件循环。
+    调用方提前结束迭代（出错或break）时，后台线程停止等待缓冲并关闭生成器，释放它持有的连接。
+
+    Args:
+        gen_factory: 返回同步生成器的函数，如get_arxiv_paper_links
+        buffer_size (int): 线程与事件循环之间的缓冲大小
+        *args, **kwargs: 透传给gen_factory的参数
+
+    Yields:
+        生成器产出的每一个元素
+    """
+    loop = asyncio.get_running_loop()
+    buffer = asyncio.Queue(maxsize=buffer_size)
+    done = object()
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        """把item放进缓冲，调用方已停止迭代时放弃并返回False"""
+        future = asyncio.run_coroutine_threadsafe(buffer.put(item), loop)
+        while True:
+            try:
+                future.result(timeout=BUFFER_PUT_POLL_SECONDS)
+                return True
+            except FutureTimeoutError:
+                if stop.is_set():
+                    future.cancel()
+                    return False
+            except CancelledError:
+                return False
+
+    def pump():
+        gen = gen_factory(*args, **kwargs)
+        try:
+            for item in gen:
+                if not put(item):
+                    break
+        finally:
+            gen.close()
+            if not stop.is_set():
+                put(done)
+
+    pump_future = loop.run_in_executor(None, pump)
+    try:
+        while True:
+            item = await buffer.get()
+            if item is done:
+                break
+            yield item
+    finally:
+        stop.set()
+    # 将生成器线程中的异常抛回调用方
+    await pump_future
@@ -0,0 +1,270 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from lazy_imports import lark
+
+from metrics import RETRIES
+from pipeline import task_priority
+from utils import PaperRecord, get_arxiv_id
+
+
+DEFAULT_WORK_QUEUE_PATH = os.path.join(".cache", "work_queue.sqlite3")
+# 租约时长（秒）；worker在评分期间定期续租，进程退出后租约到期，任务重新入队
+DEFAULT_LEASE_SECONDS = 120.0
+# 一个任务最多被租出的次数，超过后视为评分失败，避免一篇论文反复拖垮worker
+DEFAULT_MAX_LEASES = 5
+
+# 任务状态
+QUEUED = "queued"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+
+class SQLiteWorkQueue:
+    """基于SQLite文件的持久化任务队列，供一个coordinator和多个worker进程共享
+
+    coordinator把生产者产出的(link, tag, date, paper)入队；worker用lease()租出任务，
+    评分后用complete()提交结果，评分期间用renew()续租；租约到期的任务会被下一次lease()重新入队。
+    coordinator用collect()取回已完成的结果，交给论文索引和多维表格写入器；
+    coordinator每次启动（包括续跑）都用open_intake()开始新一轮运行并生成新的运行编号，
+    生产者结束后调用close_intake()，取回全部结果后调用finish_run()。
+    worker启动时记下已结束的那一轮（finished_epoch()），只按之后的运行判断是否排空（drained_since()），
+    不会因为上一轮运行留下的关闭标记提前退出；coordinator关闭入口后才启动的worker仍会加入当前这一轮。
+    同一篇论文（按arXiv ID）只会入队一次。
+
+    SQLite文件只适合同一台机器上的多个进程（或可靠支持文件锁的共享存储）；
+    跨机器部署时可以用其他存储实现同样的方法。
+
+    Args:
+        path (str): 队列文件路径
+        lease_seconds (float): 租约时长
+        max_leases (int): 单个任务的最大租出次数
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_WORK_QUEUE_PATH,
+        lease_seconds: float = DEFAULT_LEASE_SECONDS,
+        max_leases: int = DEFAULT_MAX_LEASES,
+    ):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_leases = max_leases
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 事务手动管理：租出任务需要BEGIN IMMEDIATE，保证多个进程不会租到同一个任务
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS tasks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                paper_id TEXT NOT NULL UNIQUE,
+                link TEXT NOT NULL,
+                tag INTEGER NOT NULL,
+                date TEXT NOT NULL,
+                paper TEXT,
+                priority INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                owner TEXT,
+                lease_expires REAL,
+                leases INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                collected INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS tasks_ready ON tasks (status, priority, id)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    def _transaction(self, fn):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                ret = fn()
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return ret
+
+    def open_intake(self, clear: bool = True) -> str:
+        """开始新一轮运行：生成新的运行编号并重新打开入口（coordinator每次启动时调用）
+
+        Args:
+            clear (bool): 是否清空队列；续跑时保留已有任务
+
+        Returns:
+            str: 本轮运行编号
+        """
+        epoch = uuid.uuid4().hex
+
+        def open_():
+            if clear:
+                self._conn.execute("DELETE FROM tasks")
+            self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('epoch', ?)", (epoch,))
+            self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('closed', '0')")
+
+        self._transaction(open_)
+        return epoch
+
+    def enqueue(self, item: Tuple[str, int, str, Optional[PaperRecord]]) -> bool:
+        """入队一个(link, tag, date, paper)任务
+
+        Returns:
+            bool: False表示该论文已在队列中
+        """
+        link, tag, date, paper = item
+        paper_json = json.dumps(paper.to_dict(), ensure_ascii=False) if paper is not None else None
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO tasks (paper_id, link, tag, date, paper, priority, status, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (get_arxiv_id(link), link, tag, date, paper_json, task_priority(item), QUEUED, time.time()),
+            )
+        return cursor.rowcount > 0
+
+    def close_intake(self) -> None:
+        """标记生产者已全部结束，队列排空后worker即可退出"""
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('closed', '1')")
+
+    def finish_run(self) -> None:
+        """标记当前这一轮运行已结束（coordinator取回全部结果后调用）"""
+        def finish():
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta SELECT 'finished', value FROM meta WHERE key = 'epoch'"
+            )
+
+        self._transaction(finish)
+
+    def finished_epoch(self) -> Optional[str]:
+        """最近一轮已结束的运行编号，从未结束过为None"""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'finished'").fetchone()
+        return row[0] if row else None
+
+    def intake_state(self) -> Tuple[Optional[str], bool]:
+        """当前一轮运行的编号（从未开始过为None），以及该轮生产者是否已结束"""
+        with self._lock:
+            meta = dict(self._conn.execute("SELECT key, value FROM meta WHERE key IN ('epoch', 'closed')").fetchall())
+        return meta.get("epoch"), meta.get("closed") == "1"
+
+    def _expire_leases(self, now: float) -> None:
+        # 调用方已持有事务
+        cursor = self._conn.execute(
+            "UPDATE tasks SET status = CASE WHEN leases >= ? THEN ? ELSE ? END, owner = NULL, lease_expires = NULL, "
+            "updated_at = ? WHERE status = ? AND lease_expires < ?",
+            (self.max_leases, FAILED, QUEUED, now, LEASED, now),
+        )
+        if cursor.rowcount:
+            RETRIES.inc(cursor.rowcount, kind="lease")
+            lark.logger.warning(f"{cursor.rowcount}个任务的租约已过期，重新入队")
+
+    def lease(self, owner: str, max_items: int = 1) -> List[Tuple[int, Tuple[str, int, str, Optional[PaperRecord]]]]:
+        """租出最多max_items个任务，按优先级和入队顺序
+
+        Args:
+            owner (str): worker标识
+
+        Returns:
+            List[Tuple[int, tuple]]: [(task_id, (link, tag, date, paper))]，队列暂时为空时返回空列表
+        """
+        def lease():
+            now = time.time()
+            self._expire_leases(now)
+            rows = self._conn.execute(
+                "SELECT id, link, tag, date, paper FROM tasks WHERE status = ? ORDER BY priority, id LIMIT ?",
+                (QUEUED, max_items),
+            ).fetchall()
+            self._conn.executemany(
+                "UPDATE tasks SET status = ?, owner = ?, lease_expires = ?, leases = leases + 1, updated_at = ? WHERE id = ?",
+                [(LEASED, owner, now + self.lease_seconds, now, row[0]) for row in rows],
+            )
+            return rows
+
+        return [
+            (task_id, (link, tag, date, PaperRecord.from_dict(json.loads(paper)) if paper else None))
+            for task_id, link, tag, date, paper in self._transaction(lease)
+        ]
+
+    def renew(self, owner: str, task_ids: List[int]) -> None:
+        """为仍在评分的任务续租"""
+        if not task_ids:
+            return
+        expires = time.time() + self.lease_seconds
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE tasks SET lease_expires = ? WHERE id = ? AND status = ? AND owner = ?",
+                [(expires, task_id, LEASED, owner) for task_id in task_ids],
+            )
+
+    def complete(self, task_id: int, owner: str, result: Optional[Dict[str, Any]]) -> None:
+        """提交评分结果，result为空表示评分失败
+
+        租约过期后任务可能已被其他worker租走，先提交的结果生效，后提交的被忽略。
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE tasks SET status = ?, result = ?, owner = NULL, lease_expires = NULL, updated_at = ? "
+                "WHERE id = ? AND status IN (?, ?)",
+                (
+                    DONE if result else FAILED,
+                    json.dumps(result, ensure_ascii=False) if result else None,
+                    time.time(),
+                    task_id,
+                    QUEUED,
+                    LEASED,
+                ),
+            )
+        if not cursor.rowcount:
+            lark.logger.warning(f"任务{task_id}已由其他worker完成，忽略{owner}提交的结果")
+
+    def collect(self, limit: int = 500) -> List[Tuple[str, Optional[Dict[str, Any]]]]:
+        """取回尚未取过的已完成任务，每个任务只会被取回一次
+
+        Returns:
+            List[Tuple[str, dict]]: [(link, result)]，评分失败的任务result为None
+        """
+        def collect():
+            rows = self._conn.execute(
+                "SELECT id, link, result FROM tasks WHERE status IN (?, ?) AND collected = 0 ORDER BY id LIMIT ?",
+                (DONE, FAILED, limit),
+            ).fetchall()
+            self._conn.executemany("UPDATE tasks SET collected = 1 WHERE id = ?", [(row[0],) for row in rows])
+            return rows
+
+        return [(link, json.loads(result) if result else None) for _, link, result in self._transaction(collect)]
+
+    def counts(self) -> Dict[str, int]:
+        """各状态的任务数"""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM tasks GROUP BY status").fetchall()
+        return dict(rows)
+
+    def drained(self, epoch: Optional[str] = None) -> bool:
+        """生产者已结束且没有排队或租出中的任务；指定epoch时还要求当前仍是这一轮运行"""
+        current, closed = self.intake_state()
+        if not closed or (epoch is not None and current != epoch):
+            return False
+        counts = self.counts()
+        return not counts.get(QUEUED) and not counts.get(LEASED)
+
+    def drained_since(self, stale_epoch: Optional[str]) -> bool:
+        """worker加入的运行已排空：当前运行不是worker启动时已结束的stale_epoch，且drained()"""
+        epoch, _ = self.intake_state()
+        return epoch is not None and epoch != stale_epoch and self.drained(epoch)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()